@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# CrimsonCore hot path benchmarks
+#
+# AWS is never contacted - every API call is answered locally by a stub responder.
+#
+# usage:
+#   python benchmarks/run_benchmarks.py            # compare against benchmarks/baseline.json
+#   python benchmarks/run_benchmarks.py --save     # record a new baseline
+#
+'''
+
+# pylint: disable=C0301,C0116,W0511,R0913
+
+import argparse
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from botocore.awsrequest import AWSResponse
+
+from crimsoncore import LambdaCore
+from crimsoncore.client_pool import ClientPool
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+ENV = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'GLOBAL_PREFIX': 'bench',
+    'APPLICATION_NAME': 'crimsoncore',
+    'NOTIFICATION_ARN': 'arn:aws:sns:us-east-1:123456789012:notifications'
+}
+
+PATH_TREE_SIZE = 500
+
+BENCHMARKS = []
+
+def benchmark(name, iterations, repeat=5):
+    '''
+    Register a benchmark.
+    The decorated function does any setup work, and returns a callable that runs one iteration.
+    If that callable returns a float, it's used as the iteration's duration (in seconds) instead of wall time.
+    '''
+
+    def register(setup):
+        BENCHMARKS.append((name, setup, iterations, repeat))
+        return setup
+
+    return register
+
+class StubResponder:
+    '''
+    Answers AWS API calls for a botocore client locally, before any request is signed or sent.
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self.service_id = client.meta.service_model.service_id.hyphenize()
+
+    def on(self, operation_name, responder):
+        def capture(params, context, **kwargs): # pylint: disable=W0613
+            # before-call only sees the serialized request, so hold on to the API parameters here
+            context['benchmark_params'] = dict(params)
+
+        def respond(context, **kwargs): # pylint: disable=W0613
+            return AWSResponse(None, 200, {}, None), responder(context['benchmark_params'])
+
+        self.client.meta.events.register(
+            f'before-parameter-build.{self.service_id}.{operation_name}',
+            capture,
+            unique_id=f'benchmark-capture-{self.service_id}-{operation_name}'
+        )
+        self.client.meta.events.register(
+            f'before-call.{self.service_id}.{operation_name}',
+            respond,
+            unique_id=f'benchmark-respond-{self.service_id}-{operation_name}'
+        )
+
+def build_core(**env):
+    core = LambdaCore('benchmark', dict(ENV, **env))
+
+    ssm = StubResponder(core.ssm)
+    ssm.on('GetParameter', lambda params: {'Parameter': {'Name': params['Name'], 'Value': 'value', 'Version': 1}})
+    ssm.on('GetParameters', lambda params: {'Parameters': [{'Name': name, 'Value': 'value', 'Version': 1} for name in params['Names']], 'InvalidParameters': []})
+    ssm.on('GetParametersByPath', get_parameters_by_path)
+
+    sns = StubResponder(core.sns)
+    sns.on('Publish', lambda params: {'MessageId': 'message'})
+    sns.on('PublishBatch', lambda params: {'Successful': [{'Id': entry['Id'], 'MessageId': 'message'} for entry in params['PublishBatchRequestEntries']], 'Failed': []})
+
+    return core
+
+def get_parameters_by_path(params):
+    start = int(params.get('NextToken', 0))
+    end = min(start + params['MaxResults'], PATH_TREE_SIZE)
+
+    response = {'Parameters': [{'Name': f'{params["Path"]}ssm/param{i}', 'Value': 'value', 'Version': 1} for i in range(start, end)]}
+    if end < PATH_TREE_SIZE:
+        response['NextToken'] = str(end)
+
+    return response
+
+@benchmark('import_crimsoncore', iterations=1)
+def bench_import():
+    script = 'import time; started = time.perf_counter(); import crimsoncore; print(time.perf_counter() - started)'
+
+    # measured from up-to-date bytecode, as deployed - the bytecode goes to a throwaway cache directory,
+    #   so the tree is never written to and stale .pyc files in it are never picked up
+    cache_dir = tempfile.mkdtemp(prefix='crimsoncore-bench-')
+    atexit.register(shutil.rmtree, cache_dir, ignore_errors=True)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), PYTHONPYCACHEPREFIX=cache_dir)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    def run():
+        # timed in a fresh interpreter, so that we see the real (uncached) import cost
+        result = subprocess.run([sys.executable, '-c', script], check=True, stdout=subprocess.PIPE, env=env)
+        return float(result.stdout)
+
+    # one untimed import fills the cache directory
+    run()
+
+    return run
+
+@benchmark('lambda_core_construction', iterations=1000)
+def bench_construction():
+    return lambda: LambdaCore('benchmark', ENV)
+
+@benchmark('init_client_cold', iterations=5)
+def bench_init_client_cold():
+    core = LambdaCore('benchmark', ENV)
+
+    def run():
+        core.client_pool = ClientPool()
+        core.init_ssm()
+
+    return run
+
+@benchmark('init_client_pooled', iterations=1000)
+def bench_init_client_pooled():
+    core = LambdaCore('benchmark', ENV)
+    core.init_ssm()
+
+    return core.init_ssm
+
+@benchmark('get_ssm_parameter_uncached', iterations=500)
+def bench_get_ssm_parameter_uncached():
+    core = build_core()
+
+    return lambda: core.get_ssm_parameter('param', use_cache=False)
+
+@benchmark('get_ssm_parameter_cached', iterations=10000)
+def bench_get_ssm_parameter_cached():
+    core = build_core(SSM_CACHE_TTL='300')
+    core.get_ssm_parameter('param')
+
+    return lambda: core.get_ssm_parameter('param')
+
+@benchmark('get_ssm_parameters_25_uncached', iterations=100)
+def bench_get_ssm_parameters():
+    core = build_core()
+    names = [f'param{i}' for i in range(25)]
+
+    return lambda: core.get_ssm_parameters(names, use_cache=False)
+
+@benchmark(f'get_ssm_parameters_by_path_{PATH_TREE_SIZE}', iterations=5)
+def bench_get_ssm_parameters_by_path():
+    core = build_core()
+
+    return lambda: core.get_ssm_parameters_by_path(recursive=True)
+
+@benchmark(f'get_ssm_parameters_by_path_{PATH_TREE_SIZE}_prefetch', iterations=5)
+def bench_get_ssm_parameters_by_path_prefetch():
+    core = build_core()
+
+    return lambda: core.get_ssm_parameters_by_path(recursive=True, prefetch=True)
+
+@benchmark('send_notification_sync', iterations=500)
+def bench_send_notification():
+    core = build_core()
+
+    return lambda: core.send_notification('info', 'benchmark')
+
+@benchmark('send_notification_async_50', iterations=20)
+def bench_send_notification_async():
+    core = build_core(NOTIFICATIONS_ASYNC='on')
+
+    def run():
+        for _ in range(50):
+            core.send_notification('info', 'benchmark')
+        core.flush_notifications()
+
+    return run
+
+@benchmark('send_notifications_batched_50', iterations=20)
+def bench_send_notifications():
+    core = build_core()
+    notifications = [('info', 'benchmark')] * 50
+
+    return lambda: core.send_notifications(notifications)
+
+def run_benchmarks(selected=None):
+    '''
+    Run the registered benchmarks, returning the best seconds-per-iteration for each.
+    '''
+
+    results = {}
+    for name, setup, iterations, repeat in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+
+        run = setup()
+        run() # warm-up
+
+        timings = []
+        for _ in range(repeat):
+            elapsed = 0
+            for _ in range(iterations):
+                started = time.perf_counter()
+                measured = run()
+                elapsed += measured if isinstance(measured, float) else time.perf_counter() - started
+            timings.append(elapsed / iterations)
+
+        results[name] = min(timings)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the CrimsonCore hot path benchmarks.')
+    parser.add_argument('--save', action='store_true', help='record the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file to compare against (or save to)')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown relative to the baseline before failing (0.5 = 50%%)')
+    parser.add_argument('benchmarks', nargs='*', help='only run the named benchmarks')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.benchmarks)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = []
+    for name, seconds in results.items():
+        previous = baseline.get(name)
+        change = f'{(seconds / previous - 1) * 100:+.1f}%' if previous else 'new'
+        print(f'{name:<45} {seconds * 1000000:>12.1f} us/op   {change}')
+
+        if previous and seconds > previous * (1 + args.tolerance):
+            regressions.append(name)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f'baseline saved to {args.baseline}')
+        return 0
+
+    if regressions:
+        print(f'regressions beyond {args.tolerance * 100:.0f}%: {", ".join(regressions)}')
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,13 @@
 #!/usr/bin/env python
 # pylint: disable=C0114
 
-from .lambda_config import LambdaConfig
+from .lambda_config import FrozenLambdaConfig, LambdaConfig
 from .lambda_core import LambdaCore
+
+def __getattr__(name):
+    # AsyncLambdaCore pulls in asyncio, so it's only imported when actually used
+    if name == 'AsyncLambdaCore':
+        from .async_lambda_core import AsyncLambdaCore # pylint: disable=C0415
+        return AsyncLambdaCore
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
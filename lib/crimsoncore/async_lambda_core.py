@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# asyncio Lambda shared functions module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from crimsoncore.lambda_core import LambdaCore
+
+class AsyncLambdaCore:
+    '''
+    asyncio front-end for LambdaCore.
+    This is not a native asyncio client - crimsoncore only depends on boto3, which has no asyncio transport
+      (that would take aiobotocore or aiohttp), so calls are made with the wrapped LambdaCore's own (pooled, instrumented)
+      botocore clients and helpers, run on a thread pool of ASYNC_MAX_CONCURRENCY (4, by default) workers
+      so that they don't block the event loop.
+    Each worker is a thread, so ASYNC_MAX_CONCURRENCY should stay small on small Lambdas.
+    Everything is shared with the wrapped LambdaCore - configuration, FIPS-aware endpoints, parameter cache
+      (including single-flight loads and stale-while-revalidate), rate limiter and metrics.
+    At most ASYNC_MAX_CONCURRENCY calls are in flight at once; the rest wait for a free worker.
+    '''
+
+    def __init__(self, name=None, env=None, core=None):
+        if core is None and name is None:
+            raise ValueError('Either a script name or a LambdaCore instance must be specified')
+
+        self.core = core if core is not None else LambdaCore(name, env)
+
+        self.max_concurrency = self.core.config.get_int('ASYNC_MAX_CONCURRENCY', 4, minimum=1)
+        self._executor = None
+
+    @property
+    def config(self):
+        '''
+        Get the wrapped LambdaCore's configuration.
+        '''
+
+        return self.core.config
+
+    @property
+    def logger(self):
+        '''
+        Get the wrapped LambdaCore's logger.
+        '''
+
+        return self.core.logger
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def run(self, func, *args, **kwargs):
+        '''
+        Run a blocking function (e.g. one of the wrapped LambdaCore's helpers) on the thread pool, within the concurrency limit.
+        e.g. await run(core.s3_bulk.delete_prefix, 'bucket', 'prefix/')
+        '''
+
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    async def client(self, service):
+        '''
+        Get the wrapped LambdaCore's botocore client for one of the LambdaCore.services, initializing it if necessary.
+        Clients are initialized on the thread pool, as creating one takes long enough to stall the event loop.
+        '''
+
+        if service not in LambdaCore.services:
+            raise ValueError(f'Unknown service specified; expected values [{str(tuple(LambdaCore.services))[1:-1]}]')
+
+        client = await self.run(getattr, self.core, 'awslambda' if service == 'lambda' else service)
+
+        # ec2 is a boto3 resource - its underlying client is thread-safe, unlike the resource itself
+        return client.meta.client if service == 'ec2' else client
+
+    async def call(self, service, operation, **kwargs):
+        '''
+        Call any AWS API operation, within the concurrency limit.
+        service is one of the LambdaCore.services names;
+          operation is the client method name, e.g. call('ssm', 'describe_parameters', MaxResults=50).
+        '''
+
+        client = await self.client(service)
+
+        return await self.run(getattr(client, operation), **kwargs)
+
+    async def gather(self, *coroutines):
+        '''
+        Run several coroutines concurrently, returning their results in order.
+        Convenience wrapper around asyncio.gather.
+        '''
+
+        return await asyncio.gather(*coroutines)
+
+    async def get_ssm_parameter(self, name, **kwargs):
+        '''
+        Get an AWS Systems Manager system parameter.
+        Takes the same arguments as LambdaCore.get_ssm_parameter, and shares its parameter cache.
+        '''
+
+        return await self.run(self.core.get_ssm_parameter, name, **kwargs)
+
+    async def get_ssm_parameters(self, names, **kwargs):
+        '''
+        Get multiple AWS Systems Manager system parameters at once.
+        Takes the same arguments as LambdaCore.get_ssm_parameters, and shares its parameter cache.
+
+        Returns a tuple of (dict of name -> value, list of names reported as invalid by SSM).
+        '''
+
+        return await self.run(self.core.get_ssm_parameters, names, **kwargs)
+
+    async def get_ssm_parameters_by_path(self, subpath=None, **kwargs):
+        '''
+        Get multiple AWS Systems Manager system parameters under a specific path.
+        Takes the same arguments as LambdaCore.get_ssm_parameters_by_path.
+        '''
+
+        return await self.run(self.core.get_ssm_parameters_by_path, subpath, **kwargs)
+
+    async def send_notification(self, notification_type, message):
+        '''
+        Send an SNS notification to the notification Lambda for chain-dispatch
+          to whatever notification service it's configured for.
+        '''
+
+        await self.run(self.core.send_notification, notification_type, message)
+
+    async def send_notifications(self, notifications):
+        '''
+        Send several SNS notifications at once, grouped into PublishBatch calls.
+        Takes the same arguments as LambdaCore.send_notifications.
+
+        Returns a list of per-notification results, in the same order as the notifications given.
+        '''
+
+        return await self.run(self.core.send_notifications, list(notifications))
+
+    async def close(self):
+        '''
+        Shut down the thread pool, waiting for any calls still running on it.
+        Should be awaited once at the end of the invocation.
+        '''
+
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    def _get_executor(self):
+        '''
+        Get the thread pool calls are run on, creating it if necessary.
+        (it's shut down by close(), and recreated if the instance is used again afterwards)
+        '''
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='crimsoncore-async')
+
+        return self._executor
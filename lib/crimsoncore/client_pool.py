@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# AWS client pool module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+import threading
+import time
+
+def _freeze(value):
+    '''
+    Convert a (possibly nested) dict of botocore Config options into something hashable.
+    '''
+
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+
+    return value
+
+class ClientPool:
+    '''
+    Process-wide registry of boto3 clients and resources.
+    Building a client means loading and parsing botocore's service model, so each distinct
+      (service, region, endpoint_url, config) combination is built once and then shared.
+    Resources are not thread-safe, so each thread gets its own - all wrapping the one shared client.
+    '''
+
+    def __init__(self):
+        self._clients = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self._sessions = threading.local()
+        self._resources = threading.local()
+        self._generation = 0
+
+        self.build_times = {}
+
+    def client(self, service, region_name=None, endpoint_url=None, config=None):
+        '''
+        Get a shared boto3 client.
+        config is a dict of botocore.client.Config options.
+        '''
+
+        return self._get('client', service, region_name, endpoint_url, config)
+
+    def resource(self, service, region_name=None, endpoint_url=None, config=None):
+        '''
+        Get a boto3 resource for the current thread.
+        config is a dict of botocore.client.Config options.
+        '''
+
+        key = (service, region_name, endpoint_url, _freeze(config or {}))
+
+        # resources from before a clear() are dropped lazily, as other threads' locals can't be reached from here
+        if getattr(self._resources, 'generation', None) != self._generation:
+            self._resources.generation = self._generation
+            self._resources.resources = {}
+
+        resource = self._resources.resources.get(key)
+        if resource is None:
+            # only the first resource is built from scratch - the rest are cheap wrappers around its (thread-safe) client
+            shared = self._get('resource', service, region_name, endpoint_url, config)
+            resource = type(shared)(client=shared.meta.client)
+            self._resources.resources[key] = resource
+
+        return resource
+
+    def credentials(self):
+        '''
+        Get the AWS credentials clients are built with (from the usual boto3 credential chain).
+        '''
+
+        return self._session().get_credentials()
+
+    def stats(self):
+        '''
+        Get how long each pooled client took to build.
+        '''
+
+        with self._lock:
+            return [
+                {
+                    'kind': key[0],
+                    'service': key[1],
+                    'region_name': key[2],
+                    'endpoint_url': key[3],
+                    'build_time': build_time
+                } for key, build_time in self.build_times.items()
+            ]
+
+    def clear(self):
+        '''
+        Drop all pooled clients.
+        '''
+
+        with self._lock:
+            self._clients.clear()
+            self._build_locks.clear()
+            self.build_times.clear()
+            self._generation += 1
+
+    def _get(self, kind, service, region_name, endpoint_url, config):
+        '''
+        Get a pooled client or resource, building it if necessary.
+        '''
+
+        key = (kind, service, region_name, endpoint_url, _freeze(config or {}))
+
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # only one thread builds any given client, but distinct clients may be built in parallel
+        with build_lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+
+            # boto3 (and botocore) are imported here rather than at module load,
+            #   so that importing crimsoncore stays cheap for Lambdas that never build a client
+            from botocore.client import Config # pylint: disable=C0415
+
+            started = time.perf_counter()
+            factory = self._session().client if kind == 'client' else self._session().resource
+            client = factory(
+                service,
+                region_name=region_name,
+                endpoint_url=endpoint_url,
+                config=Config(**config) if config else None
+            )
+            build_time = time.perf_counter() - started
+
+            with self._lock:
+                self._clients[key] = client
+                self.build_times[key] = build_time
+
+        return client
+
+    def _session(self):
+        '''
+        Get the boto3 session for the current thread.
+        (boto3 sessions are not safe to build clients from concurrently, but the resulting clients are thread-safe)
+        '''
+
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            import boto3.session # pylint: disable=C0415
+
+            session = boto3.session.Session()
+            self._sessions.session = session
+
+        return session
+
+# shared across all LambdaCore instances (and warm invocations) within the process
+CLIENT_POOL = ClientPool()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# Pre-baked configuration bundle module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+import json
+import mmap
+import os
+import time
+
+# first line of every bundle file, followed by the format version
+BUNDLE_MAGIC = b'CRIMSONCORE-CONFIG-BUNDLE'
+BUNDLE_FORMAT_VERSION = 1
+
+def write_bundle(path, parameters, ttl=None, clock=None):
+    '''
+    Write a configuration bundle file.
+    parameters is a dict of full SSM parameter name -> {'value', 'version', 'encrypted'}.
+    If ttl is given, the bundle's parameters are only trusted for that many seconds after it was written.
+    The file is replaced atomically, so that a concurrent reader never sees a partial bundle.
+    '''
+
+    clock = clock if clock is not None else time.time
+    created_at = clock()
+
+    body = json.dumps({
+        'created_at': created_at,
+        'expires_at': created_at + ttl if ttl else None,
+        'parameters': parameters
+    }, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_MAGIC + f' {BUNDLE_FORMAT_VERSION}\n'.encode('utf-8'))
+        bundle_file.write(body)
+
+    os.replace(temp_path, path)
+
+def read_bundle(path, clock=None):
+    '''
+    Read a configuration bundle file in one step, by memory-mapping it.
+    Raises FileNotFoundError if there is no bundle, and ValueError if it isn't a bundle we can read.
+
+    Returns the bundle dict (created_at, expires_at, parameters), with an extra "expired" flag.
+    '''
+
+    clock = clock if clock is not None else time.time
+
+    with open(path, 'rb') as bundle_file:
+        if os.fstat(bundle_file.fileno()).st_size == 0:
+            raise ValueError(f'Configuration bundle {path} is empty')
+
+        with mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ) as bundle_map:
+            header_end = bundle_map.find(b'\n')
+            header = bundle_map[:header_end].split(b' ') if header_end > 0 else []
+            if len(header) != 2 or header[0] != BUNDLE_MAGIC:
+                raise ValueError(f'{path} is not a configuration bundle')
+
+            if header[1] != str(BUNDLE_FORMAT_VERSION).encode('utf-8'):
+                raise ValueError(f'Configuration bundle {path} has unsupported format version {header[1].decode("utf-8", errors="replace")}')
+
+            bundle = json.loads(bundle_map[header_end + 1:])
+
+    bundle['expired'] = bundle.get('expires_at') is not None and bundle['expires_at'] <= clock()
+
+    return bundle
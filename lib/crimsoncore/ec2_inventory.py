@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# EC2 inventory module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from concurrent.futures import ThreadPoolExecutor
+
+# resource type -> (describe operation, response key holding the resources, id list parameter, largest page size, default request parameters)
+RESOURCE_TYPES = {
+    'instances': ('describe_instances', 'Reservations', 'InstanceIds', 1000, {}),
+    'volumes': ('describe_volumes', 'Volumes', 'VolumeIds', 500, {}),
+    'snapshots': ('describe_snapshots', 'Snapshots', 'SnapshotIds', 1000, {'OwnerIds': ['self']}),
+    'images': ('describe_images', 'Images', 'ImageIds', 1000, {'Owners': ['self']})
+}
+
+# attributes kept in each record if none are asked for; dotted names reach into nested dicts
+DEFAULT_ATTRIBUTES = {
+    'instances': ('InstanceId', 'InstanceType', 'State.Name', 'LaunchTime', 'ImageId', 'Tags'),
+    'volumes': ('VolumeId', 'Size', 'VolumeType', 'State', 'CreateTime', 'SnapshotId', 'Tags'),
+    'snapshots': ('SnapshotId', 'VolumeId', 'VolumeSize', 'State', 'StartTime', 'Description', 'Tags'),
+    'images': ('ImageId', 'Name', 'State', 'CreationDate', 'Tags')
+}
+
+class Ec2Inventory:
+    '''
+    EC2 inventory for a LambdaCore, using its EC2 client.
+    Reached through LambdaCore.ec2_inventory.
+    '''
+
+    def __init__(self, core):
+        self.core = core
+
+    def iter_resources(self, resource_type, filters=None, attributes=None, **kwargs):
+        '''
+        Page through one type of EC2 resource ("instances", "volumes", "snapshots" or "images") using the low-level client,
+          with filters (a dict of filter name -> value(s), or an EC2 Filters list) applied server-side.
+        Snapshots and images are limited to those owned by this account.
+        Yields compact records holding only the given attributes (dotted names reach into nested values; tags are flattened into a dict).
+        '''
+
+        return iter_resources(self.core.ec2.meta.client, resource_type, filters=filters, attributes=attributes, **kwargs)
+
+    def get_inventory(self, resource_types=None, filters=None, attributes=None):
+        '''
+        Fetch several types of EC2 resource concurrently (all of them if no resource types are specified).
+        filters and attributes are dicts keyed by resource type - see iter_resources.
+
+        Returns a dict of resource type -> list of records.
+        '''
+
+        with self.core.metrics.timer('ec2.inventory'):
+            return describe_inventory(self.core.ec2.meta.client, resource_types=resource_types, filters=filters, attributes=attributes)
+
+def build_filters(filters):
+    '''
+    Build an EC2 Filters list from a dict of filter name -> value (or list of values).
+    Lists are passed through untouched.
+    '''
+
+    if filters is None:
+        return []
+
+    if isinstance(filters, list):
+        return filters
+
+    return [
+        {'Name': name, 'Values': [_filter_value(value) for value in values] if isinstance(values, (list, tuple, set)) else [_filter_value(values)]}
+        for name, values in filters.items()
+    ]
+
+def _filter_value(value):
+    '''
+    Convert a filter value to the string EC2 expects (booleans are matched as "true" / "false").
+    '''
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    return str(value)
+
+def build_record(resource, attributes):
+    '''
+    Build a compact record holding only the given attributes of a described resource.
+    Tags are flattened into a dict of key -> value; missing attributes are None.
+    '''
+
+    record = {}
+    for attribute in attributes:
+        value = resource
+        for part in attribute.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+
+        if attribute == 'Tags':
+            value = {tag['Key']: tag['Value'] for tag in value or []}
+
+        record[attribute] = value
+
+    return record
+
+def iter_resources(client, resource_type, filters=None, attributes=None, **kwargs):
+    '''
+    Page through one type of EC2 resource ("instances", "volumes", "snapshots" or "images"),
+      with the filters applied server-side.
+    Snapshots and images are limited to those owned by this account unless OwnerIds / Owners say otherwise.
+    Yields compact records (see build_record), or the raw resource dicts if attributes is False.
+    Extra keyword arguments are passed on to the describe call.
+    '''
+
+    if resource_type not in RESOURCE_TYPES:
+        raise ValueError(f'Unknown EC2 resource type specified; expected values [{str(tuple(RESOURCE_TYPES))[1:-1]}]')
+
+    if attributes is None:
+        attributes = DEFAULT_ATTRIBUTES[resource_type]
+
+    for resource in _iter_described(client, resource_type, _build_request(resource_type, filters, kwargs)):
+        yield resource if attributes is False else build_record(resource, attributes)
+
+def _build_request(resource_type, filters, kwargs):
+    '''
+    Build the describe call parameters (including pagination) for one type of EC2 resource.
+    '''
+
+    _, _, id_param, page_size, defaults = RESOURCE_TYPES[resource_type]
+
+    request = dict(defaults, **kwargs)
+    filter_list = build_filters(filters)
+    if filter_list:
+        request['Filters'] = filter_list
+
+    # page size can't be combined with an explicit list of ids
+    if id_param not in request:
+        request['PaginationConfig'] = {'PageSize': page_size}
+
+    return request
+
+def _iter_described(client, resource_type, request):
+    '''
+    Page through a describe call, yielding the resources from every page (instances are unwrapped from their reservations).
+    '''
+
+    operation, result_key, _, _, _ = RESOURCE_TYPES[resource_type]
+
+    for page in client.get_paginator(operation).paginate(**request):
+        resources = page.get(result_key, [])
+        if resource_type == 'instances':
+            resources = [instance for reservation in resources for instance in reservation.get('Instances', [])]
+
+        yield from resources
+
+def describe_inventory(client, resource_types=None, filters=None, attributes=None):
+    '''
+    Fetch several types of EC2 resource concurrently (all of them if no resource types are specified).
+    filters and attributes are dicts keyed by resource type; types missing from them are unfiltered / use the default attributes.
+
+    Returns a dict of resource type -> list of records.
+    '''
+
+    resource_types = list(RESOURCE_TYPES) if resource_types is None else list(resource_types)
+    filters = filters or {}
+    attributes = attributes or {}
+
+    unknown = [resource_type for resource_type in resource_types if resource_type not in RESOURCE_TYPES]
+    if unknown:
+        raise ValueError(f'Unknown EC2 resource type specified; expected values [{str(tuple(RESOURCE_TYPES))[1:-1]}]')
+
+    if not resource_types:
+        return {}
+
+    def fetch(resource_type):
+        return list(iter_resources(client, resource_type, filters=filters.get(resource_type), attributes=attributes.get(resource_type)))
+
+    with ThreadPoolExecutor(max_workers=len(resource_types), thread_name_prefix='crimsoncore-ec2-inventory') as executor:
+        return dict(zip(resource_types, executor.map(fetch, resource_types)))
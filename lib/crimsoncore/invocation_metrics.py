@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# Per-invocation timing instrumentation module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+class InvocationMetrics:
+    '''
+    Thread-safe aggregation of timings and counters for a single Lambda invocation.
+    Every AWS API call made through an instrumented client is timed automatically;
+      the results can be emitted as a single CloudWatch Embedded Metric Format (EMF) line and then reset.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        '''
+        Time the wrapped block of code.
+        '''
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        '''
+        Record a single timing.
+        '''
+
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def count(self, name, amount=1):
+        '''
+        Increment a counter.
+        '''
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def summary(self):
+        '''
+        Get the aggregated timings (in milliseconds) and counters.
+        '''
+
+        with self._lock:
+            return {
+                'timers': {
+                    name: {'count': count, 'total_ms': total * 1000, 'max_ms': longest * 1000} for name, (count, total, longest) in self._timers.items()
+                },
+                'counters': dict(self._counters)
+            }
+
+    def reset(self):
+        '''
+        Drop everything recorded so far.
+        '''
+
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    def to_emf(self, namespace, dimensions, timestamp=None):
+        '''
+        Render the aggregated metrics as a CloudWatch Embedded Metric Format JSON document.
+        '''
+
+        summary = self.summary()
+
+        document = dict(dimensions)
+        metrics = []
+        for name, timer in summary['timers'].items():
+            document[f'{name}.time'] = timer['total_ms']
+            document[f'{name}.count'] = timer['count']
+            metrics.append({'Name': f'{name}.time', 'Unit': 'Milliseconds'})
+            metrics.append({'Name': f'{name}.count', 'Unit': 'Count'})
+
+        for name, value in summary['counters'].items():
+            document[name] = value
+            metrics.append({'Name': name, 'Unit': 'Count'})
+
+        document['_aws'] = {
+            'Timestamp': int((timestamp if timestamp is not None else time.time()) * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)],
+                'Metrics': metrics
+            }]
+        }
+
+        return json.dumps(document)
+
+    def instrument(self, client):
+        '''
+        Time every API call made through the given botocore client (and count any retries botocore made).
+        Safe to call repeatedly for the same client.
+        '''
+
+        events = client.meta.events
+
+        # registered first so that we see calls that are answered early by other before-call handlers (e.g. botocore's Stubber)
+        events.register_first('before-call.*.*', self._before_call, unique_id='crimsoncore-metrics-before-call')
+        events.register('after-call.*.*', self._after_call, unique_id='crimsoncore-metrics-after-call')
+        events.register('after-call-error.*.*', self._after_call_error, unique_id='crimsoncore-metrics-after-call-error')
+
+    def _before_call(self, model, context, **kwargs): # pylint: disable=W0613
+        '''
+        botocore before-call event handler.
+        '''
+
+        context['crimsoncore_call'] = (f'{model.service_model.service_name}.{model.name}', time.perf_counter())
+
+    def _after_call(self, context, http_response=None, parsed=None, **kwargs): # pylint: disable=W0613
+        '''
+        botocore after-call event handler.
+        '''
+
+        name = self._finish_call(context)
+        if name is None:
+            return
+
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0) if isinstance(parsed, dict) else 0
+        if retries:
+            self.count(f'{name}.retries', retries)
+
+        if http_response is not None and http_response.status_code >= 300:
+            self.count(f'{name}.errors')
+
+    def _after_call_error(self, context, **kwargs): # pylint: disable=W0613
+        '''
+        botocore after-call-error event handler (raised for failures that never got an HTTP response).
+        '''
+
+        name = self._finish_call(context)
+        if name is not None:
+            self.count(f'{name}.errors')
+
+    def _finish_call(self, context):
+        '''
+        Record the timing for a call started in _before_call, returning its metric name.
+        '''
+
+        call = context.pop('crimsoncore_call', None)
+        if call is None:
+            return None
+
+        name, started = call
+        self.record(name, time.perf_counter() - started)
+
+        return name
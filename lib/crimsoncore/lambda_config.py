@@ -11,37 +11,295 @@
 
 # pylint: disable=C0301,W0511,R0902,R0913
 
+import itertools
 import logging
 import re
 
-class LambdaConfig:
+# maximum number of fully-built names remembered by the name builders
+NAME_MEMO_MAX_ENTRIES = 1024
+
+BOOLEAN_VALUES = ('on', 'off', 'true', 'false', 'yes', 'no')
+
+# stand-in default_override for telling unset values apart from set ones
+_UNSET = object()
+
+# values used for settings that aren't specified anywhere else (and have no default_override)
+CONFIG_DEFAULTS = {
+    'APPLICATION_NAME': '',
+    'AWS_LAMBDA_LOG_GROUP_NAME': '',
+    'AWS_LAMBDA_LOG_STREAM_NAME': '',
+    'DEBUG_MODE': 'off',
+    'ENVIRONMENT': '',
+    'GLOBAL_PREFIX': '',
+    'SAFE_MODE': 'off',
+    'STACK_NAME': ''
+}
+
+# settings that only accept a fixed set of values
+CONFIG_VALIDATIONS = {
+    'DEBUG_MODE': BOOLEAN_VALUES,
+    'NOTIFICATIONS_ENABLED': BOOLEAN_VALUES,
+    'NOTIFICATIONS_ASYNC': BOOLEAN_VALUES,
+    'NOTIFICATIONS_BATCH': BOOLEAN_VALUES,
+    'FIPS_MODE': BOOLEAN_VALUES,
+    'SAFE_MODE': BOOLEAN_VALUES,
+    'AWS_RETRY_MODE': ('', 'legacy', 'standard', 'adaptive'),
+    'AWS_TCP_KEEPALIVE': BOOLEAN_VALUES,
+    'LOG_FORMAT': ('text', 'json')
+}
+
+class BaseLambdaConfig:
+    '''
+    Lookup, validation and name building shared by LambdaConfig and FrozenLambdaConfig.
+    Subclasses provide val().
+    '''
+
+    __slots__ = ('_validations', '_number_cache', '_name_prefixes', '_name_memo')
+
+    def __init__(self, validations):
+        self._validations = validations
+        self._number_cache = {}
+
+        self._name_prefixes = None
+        self._name_memo = {}
+
+    def val(self, name, to_lower=False, bool_coerce=False, default_override=None):
+        '''
+        Get a particular configuration value (and validate it if necessary).
+        '''
+
+        raise NotImplementedError()
+
+    def _validate_val(self, name, value):
+        '''
+        Validate a particular value.
+        '''
+
+        if name in self._validations:
+            validations = self._validations.get(name)
+            if value not in validations:
+                raise ValueError(f'Unknown {name} value specified; expected values [{str(validations)[1:-1]}]')
+
+    def _coerce_val(self, name, value, to_lower, bool_coerce):
+        '''
+        Normalize and validate a raw configuration value.
+        '''
+
+        if to_lower or bool_coerce:
+            value = value.lower()
+
+        if name in self._validations:
+            self._validate_val(name, value)
+
+        if bool_coerce:
+            value = bool(value in ('on', 'true', 'yes'))
+
+        return value
+
+    def get_int(self, name, default, minimum=None):
+        '''
+        Get a particular configuration value as an integer (and validate it against minimum, if given).
+        '''
+
+        return self._get_number(name, int, 'an integer', default, minimum)
+
+    def get_float(self, name, default, minimum=None):
+        '''
+        Get a particular configuration value as a float (and validate it against minimum, if given).
+        '''
+
+        return self._get_number(name, float, 'a number', default, minimum)
+
+    def is_set(self, *names):
+        '''
+        Check to see if any of the given configuration values is specified anywhere
+          (rather than left to fall back to its default).
+        '''
+
+        return any(self.val(name, default_override=_UNSET) is not _UNSET for name in names)
+
+    def _get_number(self, name, convert, expected, default, minimum):
+        '''
+        Convert and validate a numeric configuration value, remembering the result.
+        '''
+
+        key = (name, convert, default, minimum)
+        value = self._number_cache.get(key)
+        if value is None:
+            raw = self.val(name, default_override=_UNSET)
+
+            # unset values (most of them, for every LambdaCore constructed) skip the round trip through str()
+            try:
+                value = convert(default if raw is _UNSET else raw)
+            except ValueError:
+                raise ValueError(f'Invalid {name} value specified; expected {expected}') from None
+
+            if minimum is not None and value < minimum:
+                raise ValueError(f'Invalid {name} value specified; expected a value >= {minimum}')
+
+            # concurrent callers may race to fill this in, but they'll all store the same value
+            self._number_cache[key] = value
+
+        return value
+
+    def get_client_options(self, service):
+        '''
+        Get the botocore.client.Config options for a particular AWS service's client, as a dict.
+
+        Each AWS_* client setting (AWS_MAX_POOL_CONNECTIONS, AWS_TCP_KEEPALIVE, AWS_CONNECT_TIMEOUT, AWS_READ_TIMEOUT,
+          AWS_RETRY_MODE, AWS_MAX_ATTEMPTS) may be overridden per service by swapping the AWS_ prefix for the service name,
+          e.g. S3_MAX_POOL_CONNECTIONS or EC2_READ_TIMEOUT.
+        '''
+
+        prefix = service.upper()
+        options = {}
+
+        max_pool_connections = self.get_int(f'{prefix}_MAX_POOL_CONNECTIONS', self.get_int('AWS_MAX_POOL_CONNECTIONS', 0, minimum=0), minimum=0)
+        if max_pool_connections > 0:
+            options['max_pool_connections'] = max_pool_connections
+
+        tcp_keepalive = self.val(f'{prefix}_TCP_KEEPALIVE', to_lower=True, default_override=self.val('AWS_TCP_KEEPALIVE', to_lower=True, default_override='off'))
+        self._validate_val('AWS_TCP_KEEPALIVE', tcp_keepalive)
+        if tcp_keepalive in ('on', 'true', 'yes'):
+            options['tcp_keepalive'] = True
+
+        connect_timeout = self.get_float(f'{prefix}_CONNECT_TIMEOUT', self.get_float('AWS_CONNECT_TIMEOUT', 0, minimum=0), minimum=0)
+        if connect_timeout > 0:
+            options['connect_timeout'] = connect_timeout
+
+        read_timeout = self.get_float(f'{prefix}_READ_TIMEOUT', self.get_float('AWS_READ_TIMEOUT', 0, minimum=0), minimum=0)
+        if read_timeout > 0:
+            options['read_timeout'] = read_timeout
+
+        retries = {}
+        retry_mode = self.val(f'{prefix}_RETRY_MODE', to_lower=True, default_override=self.val('AWS_RETRY_MODE', to_lower=True, default_override=''))
+        self._validate_val('AWS_RETRY_MODE', retry_mode)
+        if retry_mode:
+            retries['mode'] = retry_mode
+
+        max_attempts = self.get_int(f'{prefix}_MAX_ATTEMPTS', self.get_int('AWS_MAX_ATTEMPTS', 0, minimum=0), minimum=0)
+        if max_attempts > 0:
+            retries['total_max_attempts'] = max_attempts
+
+        if retries:
+            options['retries'] = retries
+
+        return options
+
+    def build_legacy_ssm_param_name(self, name, include_global_prefix=False, include_application_name=False, include_environment=False, include_stack_name=False):
+        '''
+        Build the correct name for an SSM parameter.
+        Legacy behavior for AWS accounts that are not compliant with AWS SSM Parameter Hierarchy Standards.
+        '''
+
+        return self._build_name('legacy_ssm', (bool(include_global_prefix), bool(include_application_name), bool(include_environment), bool(include_stack_name)), name)
+
+    def build_ssm_param_name(self, name=None, include_global_prefix=False, include_application_name=False, include_environment=False, include_stack_name=False):
+        '''
+        Build the correct name for an SSM parameter.
+        (ssm_param_names returned should alwyas contain always leading slash)
+
+        Rough structure for resulting SSM parameter names is as follows (assuming the appropriate include vars are set to True):
+        /{prefix}/{appname}/{environment}/{stack_name}/ssm/{parameter_name}
+
+        example:
+        { # environment
+            'GLOBAL_PREFIX'='codebite',
+            'APPLICATION_NAME'='notifications',
+            'ENVIRONMENT'='prod',
+            'STACK_NAME'='primary',
+        }
+        { # args
+            name='webhook_url',
+            include_global_prefix=True,
+            include_application_name=True,
+            include_environment=True,
+            include_stack_name=True
+        }
+
+        result:
+        /codebite/notifications/prod/primary/ssm/webhook_url
+        '''
+
+        flags = (bool(include_global_prefix), bool(include_application_name), bool(include_environment), bool(include_stack_name))
+
+        # note: name is conditional and not included here if None in order to support get_parameters_by_path ssm parameter name structures
+        if name is None:
+            return self._get_name_prefixes()[('ssm_path', flags)]
+
+        return self._build_name('ssm', flags, name)
+
+    def build_bucket_name(self, name, include_global_prefix=True, include_application_name=True, include_environment=False):
+        '''
+        Build the correct name for an S3 bucket.
+        '''
+
+        return self._build_name('bucket', (bool(include_global_prefix), bool(include_application_name), bool(include_environment)), name)
+
+    def _get_name_prefixes(self):
+        '''
+        Get the precomputed name prefixes used by the name builders.
+        '''
+
+        if self._name_prefixes is None:
+            self._name_prefixes = self._build_name_prefixes()
+
+        return self._name_prefixes
+
+    def _build_name_prefixes(self):
+        '''
+        Precompute the name prefixes for every combination of include_* flags accepted by the name builders.
+        '''
+
+        segments = tuple(self.val(name, to_lower=True) for name in ('GLOBAL_PREFIX', 'APPLICATION_NAME', 'ENVIRONMENT', 'STACK_NAME'))
+
+        prefixes = {}
+        for flags in itertools.product((False, True), repeat=4):
+            chunks = [segment for include, segment in zip(flags, segments) if include and len(segment) > 0]
+
+            prefixes[('legacy_ssm', flags)] = '-'.join(chunks + ['ssm', ''])
+            prefixes[('ssm', flags)] = '/'.join([''] + chunks + ['ssm', ''])
+            prefixes[('ssm_path', flags)] = '/'.join([''] + chunks + [''])
+
+            # bucket names never include the stack name
+            if not flags[3]:
+                prefixes[('bucket', flags[:3])] = '-'.join(chunks + [''])
+
+        return prefixes
+
+    def _build_name(self, kind, flags, name):
+        '''
+        Build (or recall) a full name from its precomputed prefix.
+        '''
+
+        key = (kind, flags, name)
+        full_name = self._name_memo.get(key)
+        if full_name is None:
+            full_name = self._get_name_prefixes()[(kind, flags)] + name
+
+            # callers with an unbounded set of names (e.g. per-request keys) would otherwise grow this forever;
+            #   starting over just costs one string concatenation per name
+            if len(self._name_memo) >= NAME_MEMO_MAX_ENTRIES:
+                self._name_memo.clear()
+
+            self._name_memo[key] = full_name
+
+        return full_name
+
+class LambdaConfig(BaseLambdaConfig):
     ''' Lambda shared configuration '''
 
     def __init__(self, name, env, overrides=None, lambda_overrides=None):
+        super().__init__(CONFIG_VALIDATIONS)
+
         self._script_name = name
 
-        self._defaults = {
-            'APPLICATION_NAME': '',
-            'AWS_LAMBDA_LOG_GROUP_NAME': '',
-            'AWS_LAMBDA_LOG_STREAM_NAME': '',
-            'DEBUG_MODE': 'off',
-            'ENVIRONMENT': '',
-            'GLOBAL_PREFIX': '',
-            'SAFE_MODE': 'off',
-            'STACK_NAME': ''
-        }
+        self._defaults = CONFIG_DEFAULTS
 
         self._overrides = overrides if overrides is not None else {}
 
         self._lambda_overrides = lambda_overrides if lambda_overrides is not None else {}
 
-        self._validations = {
-            'DEBUG_MODE': ('on', 'off', 'true', 'false', 'yes', 'no'),
-            'NOTIFICATIONS_ENABLED': ('on', 'off', 'true', 'false', 'yes', 'no'),
-            'FIPS_MODE': ('on', 'off', 'true', 'false', 'yes', 'no'),
-            'SAFE_MODE': ('on', 'off', 'true', 'false', 'yes', 'no')
-        }
-
         self._env = env
 
         # initialization values
@@ -61,6 +319,7 @@ class LambdaConfig:
 
         self.log_group = None
         self.log_stream = None
+        self.log_sample_rates = None
 
         self.notifications_enabled = None
         self.notification_arn = None
@@ -69,12 +328,12 @@ class LambdaConfig:
         '''
         Get a particular configuration value.
         '''
-        if self._script_name in self._lambda_overrides:
+        if self._lambda_overrides and self._script_name in self._lambda_overrides:
             overrides = self._lambda_overrides.get(self._script_name)
             if name in overrides:
                 return overrides.get(name)
 
-        if name in self._overrides:
+        if self._overrides and name in self._overrides:
             return self._overrides.get(name)
 
         if name in self._env:
@@ -88,32 +347,37 @@ class LambdaConfig:
 
         raise ValueError(f'Configuration value for "{name}" was not specified')
 
-    def _validate_val(self, name, value):
-        '''
-        Validate a particular value.
-        '''
-
-        if name in self._validations:
-            validations = self._validations.get(name)
-            if value not in validations:
-                raise ValueError(f'Unknown {name} value specified; expected values [{str(validations)[1:-1]}]')
-
     def val(self, name, to_lower=False, bool_coerce=False, default_override=None):
         '''
         Get a particular configuration value (and validate it if necessary).
         '''
         value = self._get_val(name, default_override)
 
-        if to_lower or bool_coerce:
-            value = value.lower()
+        # most values need no normalizing or validating at all
+        if to_lower or bool_coerce or name in self._validations:
+            value = self._coerce_val(name, value, to_lower, bool_coerce)
 
-        if name in self._validations:
-            self._validate_val(name, value)
+        return value
 
-        if bool_coerce:
-            value = bool(value in ('on', 'true', 'yes'))
+    def freeze(self):
+        '''
+        Resolve every configuration layer once and get an immutable, thread-safe snapshot of the result.
+        '''
 
-        return value
+        values = dict(self._defaults)
+        values.update(self._env)
+        values.update(self._overrides)
+        values.update(self._lambda_overrides.get(self._script_name, {}))
+
+        resolved = {}
+        for getter in CONFIG_GETTERS:
+            try:
+                resolved[getter] = (getattr(self, getter)(), None)
+            except ValueError as ex:
+                # re-raised on access, just like the live config would
+                resolved[getter] = (None, ex)
+
+        return FrozenLambdaConfig(values, self._validations, resolved)
 
     def get_application_name(self):
         '''
@@ -223,7 +487,7 @@ class LambdaConfig:
         '''
 
         if self.notifications_enabled is None:
-            self.notifications_enabled = self.val('NOTIFICATIONS_ENABLED', bool_coerce=True, default_override=True)
+            self.notifications_enabled = self.val('NOTIFICATIONS_ENABLED', bool_coerce=True, default_override='on')
 
         return self.notifications_enabled
 
@@ -247,6 +511,32 @@ class LambdaConfig:
 
         return self.log_stream
 
+    def get_log_sample_rates(self):
+        '''
+        Get the per-logger sample rates for DEBUG records, as a dict of logger name -> fraction of records kept.
+        Configured as a comma-separated list of logger=rate pairs, e.g. "botocore=0.01,myscript=0.5".
+        A rate also covers the logger's children ("botocore" covers "botocore.endpoint") unless they have their own.
+        '''
+
+        if self.log_sample_rates is None:
+            rates = {}
+            for entry in self.val('LOG_SAMPLE_RATES', default_override='').split(','):
+                if not entry.strip():
+                    continue
+
+                name, _, rate = entry.partition('=')
+                if not name.strip() or not rate.strip():
+                    raise ValueError(f'Invalid LOG_SAMPLE_RATES entry "{entry.strip()}", expected logger=rate')
+
+                try:
+                    rates[name.strip()] = float(rate)
+                except ValueError:
+                    raise ValueError(f'Invalid LOG_SAMPLE_RATES entry "{entry.strip()}", expected logger=rate') from None
+
+            self.log_sample_rates = rates
+
+        return self.log_sample_rates
+
     def get_notification_arn(self):
         '''
         Get the ARN for the SNS notification to be dispatched to.
@@ -257,94 +547,83 @@ class LambdaConfig:
 
         return self.notification_arn
 
-    def build_legacy_ssm_param_name(self, name, include_global_prefix=False, include_application_name=False, include_environment=False, include_stack_name=False):
-        '''
-        Build the correct name for an SSM parameter.
-        Legacy behavior for AWS accounts that are not compliant with AWS SSM Parameter Hierarchy Standards.
-        '''
-
-        name_chunks = []
-        if include_global_prefix and len(self.get_global_prefix()) > 0:
-            name_chunks.append(self.get_global_prefix())
+class FrozenLambdaConfig(BaseLambdaConfig):
+    '''
+    Immutable snapshot of a LambdaConfig.
+    All configuration layers are merged once, and every getter is resolved up-front,
+      so that later lookups are plain dict hits.
+    '''
 
-        if include_application_name and len(self.get_application_name()) > 0:
-            name_chunks.append(self.get_application_name())
+    __slots__ = ('_values', '_resolved', '_val_cache', '_frozen')
 
-        if include_environment and len(self.get_environment()) > 0:
-            name_chunks.append(self.get_environment())
+    def __init__(self, values, validations, resolved):
+        super().__init__(validations)
 
-        if include_stack_name and len(self.get_stack_name()) > 0:
-            name_chunks.append(self.get_stack_name())
+        self._values = values
+        self._resolved = resolved
+        self._val_cache = {}
+        self._name_prefixes = self._build_name_prefixes()
 
-        name_chunks.append('ssm')
-        name_chunks.append(name)
+        self._frozen = True
 
-        return '-'.join(name_chunks)
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f'{type(self).__name__} is immutable')
 
-    def build_ssm_param_name(self, name=None, include_global_prefix=False, include_application_name=False, include_environment=False, include_stack_name=False):
-        '''
-        Build the correct name for an SSM parameter.
-        (ssm_param_names returned should alwyas contain always leading slash)
+        super().__setattr__(name, value)
 
-        Rough structure for resulting SSM parameter names is as follows (assuming the appropriate include vars are set to True):
-        /{prefix}/{appname}/{environment}/{stack_name}/ssm/{parameter_name}
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
 
-        example:
-        { # environment
-            'GLOBAL_PREFIX'='codebite',
-            'APPLICATION_NAME'='notifications',
-            'ENVIRONMENT'='prod',
-            'STACK_NAME'='primary',
-        }
-        { # args
-            name='webhook_url',
-            include_global_prefix=True,
-            include_application_name=True,
-            include_environment=True,
-            include_stack_name=True
-        }
-
-        result:
-        /codebite/notifications/prod/primary/ssm/webhook_url
+    def val(self, name, to_lower=False, bool_coerce=False, default_override=None):
+        '''
+        Get a particular configuration value (and validate it if necessary).
         '''
 
-        name_chunks = ['']
-        if include_global_prefix and len(self.get_global_prefix()) > 0:
-            name_chunks.append(self.get_global_prefix())
-
-        if include_application_name and len(self.get_application_name()) > 0:
-            name_chunks.append(self.get_application_name())
+        key = (name, to_lower, bool_coerce, default_override)
+        if key in self._val_cache:
+            return self._val_cache[key]
 
-        if include_environment and len(self.get_environment()) > 0:
-            name_chunks.append(self.get_environment())
+        if name in self._values:
+            value = self._values[name]
+        elif default_override is not None:
+            value = default_override
+        else:
+            raise ValueError(f'Configuration value for "{name}" was not specified')
 
-        if include_stack_name and len(self.get_stack_name()) > 0:
-            name_chunks.append(self.get_stack_name())
+        value = self._coerce_val(name, value, to_lower, bool_coerce)
 
-        # note: name is conditional and not included here if None in order to support get_parameters_by_path ssm parameter name structures
-        if name is not None:
-            name_chunks.append('ssm')
-            name_chunks.append(name)
-        else:
-            name_chunks.append('')
+        # concurrent callers may race to fill this in, but they'll all store the same value
+        self._val_cache[key] = value
 
-        return '/'.join(name_chunks)
+        return value
 
-    def build_bucket_name(self, name, include_global_prefix=True, include_application_name=True, include_environment=False):
+    def freeze(self):
         '''
-        Build the correct name for an S3 bucket.
+        Already frozen.
         '''
 
-        name_chunks = []
-        if include_global_prefix and len(self.get_global_prefix()) > 0:
-            name_chunks.append(self.get_global_prefix())
+        return self
+
+def _frozen_getter(getter):
+    '''
+    Build a FrozenLambdaConfig getter that returns the value resolved at freeze time.
+    '''
+
+    def get(self):
+        value, error = self._resolved[getter] # pylint: disable=W0212
+        if error is not None:
+            raise error
+
+        return value
 
-        if include_application_name and len(self.get_application_name()) > 0:
-            name_chunks.append(self.get_application_name())
+    get.__name__ = getter
+    get.__doc__ = getattr(LambdaConfig, getter).__doc__
 
-        if include_environment and len(self.get_environment()) > 0:
-            name_chunks.append(self.get_environment())
+    return get
 
-        name_chunks.append(name)
+# every argument-less get_* method on LambdaConfig is mirrored onto FrozenLambdaConfig
+CONFIG_GETTERS = tuple(name for name, attr in vars(LambdaConfig).items() if name.startswith('get_') and callable(attr) and attr.__code__.co_argcount == 1)
 
-        return '-'.join(name_chunks)
+for _getter in CONFIG_GETTERS:
+    setattr(FrozenLambdaConfig, _getter, _frozen_getter(_getter))
@@ -9,36 +9,198 @@
 #
 '''
 
-# pylint: disable=C0301,C0330,W0511,R0902,R0913
+# pylint: disable=C0301,W0511,R0902,R0913
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
 import json
 import logging
 import os
+import threading
 
-import boto3
-from botocore.client import Config
-
+# the helper modules behind the S3, EC2, RDS, fan-out and config bundle helpers are imported on first use
+#   (by the _init_* methods, or the methods that use them), so that importing crimsoncore doesn't pay for what a Lambda never calls
+from crimsoncore import lambda_logging
+from crimsoncore.client_pool import CLIENT_POOL
+from crimsoncore.invocation_metrics import InvocationMetrics
 from crimsoncore.lambda_config import LambdaConfig
+from crimsoncore.notification_dispatcher import NotificationDispatcher, PUBLISH_BATCH_MAX_ENTRIES, build_publish_batches, collect_publish_batch_results
+from crimsoncore.parameter_cache import ParameterCache
+from crimsoncore.ssm_parameters import LOADED_CONFIG_BUNDLES, SsmParametersMixin
+from crimsoncore.throttling import RATE_LIMITER
+
+# shared across all LambdaCore instances (and warm invocations) within the process
+PARAMETER_CACHE = ParameterCache()
+METRICS = InvocationMetrics()
 
-class LambdaCore:
+class _LazyService:
+    '''
+    Descriptor for AWS API attributes on LambdaCore that are initialized on first access.
+    per_thread services (boto3 resources, which aren't thread-safe) are initialized once for each thread that uses them.
+    '''
+
+    def __init__(self, init_method, per_thread=False):
+        self.init_method = init_method
+        self.per_thread = per_thread
+        self.attr = None
+
+    def __set_name__(self, owner, name):
+        self.attr = f'_{name}'
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        if self._storage(instance).get(self.attr) is None:
+            getattr(instance, self.init_method)()
+
+        return self._storage(instance)[self.attr]
+
+    def __set__(self, instance, value):
+        self._storage(instance)[self.attr] = value
+
+    def _storage(self, instance):
+        '''
+        Get the dict the service is stored in - the instance's own, or its one for the current thread.
+        '''
+
+        if not self.per_thread:
+            return instance.__dict__
+
+        local = instance.__dict__.get('_thread_services')
+        if local is None:
+            local = instance.__dict__.setdefault('_thread_services', threading.local())
+
+        return local.__dict__
+
+class LambdaCore(SsmParametersMixin):
     '''
     CrimsonCore shared functions.
     '''
 
+    # AWS APIs are initialized on first access (or explicitly, through the init_* methods or warm())
+    ec2 = _LazyService('init_ec2', per_thread=True)
+    awslambda = _LazyService('init_lambda') # had to use awslambda because .lambda is a syntax error
+    s3 = _LazyService('init_s3') # pylint: disable=C0103
+    sns = _LazyService('init_sns')
+    ssm = _LazyService('init_ssm')
+    rds = _LazyService('init_rds')
+
+    # helpers built around the AWS APIs live in modules of their own, and are likewise initialized on first access
+    s3_transfer = _LazyService('_init_s3_transfer')
+    s3_bulk = _LazyService('_init_s3_bulk')
+    ec2_inventory = _LazyService('_init_ec2_inventory')
+    rds_snapshots = _LazyService('_init_rds_snapshots')
+    lambda_fanout = _LazyService('_init_lambda_fanout')
+
+    services = {
+        'ec2': 'init_ec2',
+        'lambda': 'init_lambda',
+        's3': 'init_s3',
+        'sns': 'init_sns',
+        'ssm': 'init_ssm',
+        'rds': 'init_rds'
+    }
+
     def __init__(self, name, env=None):
         self.script_name = name
 
         self.config = LambdaConfig(name=self.script_name, env=os.environ if env is None else env)
 
         self.logger = logging.getLogger(self.script_name)
-        self.logger.setLevel(self.config.get_log_level())
+        log_level = self.config.get_log_level()
+        if self.logger.level != log_level:
+            # setLevel() clears the cached levels of every logger in the process, so it's skipped when nothing changes
+            self.logger.setLevel(log_level)
+
+        log_format = self.config.val('LOG_FORMAT', to_lower=True, default_override='text')
+        log_buffer_size = self.config.get_int('LOG_BUFFER_SIZE', 0, minimum=0)
+        if log_format == 'json' or log_buffer_size > 0:
+            lambda_logging.configure_logger(
+                self.logger,
+                log_format=log_format,
+                buffer_size=log_buffer_size,
+                flush_interval=self.config.get_float('LOG_FLUSH_INTERVAL', 1, minimum=0),
+                lambda_name=self.script_name,
+                log_group=self.config.get_log_group(),
+                log_stream=self.config.get_log_stream()
+            )
+
+        # the sampler sits on handlers shared with the rest of the process, so it's only (re)configured by those that configure it
+        self.log_sampler = None
+        if self.config.is_set('LOG_SAMPLE_RATE', 'LOG_SAMPLE_RATES', 'LOG_RATE_LIMIT', 'LOG_RATE_BURST'):
+            self._configure_log_sampler()
+
+        self.client_pool = CLIENT_POOL
+        self.metrics = METRICS
+
+        # the parameter cache is shared too, and shrinking it evicts entries other LambdaCores may still be using
+        self.parameter_cache = PARAMETER_CACHE
+        if self.config.is_set('SSM_CACHE_MAX_ENTRIES'):
+            self.parameter_cache.resize(self.config.get_int('SSM_CACHE_MAX_ENTRIES', 256, minimum=1))
+
+        # the rate limiter is shared by every LambdaCore in the process, so it's only reconfigured by those that configure it
+        self.rate_limiter = RATE_LIMITER
+        if self.config.is_set('API_RATE_LIMIT', 'API_RATE_BURST'):
+            self.rate_limiter.configure(self.config.get_float('API_RATE_LIMIT', 0, minimum=0), self.config.get_int('API_RATE_BURST', 0, minimum=0))
+
+        self._notification_dispatcher = None
+        self._parameter_change_callbacks = []
+
+        bundle_path = self.config.val('CONFIG_BUNDLE_PATH', default_override='')
+        if bundle_path and bundle_path not in LOADED_CONFIG_BUNDLES:
+            self.load_config_bundle(bundle_path)
+
+    def _configure_log_sampler(self):
+        '''
+        Attach a LogSampler for the configured sample rates and rate limits (or detach the current one, if they leave nothing to sample).
+        '''
+
+        handlers = []
+        sample_rates = self.config.get_log_sample_rates()
+        sample_rate = self.config.get_float('LOG_SAMPLE_RATE', 1, minimum=0)
+        rate_limit = self.config.get_float('LOG_RATE_LIMIT', 0, minimum=0)
+        if sample_rate < 1 or rate_limit > 0 or min(sample_rates.values(), default=1) < 1:
+            self.log_sampler = lambda_logging.LogSampler(
+                sample_rates=sample_rates,
+                default_rate=sample_rate,
+                rate_limit=rate_limit,
+                rate_burst=self.config.get_int('LOG_RATE_BURST', 0, minimum=0)
+            )
+
+            # on the handlers records end up at, rather than on loggers, so that records from child loggers are sampled too
+            handlers = self.logger.handlers + logging.getLogger().handlers
+            for logger_name in sample_rates:
+                handlers.extend(handler for handler in logging.getLogger(logger_name).handlers if handler not in handlers)
+        lambda_logging.configure_sampler(handlers, self.log_sampler)
+
+    def freeze_config(self):
+        '''
+        Swap the live configuration for an immutable snapshot.
+        Best done once configuration is final (e.g. at the end of Lambda init) - later reads become plain dict hits.
+        '''
+
+        self.config = self.config.freeze()
+
+    def warm(self, services=None):
+        '''
+        Initialize several AWS APIs in parallel (all of them if no services are specified).
+        Useful for doing the work up-front during Lambda init, rather than on first use.
+        '''
 
-        self.ec2 = None
-        self.awslambda = None # had to use awslambda because .lambda is a syntax error
-        self.s3 = None # pylint: disable=C0103
-        self.sns = None
-        self.ssm = None
-        self.rds = None
+        services = list(self.services) if services is None else services
+
+        unknown = [service for service in services if service not in self.services]
+        if unknown:
+            raise ValueError(f'Unknown services specified; expected values [{str(tuple(self.services))[1:-1]}]')
+
+        if not services:
+            return
+
+        with ThreadPoolExecutor(max_workers=len(services)) as executor:
+            for future in [executor.submit(getattr(self, self.services[service])) for service in services]:
+                future.result()
 
     def init_ec2(self):
         '''
@@ -50,8 +212,9 @@ class LambdaCore:
         if self.config.get_fips_mode():
             self.logger.info('FIPS mode ignored - AWS EC2 FIPS support is region-dependent')
 
-        self.ec2 = boto3.resource(
+        self.ec2 = self._get_client(
             'ec2',
+            resource=True,
             region_name=aws_region
         )
 
@@ -67,7 +230,7 @@ class LambdaCore:
         if self.config.get_fips_mode():
             self.logger.info('FIPS mode ignored - AWS SSM FIPS support is region-dependent')
 
-        self.ssm = boto3.client(
+        self.ssm = self._get_client(
             'ssm',
             region_name=aws_region
         )
@@ -86,10 +249,10 @@ class LambdaCore:
 
             endpoint_url = f'https://s3-fips.{self.config.get_aws_region()}.amazonaws.com'
 
-        self.s3 = boto3.client( # pylint: disable=C0103
+        self.s3 = self._get_client( # pylint: disable=C0103
             's3',
-            config=Config(signature_version='s3v4'),
-            endpoint_url=endpoint_url
+            endpoint_url=endpoint_url,
+            config={'signature_version': 's3v4'}
         )
 
         self.logger.info('AWS S3 API initialized')
@@ -104,7 +267,7 @@ class LambdaCore:
         if self.config.get_fips_mode():
             self.logger.info('FIPS mode ignored - AWS SNS FIPS support is region-dependent')
 
-        self.sns = boto3.client(
+        self.sns = self._get_client(
             'sns',
             region_name=aws_region
         )
@@ -116,22 +279,31 @@ class LambdaCore:
         Initialize AWS Lambda API.
         '''
 
+        if self.config.get_fips_mode():
+            self.logger.info('Enabling FIPS compliance mode for AWS Lambda API')
+
+        self.awslambda = self._get_lambda_client()
+
+        self.logger.info('AWS Lambda API initialized')
+
+    def _get_lambda_client(self, config=None):
+        '''
+        Get a pooled AWS Lambda client, using the FIPS endpoint in FIPS mode.
+        '''
+
         endpoint_url = None
         aws_region = self.config.get_aws_region()
 
         if self.config.get_fips_mode():
-            self.logger.info('Enabling FIPS compliance mode for AWS Lambda API')
-
             endpoint_url = f'https://lambda-fips.{aws_region}.amazonaws.com'
 
-        self.awslambda = boto3.client(
+        return self._get_client(
             'lambda',
             region_name=aws_region,
-            endpoint_url=endpoint_url
+            endpoint_url=endpoint_url,
+            config=config
         )
 
-        self.logger.info('AWS Lambda API initialized')
-
     def init_rds(self):
         '''
         Initialize Amazon RDS API.
@@ -142,82 +314,297 @@ class LambdaCore:
         if self.config.get_fips_mode():
             self.logger.info('FIPS mode ignored - AWS RDS FIPS support is region-dependent')
 
-        self.rds = boto3.client(
+        self.rds = self._get_client(
             'rds',
             region_name=aws_region
         )
 
         self.logger.info('AWS RDS API initialized')
 
-    def get_ssm_parameter(self, name, encrypted=False, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, legacy_name=False):
+    def _init_s3_transfer(self):
         '''
-        Get an AWS Systems Manager system parameter.
-        Encryption supported.
+        Initialize the S3 transfer helpers.
         '''
 
-        if legacy_name:
-            parameter_name = self.config.build_legacy_ssm_param_name(
-                name,
-                include_global_prefix=include_global_prefix,
-                include_application_name=include_application_name,
-                include_environment=include_environment,
-                include_stack_name=include_stack_name
-            )
-        else:
-            parameter_name = self.config.build_ssm_param_name(
-                name,
-                include_global_prefix=include_global_prefix,
-                include_application_name=include_application_name,
-                include_environment=include_environment,
-                include_stack_name=include_stack_name
-            )
+        from crimsoncore import s3_transfer # pylint: disable=C0415
 
-        ssm_parameter = self.ssm.get_parameter(
-            Name=parameter_name,
-            WithDecryption=encrypted
-        )
-        return ssm_parameter['Parameter']['Value']
+        self.s3_transfer = s3_transfer.S3Transfer(self)
 
-    def get_ssm_parameters_by_path(self, subpath=None, encrypted=False, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False):
+    def _init_s3_bulk(self):
         '''
-        Get multiple AWS Systems Manager system parameters under a specific path.
-        Encryption supported.
+        Initialize the S3 bulk listing and deletion helpers.
         '''
 
-        ssm_parameters = self.ssm.get_parameter(
-            Name=self.config.build_ssm_param_name(
-                subpath,
-                include_global_prefix=include_global_prefix,
-                include_application_name=include_application_name,
-                include_environment=include_environment,
-                include_stack_name=include_stack_name
-            ),
-            WithDecryption=encrypted
-        )
+        from crimsoncore import s3_bulk # pylint: disable=C0415
+
+        self.s3_bulk = s3_bulk.S3Bulk(self)
+
+    def _init_ec2_inventory(self):
+        '''
+        Initialize the EC2 inventory helpers.
+        '''
+
+        from crimsoncore import ec2_inventory # pylint: disable=C0415
 
-        bare_params = {}
-        for parameter in ssm_parameters['Parameters']:
-            bare_params.update([(parameter['Name'], parameter['Value'])])
+        self.ec2_inventory = ec2_inventory.Ec2Inventory(self)
 
-        return bare_params
+    def _init_rds_snapshots(self):
+        '''
+        Initialize the RDS bulk snapshot helpers.
+        '''
+
+        from crimsoncore import rds_snapshots # pylint: disable=C0415
+
+        self.rds_snapshots = rds_snapshots.RdsSnapshots(self, functools.partial(self._get_client, 'rds'))
+
+    def _init_lambda_fanout(self):
+        '''
+        Initialize the Lambda fan-out helpers.
+        '''
+
+        from crimsoncore import lambda_fanout # pylint: disable=C0415
+
+        # throttled invokes are retried by lambda_fanout alone - botocore retrying as well would multiply the attempts,
+        #   and could re-send invokes that had already run
+        self.lambda_fanout = lambda_fanout.LambdaFanout(self, functools.partial(self._get_lambda_client, config={'retries': {'total_max_attempts': 1}}))
+
+    def _get_client(self, service, resource=False, config=None, **kwargs):
+        '''
+        Get a pooled (and instrumented) AWS client or resource.
+        config is a dict of botocore.client.Config options, applied on top of those configured for the service.
+        '''
+
+        client_config = self.config.get_client_options(service)
+        client_config.update(config or {})
+
+        with self.metrics.timer(f'client.{service}'):
+            if resource:
+                client = self.client_pool.resource(service, config=client_config, **kwargs)
+            else:
+                client = self.client_pool.client(service, config=client_config, **kwargs)
+
+        # registering event handlers invalidates botocore's handler lookup cache, so pooled clients are only instrumented once
+        botocore_client = client.meta.client if resource else client
+        if not getattr(botocore_client, '_crimsoncore_instrumented', False):
+            self.metrics.instrument(botocore_client)
+            self.rate_limiter.instrument(botocore_client)
+            botocore_client._crimsoncore_instrumented = True # pylint: disable=W0212
+
+        return client
+
+    def bind_request_id(self, request_id):
+        '''
+        Include the current invocation's request id (context.aws_request_id) in every JSON log record from here on.
+        Should be called once at the start of each invocation.
+        '''
+
+        lambda_logging.bind_log_fields(self.logger, request_id=request_id)
+
+    @contextmanager
+    def invocation(self, context=None, emit_metrics=False):
+        '''
+        Wrap a single invocation, guaranteeing that queued notifications and buffered log records
+          (and metrics, if emit_metrics is True) are written out when it ends - even if it raises.
+        context is the Lambda context object; its request id is bound to JSON log records.
+
+        with core.invocation(context):
+            ...
+        '''
+
+        if context is not None:
+            self.bind_request_id(context.aws_request_id)
+
+        try:
+            yield self
+        finally:
+            try:
+                self.flush_notifications()
+            finally:
+                if emit_metrics:
+                    self.emit_metrics()
+                else:
+                    self.flush_logs()
+
+    def handler(self, func=None, emit_metrics=False):
+        '''
+        Decorator for a Lambda handler(event, context), running each invocation within invocation().
+
+        @core.handler
+        def handler(event, context):
+            ...
+        '''
+
+        if func is None:
+            return functools.partial(self.handler, emit_metrics=emit_metrics)
+
+        @functools.wraps(func)
+        def wrapper(event, context):
+            with self.invocation(context, emit_metrics=emit_metrics):
+                return func(event, context)
+
+        return wrapper
+
+    def flush_logs(self):
+        '''
+        Write out any buffered log records.
+        Must be called once at the end of each invocation when LOG_BUFFER_SIZE is set,
+          as Lambda freezes the background thread that would otherwise write them
+          (invocation(), handler() and emit_metrics() all do so).
+        When log sampling is on, a summary line is logged first for each message template with suppressed records.
+        '''
+
+        if self.log_sampler is not None:
+            for (name, template), count in self.log_sampler.summarize().items():
+                self.logger.info('suppressed %d similar messages from %s: %s', count, name, template)
+
+        lambda_logging.flush_logger(self.logger)
+
+    def emit_metrics(self, reset=True):
+        '''
+        Write the timings and counters collected during this invocation to stdout
+          as a single CloudWatch Embedded Metric Format line.
+        Buffered log records are written out first, so they land ahead of the metrics line.
+        Should be called once at the end of each invocation.
+        '''
+
+        self.flush_logs()
+
+        line = self.metrics.to_emf(self.config.val('METRICS_NAMESPACE', default_override='CrimsonCore'), {'Lambda': self.script_name})
+
+        # printed rather than logged - EMF lines must not carry the Lambda runtime's log prefix
+        print(line, flush=True)
+
+        if reset:
+            self.metrics.reset()
+
+        return line
+
+    @property
+    def notification_dispatcher(self):
+        '''
+        Get the background notification dispatcher, creating it if necessary.
+        '''
+
+        if self._notification_dispatcher is None:
+            batch = self.config.val('NOTIFICATIONS_BATCH', bool_coerce=True, default_override='off')
+            self._notification_dispatcher = NotificationDispatcher(
+                self._dispatch_notification_batch if batch else self._publish_notification,
+                max_queue_size=self.config.get_int('NOTIFICATIONS_QUEUE_SIZE', 100, minimum=0),
+                max_workers=self.config.get_int('NOTIFICATIONS_WORKERS', 4, minimum=1),
+                batch_size=PUBLISH_BATCH_MAX_ENTRIES if batch else 1,
+                logger=self.logger
+            )
+
+        return self._notification_dispatcher
+
+    def build_notification_message(self, notification_type, message):
+        '''
+        Build the SNS message body for a notification.
+        '''
+
+        return json.dumps({'default':
+            json.dumps({
+                'type': notification_type,
+                'lambda': self.script_name,
+                'message': message
+            })
+        })
 
     def send_notification(self, notification_type, message):
         '''
         Send an SNS notification to the notification Lambda for chain-dispatch
           to whatever notification service it's configured for.
+        If NOTIFICATIONS_ASYNC is enabled, the notification is queued for background dispatch
+          and flush_notifications() must be called before the handler returns.
         '''
 
         if not self.config.get_notifications_enabled():
             return
 
-        self.sns.publish(
+        sns_message = self.build_notification_message(notification_type, message)
+
+        if self.config.val('NOTIFICATIONS_ASYNC', bool_coerce=True, default_override='off'):
+            self.notification_dispatcher.submit(sns_message)
+        else:
+            self._publish_notification(sns_message)
+
+    def send_notifications(self, notifications):
+        '''
+        Send several SNS notifications at once, grouped into PublishBatch calls
+          of up to 10 entries and 256 KB each.
+        notifications is an iterable of (notification_type, message) tuples.
+        Entries that fail within a batch are retried individually.
+
+        Returns a list of per-notification results, in the same order as the notifications given.
+        '''
+
+        if not self.config.get_notifications_enabled():
+            return []
+
+        return self._publish_notification_batch([
+            self.build_notification_message(notification_type, message) for notification_type, message in notifications
+        ])
+
+    def flush_notifications(self, timeout=None):
+        '''
+        Wait for any notifications queued for background dispatch to be sent.
+        Returns False if notifications were still pending after timeout seconds, or if any failed to send
+          (the errors are then available from notification_dispatcher.last_errors).
+        '''
+
+        if self._notification_dispatcher is None:
+            return True
+
+        return self._notification_dispatcher.flush(timeout)
+
+    def _publish_notification(self, sns_message):
+        '''
+        Publish an already-built notification message to SNS.
+        '''
+
+        response = self.sns.publish(
             TargetArn=self.config.get_notification_arn(),
-            Message=json.dumps({'default':
-                json.dumps({
-                    'type': notification_type,
-                    'lambda': self.script_name,
-                    'message': message
-                })
-            }),
+            Message=sns_message,
             MessageStructure='json'
         )
+
+        return response.get('MessageId')
+
+    def _dispatch_notification_batch(self, sns_messages):
+        '''
+        Publish a batch of notifications queued for background dispatch, raising if any of them failed to send
+          (so that the dispatcher reports the failures through flush() and last_errors).
+        '''
+
+        errors = [result['error'] for result in self._publish_notification_batch(sns_messages) if result['error'] is not None]
+        if errors:
+            raise RuntimeError(f'Failed to send {len(errors)} of {len(sns_messages)} notifications: {"; ".join(errors)}')
+
+    def _publish_notification_batch(self, sns_messages):
+        '''
+        Publish already-built notification messages to SNS using PublishBatch.
+        '''
+
+        results = []
+        for batch in build_publish_batches(sns_messages):
+            response = self.sns.publish_batch(
+                TopicArn=self.config.get_notification_arn(),
+                PublishBatchRequestEntries=[
+                    {'Id': str(i), 'Message': sns_message, 'MessageStructure': 'json'} for i, sns_message in enumerate(batch)
+                ]
+            )
+
+            batch_results, retries = collect_publish_batch_results(batch, response)
+            for i in retries:
+                try:
+                    batch_results[i] = {'message_id': self._publish_notification(batch[i]), 'error': None, 'retried': True}
+                except Exception as ex: # pylint: disable=W0703
+                    batch_results[i] = {'message_id': None, 'error': str(ex), 'retried': True}
+
+            for result in batch_results:
+                if result['error'] is not None:
+                    self.logger.warning('Failed to send notification: %s', result['error'])
+
+            results.extend(batch_results)
+
+        return results
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# Lambda fan-out invocation module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+
+from crimsoncore.throttling import backoff_delay
+
+# error codes from lambda:Invoke that mean the function was throttled (and so never ran) - the only ones safe to try again
+RETRYABLE_INVOKE_ERRORS = ('TooManyRequestsException', 'EC2ThrottledException')
+
+INVOCATION_TYPES = ('Event', 'RequestResponse', 'DryRun')
+
+class LambdaFanout:
+    '''
+    Fan-out of work across invocations of a worker Lambda, for a LambdaCore.
+    Reached through LambdaCore.lambda_fanout.
+    get_client builds the Lambda client to invoke through - one without botocore's own retries (see invoke).
+    '''
+
+    def __init__(self, core, get_client):
+        self.core = core
+        self.get_client = get_client
+
+    def fan_out(self, function_name, items, chunk_size=100, invocation_type='Event', payload_key='items', qualifier=None, payload=None):
+        '''
+        Split a work list into chunks and invoke a worker Lambda once per chunk,
+          with up to FANOUT_CONCURRENCY invokes in flight at once.
+        Each worker receives {payload_key: chunk}, merged over the optional base payload dict.
+        invocation_type is "Event" (fire and forget) or "RequestResponse" (wait for, and collect, each worker's response).
+        Throttled invokes are retried with jittered exponential backoff, up to FANOUT_MAX_ATTEMPTS attempts each;
+          anything else is reported rather than retried, as the worker may already have run.
+
+        Returns a list of per-chunk result dicts (status_code, payload, function_error, error, attempts), in chunk order.
+        '''
+
+        payloads = [dict(payload or {}, **{payload_key: chunk}) for chunk in build_chunks(items, chunk_size)]
+
+        with self.core.metrics.timer('lambda.fan_out'):
+            results = invoke_all(
+                self.get_client(),
+                function_name,
+                payloads,
+                invocation_type=invocation_type,
+                qualifier=qualifier,
+                concurrency=self.core.config.get_int('FANOUT_CONCURRENCY', 8, minimum=1),
+                max_attempts=self.core.config.get_int('FANOUT_MAX_ATTEMPTS', 5, minimum=1)
+            )
+
+        failed = 0
+        for i, result in enumerate(results):
+            if result['error'] is not None or result['function_error'] is not None:
+                failed += 1
+                self.core.logger.warning('Fan-out chunk %d to %s failed: %s', i, function_name, result['error'] or result['function_error'])
+
+        self.core.metrics.count('lambda.fan_out.chunks', len(results))
+        self.core.metrics.count('lambda.fan_out.failed', failed)
+
+        return results
+
+    def invoke(self, function_name, payload, invocation_type='Event', qualifier=None):
+        '''
+        Invoke a worker Lambda once with a JSON payload, retrying it the same way as fan_out() does.
+        Returns a result dict (status_code, payload, function_error, error, attempts).
+        '''
+
+        return invoke(
+            self.get_client(),
+            function_name,
+            payload,
+            invocation_type=invocation_type,
+            qualifier=qualifier,
+            max_attempts=self.core.config.get_int('FANOUT_MAX_ATTEMPTS', 5, minimum=1)
+        )
+
+def build_chunks(items, chunk_size):
+    '''
+    Split a work list into lists of up to chunk_size items each.
+    '''
+
+    items = list(items)
+
+    return [items[i:i + chunk_size] for i in range(0, len(items), max(chunk_size, 1))]
+
+def invoke(client, function_name, payload, invocation_type='Event', qualifier=None, max_attempts=5, base_delay=0.1, max_delay=5, sleep=None):
+    '''
+    Invoke a Lambda function once with a JSON payload, retrying throttled invokes with jittered exponential backoff.
+    Other errors are not retried, as the function may already have run; the client should have botocore's own retries
+      turned off, so that they don't multiply with these.
+
+    Returns a result dict:
+      status_code - HTTP status code of the invoke (202 for Event, 200 for RequestResponse)
+      payload - decoded response payload (RequestResponse only)
+      function_error - "Unhandled" etc. if the function itself failed
+      error - error raised by the invoke call, if it never succeeded
+      attempts - how many invokes were made
+    '''
+
+    if invocation_type not in INVOCATION_TYPES:
+        raise ValueError(f'Unknown invocation type specified; expected values [{str(INVOCATION_TYPES)[1:-1]}]')
+
+    request = {
+        'FunctionName': function_name,
+        'InvocationType': invocation_type,
+        'Payload': json.dumps(payload).encode('utf-8')
+    }
+    if qualifier:
+        request['Qualifier'] = qualifier
+
+    response, error, attempts = _invoke_with_retries(client, request, max_attempts, base_delay, max_delay, sleep if sleep is not None else time.sleep)
+
+    result = {'status_code': None, 'payload': None, 'function_error': None, 'error': None, 'attempts': attempts}
+    if error is not None:
+        result['error'] = str(error)
+        return result
+
+    result['status_code'] = response.get('StatusCode')
+    result['function_error'] = response.get('FunctionError')
+
+    body = response['Payload'].read() if response.get('Payload') is not None else b''
+    if body:
+        try:
+            result['payload'] = json.loads(body)
+        except ValueError:
+            result['payload'] = body.decode('utf-8', errors='replace')
+
+    return result
+
+def _invoke_with_retries(client, request, max_attempts, base_delay, max_delay, sleep):
+    '''
+    Make an invoke call, retrying it with jittered exponential backoff for as long as it's throttled (up to max_attempts attempts).
+    Returns a tuple of (response, or None; error raised by the last attempt, or None; attempts made).
+    '''
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return client.invoke(**request), None, attempt
+        except Exception as ex: # pylint: disable=W0703
+            code = getattr(ex, 'response', {}).get('Error', {}).get('Code')
+            if code not in RETRYABLE_INVOKE_ERRORS or attempt >= max_attempts:
+                return None, ex, attempt
+
+        sleep(backoff_delay(attempt - 1, base=base_delay, cap=max_delay))
+
+def invoke_all(client, function_name, payloads, invocation_type='Event', qualifier=None, concurrency=8, max_attempts=5, base_delay=0.1, max_delay=5, sleep=None):
+    '''
+    Invoke a Lambda function once per payload, with up to concurrency invokes in flight at once.
+    Returns a list of result dicts (see invoke), in the same order as the payloads given.
+    '''
+
+    payloads = list(payloads)
+    if not payloads:
+        return []
+
+    def run(payload):
+        return invoke(
+            client,
+            function_name,
+            payload,
+            invocation_type=invocation_type,
+            qualifier=qualifier,
+            max_attempts=max_attempts,
+            base_delay=base_delay,
+            max_delay=max_delay,
+            sleep=sleep
+        )
+
+    if concurrency <= 1 or len(payloads) == 1:
+        return [run(payload) for payload in payloads]
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(payloads)), thread_name_prefix='crimsoncore-fanout') as executor:
+        return list(executor.map(run, payloads))
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# Lambda logging module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+import atexit
+import json
+import logging
+import sys
+import threading
+import weakref
+
+from crimsoncore.throttling import TokenBucket
+
+# how far past its buffer size a handler may fall behind before emitting threads flush it themselves
+BUFFER_OVERFLOW_FACTOR = 10
+
+# maximum number of message templates a LogSampler tracks at once
+SAMPLER_MAX_TEMPLATES = 1024
+
+# every live BufferedLogHandler, so that whatever they still hold can be written out at interpreter exit
+_BUFFERED_HANDLERS = weakref.WeakSet()
+
+# every handler configure_logger() attached, so that it can be replaced (or have its fields rebound) later
+_CONFIGURED_HANDLERS = weakref.WeakSet()
+
+# every handler configure_sampler() attached a LogSampler to, so that it can be detached again
+_SAMPLED_HANDLERS = weakref.WeakSet()
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats log records as single-line JSON objects.
+    Fields that are the same for every record (script name, log group, log stream, request id) are bound once,
+      and serialized ahead of time rather than for each record.
+    '''
+
+    def __init__(self, **fields):
+        super().__init__()
+
+        self._fields = {}
+        self._prefix = '{'
+        self.bind(**fields)
+
+    def bind(self, **fields):
+        '''
+        Set (or replace) fields included in every record.
+        '''
+
+        self._fields.update(fields)
+
+        bound = json.dumps(self._fields, separators=(',', ':'), default=str)
+        self._prefix = bound[:-1] + ',' if self._fields else '{'
+
+    def format(self, record):
+        fields = {
+            'timestamp': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            fields['exception'] = record.exc_text
+        if record.stack_info:
+            fields['stack'] = self.formatStack(record.stack_info)
+
+        return self._prefix + json.dumps(fields, separators=(',', ':'), default=str)[1:]
+
+class BufferedLogHandler(logging.Handler):
+    '''
+    Log handler that buffers records in memory and writes them out in bulk from a background thread,
+      keeping formatting and stream writes off the hot path.
+    The buffer is written once it holds buffer_size records, or every flush_interval seconds, whichever comes first
+      (a flush_interval of 0 disables the timed flushes, leaving only the size-triggered ones).
+    flush() must be called before the handler returns, as Lambda freezes background threads between invocations.
+    '''
+
+    def __init__(self, stream=None, buffer_size=100, flush_interval=1.0, level=logging.NOTSET):
+        super().__init__(level)
+
+        self.stream = stream if stream is not None else sys.stdout
+        self.buffer_size = max(buffer_size, 1)
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+        self._closed = False
+
+        _BUFFERED_HANDLERS.add(self)
+
+    def emit(self, record):
+        try:
+            # resolve the message now - arguments may well have changed by the time the record is formatted
+            record.msg = record.getMessage()
+            record.args = None
+
+            with self._buffer_lock:
+                self._buffer.append(record)
+                pending = len(self._buffer)
+                self._start_worker()
+        except Exception: # pylint: disable=W0703
+            self.handleError(record)
+            return
+
+        if pending >= self.buffer_size * BUFFER_OVERFLOW_FACTOR:
+            # the background thread can't keep up - apply back-pressure
+            self.flush()
+        elif pending >= self.buffer_size:
+            self._wake.set()
+
+    def flush(self):
+        '''
+        Write out every buffered record, in order, with a single stream write.
+        '''
+
+        with self._write_lock:
+            with self._buffer_lock:
+                records, self._buffer = self._buffer, []
+
+            if not records:
+                return
+
+            lines = []
+            for record in records:
+                try:
+                    lines.append(self.format(record))
+                except Exception: # pylint: disable=W0703
+                    self.handleError(record)
+
+            try:
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+            except Exception: # pylint: disable=W0703
+                self.handleError(records[-1])
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        super().close()
+
+    def _start_worker(self):
+        '''
+        Start the background flush thread if it isn't running.
+        (must be called with the buffer lock held)
+        '''
+
+        if not self._closed and (self._worker is None or not self._worker.is_alive()):
+            self._worker = threading.Thread(target=self._work, name='crimsoncore-log-flush', daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        '''
+        Background flush loop.
+        '''
+
+        # waiting on a zero timeout would return immediately, and spin
+        timeout = self.flush_interval if self.flush_interval > 0 else None
+
+        while not self._closed:
+            self._wake.wait(timeout)
+            self._wake.clear()
+            self.flush()
+
+class LogSampler(logging.Filter):
+    '''
+    Log filter that thins out chatty low-level (DEBUG, by default) records; records above that level always pass.
+    Records are first sampled - only the given fraction of each logger's records is kept - and then rate limited
+      per message template, with a token bucket of rate_limit records per second (and rate_burst records of burst) each.
+    A logger without a sample rate of its own uses its nearest configured ancestor's (e.g. "botocore" covers "botocore.endpoint").
+    When a template's record next gets through, it notes how many similar messages were suppressed before it;
+      summarize() collects the counts for templates that haven't been seen since.
+    Meant for handlers (see configure_sampler), which see records propagated from child loggers;
+      a record reaching several handlers is only sampled once.
+    '''
+
+    def __init__(self, sample_rates=None, default_rate=1.0, rate_limit=0, rate_burst=0, level=logging.DEBUG, clock=None, rand=None):
+        super().__init__()
+
+        self.sample_rates = dict(sample_rates or {})
+        self.default_rate = default_rate
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.level = level
+
+        self._clock = clock
+        if rand is None:
+            import random # pylint: disable=C0415
+            rand = random.random
+        self._rand = rand
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._buckets = {}
+        self._suppressed = {}
+
+        self.crimsoncore_filter = True
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+
+        # already decided by another handler this record went through
+        decision = getattr(record, 'crimsoncore_sampled', None)
+        if decision is not None:
+            return decision
+
+        rate = self.rate_for(record.name)
+        key = (record.name, str(record.msg))
+
+        with self._lock:
+            keep = rate >= 1 or self._rand() < rate
+
+            if keep and self.rate_limit > 0:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    # message templates built with f-strings are unique per record - dropping every bucket
+                    #   just hands each template a fresh burst allowance
+                    if len(self._buckets) >= SAMPLER_MAX_TEMPLATES:
+                        self._buckets.clear()
+
+                    bucket = self._buckets[key] = TokenBucket(self.rate_limit, self.rate_burst, clock=self._clock)
+
+                keep = bucket.try_acquire()
+
+            if not keep:
+                if key in self._suppressed or len(self._suppressed) < SAMPLER_MAX_TEMPLATES:
+                    self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                record.crimsoncore_sampled = False
+                return False
+
+            suppressed = self._suppressed.pop(key, 0)
+
+        if suppressed:
+            record.msg = f'{record.msg} (suppressed {suppressed} similar messages)'
+
+        record.crimsoncore_sampled = True
+        return True
+
+    def rate_for(self, name):
+        '''
+        Get the sample rate for a logger: its own, else its nearest configured ancestor's, else the default rate.
+        '''
+
+        rate = self._rates.get(name)
+        if rate is None:
+            ancestor = name
+            while ancestor not in self.sample_rates and '.' in ancestor:
+                ancestor = ancestor.rsplit('.', 1)[0]
+
+            rate = self.sample_rates.get(ancestor, self.default_rate)
+
+            if len(self._rates) >= SAMPLER_MAX_TEMPLATES:
+                self._rates.clear()
+            self._rates[name] = rate
+
+        return rate
+
+    def summarize(self):
+        '''
+        Collect (and reset) the counts of suppressed records whose template hasn't gotten through since.
+        Returns a dict of (logger name, message template) -> count.
+        '''
+
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, {}
+
+        return suppressed
+
+def configure_logger(logger, log_format='text', buffer_size=0, flush_interval=1.0, stream=None, **fields):
+    '''
+    Attach a crimsoncore handler to a logger, replacing any attached earlier, and stop its records
+      from propagating to the root logger (and the Lambda runtime's handler) as well.
+    log_format is "text" or "json"; JSON records include the given fields (e.g. script name, log group, log stream).
+    A buffer_size of zero writes each record straight away instead of buffering.
+
+    Returns the handler.
+    '''
+
+    if log_format == 'json':
+        formatter = JsonFormatter(**fields)
+    else:
+        formatter = logging.Formatter('[%(levelname)s]\t%(asctime)s\t%(name)s\t%(message)s')
+
+    if buffer_size > 0:
+        handler = BufferedLogHandler(stream=stream, buffer_size=buffer_size, flush_interval=flush_interval)
+    else:
+        handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    handler.setFormatter(formatter)
+
+    for existing in [existing for existing in logger.handlers if existing in _CONFIGURED_HANDLERS]:
+        logger.removeHandler(existing)
+        existing.close()
+
+    logger.addHandler(handler)
+    logger.propagate = False
+    _CONFIGURED_HANDLERS.add(handler)
+
+    return handler
+
+def flush_buffered_handlers():
+    '''
+    Write out the records held by every live BufferedLogHandler.
+    Runs at interpreter exit, as a last resort for records never flushed by the handler itself.
+    '''
+
+    for handler in list(_BUFFERED_HANDLERS):
+        handler.flush()
+
+atexit.register(flush_buffered_handlers)
+
+def flush_logger(logger):
+    '''
+    Flush every handler attached to a logger.
+    '''
+
+    for handler in logger.handlers:
+        handler.flush()
+
+def bind_log_fields(logger, **fields):
+    '''
+    Set (or replace) fields included in every JSON record written by the crimsoncore handler attached to a logger.
+    '''
+
+    for handler in logger.handlers:
+        if handler in _CONFIGURED_HANDLERS and isinstance(handler.formatter, JsonFormatter):
+            # records already buffered were logged under the previous fields
+            handler.flush()
+            handler.formatter.bind(**fields)
+
+def configure_sampler(handlers, sampler):
+    '''
+    Attach a LogSampler to the given handlers, detaching the one attached earlier from wherever it was
+      (a sampler of None just detaches).
+    Handler filters see every record the handler writes, including those propagated from child loggers -
+      unlike logger filters, which only see records logged directly on that logger.
+    '''
+
+    # checked first, as this runs for every LambdaCore and iterating even an empty WeakSet isn't free
+    if _SAMPLED_HANDLERS:
+        for handler in list(_SAMPLED_HANDLERS):
+            for existing in [existing for existing in handler.filters if getattr(existing, 'crimsoncore_filter', False)]:
+                handler.removeFilter(existing)
+        _SAMPLED_HANDLERS.clear()
+
+    if sampler is None:
+        return
+
+    for handler in handlers:
+        handler.addFilter(sampler)
+        _SAMPLED_HANDLERS.add(handler)
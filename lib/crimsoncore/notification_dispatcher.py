@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# Background notification dispatch module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from collections import deque
+import logging
+import queue
+import threading
+
+# sns:PublishBatch limits
+PUBLISH_BATCH_MAX_ENTRIES = 10
+PUBLISH_BATCH_MAX_BYTES = 256 * 1024
+
+# maximum number of dispatch errors held on to between flushes
+MAX_DISPATCH_ERRORS = 100
+
+def build_publish_batches(messages, max_entries=PUBLISH_BATCH_MAX_ENTRIES, max_bytes=PUBLISH_BATCH_MAX_BYTES):
+    '''
+    Group messages into batches that fit within the PublishBatch entry count and total payload size limits.
+    Messages are kept in order; a single oversized message ends up in a batch of its own.
+    '''
+
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for message in messages:
+        message_bytes = len(message.encode('utf-8'))
+        if batch and (len(batch) >= max_entries or batch_bytes + message_bytes > max_bytes):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+
+        batch.append(message)
+        batch_bytes += message_bytes
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+def collect_publish_batch_results(batch, response):
+    '''
+    Match a PublishBatch response's Successful and Failed entries up with the batch's messages (whose entry Ids are their indexes).
+    Messages that failed through the sender's own fault - or that the response doesn't report on at all - get an error result.
+
+    Returns a tuple of (list of per-message result dicts, list of indexes of the messages worth retrying individually);
+      the results for the messages to retry are left as None.
+    '''
+
+    results = [None] * len(batch)
+    for entry in response.get('Successful', []):
+        results[int(entry['Id'])] = {'message_id': entry['MessageId'], 'error': None, 'retried': False}
+
+    retries = []
+    for entry in response.get('Failed', []):
+        i = int(entry['Id'])
+        if entry.get('SenderFault'):
+            # the request itself was bad - trying again won't help
+            results[i] = {'message_id': None, 'error': f'{entry.get("Code")}: {entry.get("Message")}', 'retried': False}
+        else:
+            retries.append(i)
+
+    for i, result in enumerate(results):
+        if result is None and i not in retries:
+            results[i] = {'message_id': None, 'error': f'PublishBatch response did not report on entry {i}', 'retried': False}
+
+    return results, retries
+
+class NotificationDispatcher:
+    '''
+    Bounded queue of notifications drained by a pool of worker threads.
+    Submitting blocks once the queue is full (back-pressure); flush() must be called before the handler returns,
+      as Lambda freezes background threads between invocations.
+    If batch_size is greater than 1, the handler is called with a list of up to batch_size queued items instead.
+    Dispatch errors are collected until the next flush(), which hands them over to last_errors.
+    '''
+
+    def __init__(self, handler, max_queue_size=100, max_workers=4, batch_size=1, logger=None):
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._max_workers = max_workers
+        self._batch_size = batch_size
+        self._workers = []
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pending = 0
+
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+
+        self.errors = deque(maxlen=MAX_DISPATCH_ERRORS)
+        self.last_errors = []
+
+    def submit(self, item, timeout=None):
+        '''
+        Queue an item for dispatch.
+        Blocks while the queue is full; raises queue.Full if it is still full after timeout seconds.
+        '''
+
+        with self._lock:
+            self._start_workers()
+            self._pending += 1
+
+        try:
+            self._queue.put(item, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending -= 1
+                self._done.notify_all()
+            raise
+
+    def flush(self, timeout=None):
+        '''
+        Wait for all queued items to be dispatched.
+        Returns False if items were still pending after timeout seconds, or if any dispatch failed since the last flush
+          (those errors are moved to last_errors - only the most recent MAX_DISPATCH_ERRORS are kept).
+        '''
+
+        with self._lock:
+            done = self._done.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+            self.last_errors = list(self.errors)
+            self.errors.clear()
+
+            return done and not self.last_errors
+
+    def pending(self):
+        '''
+        Get the number of items queued or in flight.
+        '''
+
+        with self._lock:
+            return self._pending
+
+    def _start_workers(self):
+        '''
+        Start worker threads on first use.
+        (must be called with the lock held)
+        '''
+
+        while len(self._workers) < self._max_workers:
+            worker = threading.Thread(target=self._work, name=f'crimsoncore-notifications-{len(self._workers)}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        '''
+        Worker thread loop.
+        '''
+
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self._batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._handler(items if self._batch_size > 1 else items[0])
+            except Exception as ex: # pylint: disable=W0703
+                self.logger.exception('Failed to dispatch notification')
+                with self._lock:
+                    self.errors.append(ex)
+            finally:
+                with self._lock:
+                    self._pending -= len(items)
+                    self._done.notify_all()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# SSM parameter cache module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+import time
+
+class ParameterCache:
+    '''
+    Bounded, thread-safe TTL + LRU cache for SSM parameter values.
+    Intended to live at module level so that warm Lambda containers can serve repeated reads from memory.
+
+    Entries may also be given a stale window past their TTL, during which get_or_load() serves the stale value
+      immediately while refreshing it in the background (stale-while-revalidate).
+
+    Entries may carry metadata about the cached value (e.g. the parameter's version), so that callers can tell
+      which values have changed at the source without refetching all of them.
+    '''
+
+    def __init__(self, max_entries=256, clock=None, refresh_workers=2, logger=None):
+        self._entries = OrderedDict()
+        self._metadata = {}
+        self._lock = threading.Lock()
+        self._clock = clock if clock is not None else time.monotonic
+        self._inflight = {}
+        self._refresh_workers = refresh_workers
+        self._refresh_executor = None
+
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def resize(self, max_entries):
+        '''
+        Change the maximum number of entries held, evicting the least recently used entries if necessary.
+        '''
+
+        # called for every LambdaCore constructed, almost always with the size already in effect
+        if max_entries == self.max_entries:
+            return
+
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def get(self, key, count=True):
+        '''
+        Get a cached value, or None if it is missing or expired.
+        '''
+
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None or entry[1] <= self._clock():
+                if count:
+                    self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+
+            return entry[0]
+
+    def set(self, key, value, ttl, stale_ttl=0, metadata=None):
+        '''
+        Store a value for the given number of seconds.
+        A ttl of zero (or less) means the value is not cached at all.
+        stale_ttl is how much longer get_or_load() may serve the value (while refreshing it) once ttl has passed.
+        If metadata is given, it replaces whatever metadata the entry had; otherwise any existing metadata is kept.
+        '''
+
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            fresh_until = self._clock() + ttl
+            self._entries[key] = (value, fresh_until, fresh_until + max(stale_ttl, 0))
+            self._entries.move_to_end(key)
+            if metadata is not None:
+                self._metadata[key] = metadata
+            self._evict()
+
+    def metadata(self, key):
+        '''
+        Get the metadata stored alongside a cached value, or None if there is none.
+        '''
+
+        with self._lock:
+            if self._lookup(key) is None:
+                return None
+
+            return self._metadata.get(key)
+
+    def items(self, prefix=None):
+        '''
+        Get a list of (key, value, metadata) for every entry that's still servable (fresh or stale),
+          optionally only those whose name starts with prefix.
+        Does not count as a cache access.
+        '''
+
+        with self._lock:
+            now = self._clock()
+            return [
+                (key, entry[0], self._metadata.get(key))
+                for key, entry in self._entries.items()
+                if entry[2] > now and (prefix is None or key[0].startswith(prefix))
+            ]
+
+    def get_or_load(self, key, loader, ttl, stale_ttl=0, with_metadata=False):
+        '''
+        Get a cached value, calling loader() to fetch it if necessary.
+        If with_metadata is True, loader() returns a tuple of (value, metadata) instead of just the value.
+
+        Fresh values are returned as-is.
+        Values past ttl but still within stale_ttl are returned immediately, and refreshed in the background.
+        Missing or fully expired values are loaded synchronously.
+        Concurrent loads of the same key are coalesced into a single loader() call (single-flight).
+
+        Returns a tuple of (value, state), where state is one of 'hit', 'stale' or 'miss'.
+        '''
+
+        with self._lock:
+            entry = self._lookup(key)
+            now = self._clock()
+            if entry is not None and now < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], 'hit'
+
+            if entry is not None:
+                # within the stale window - serve what we have, refresh in the background
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._inflight[key] = Future()
+                    self._refresher().submit(self._load, key, loader, ttl, stale_ttl, with_metadata, True)
+                return entry[0], 'stale'
+
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if leader:
+            self._load(key, loader, ttl, stale_ttl, with_metadata)
+
+        return future.result(), 'miss'
+
+    def _load(self, key, loader, ttl, stale_ttl, with_metadata=False, background=False):
+        '''
+        Call the loader for a key, store the result, and hand it to anyone waiting on the in-flight load.
+        '''
+
+        with self._lock:
+            future = self._inflight[key]
+
+        try:
+            value, metadata = loader() if with_metadata else (loader(), None)
+        except Exception as ex: # pylint: disable=W0703
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(ex)
+
+            # synchronous failures are raised to the caller; background ones would otherwise vanish
+            if background:
+                self.logger.warning('Background refresh failed for cached parameter %s', key[0] if isinstance(key, tuple) else key, exc_info=True)
+            return
+
+        self.set(key, value, ttl, stale_ttl, metadata)
+        with self._lock:
+            self.refreshes += 1
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def _refresher(self):
+        '''
+        Get the executor used for background refreshes, creating it if necessary.
+        (must be called with the lock held)
+        '''
+
+        if self._refresh_executor is None:
+            self._refresh_executor = ThreadPoolExecutor(max_workers=self._refresh_workers, thread_name_prefix='crimsoncore-parameter-refresh')
+
+        return self._refresh_executor
+
+    def _lookup(self, key):
+        '''
+        Get the raw entry for a key, dropping it if it has fully expired.
+        (must be called with the lock held)
+        '''
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] <= self._clock():
+            del self._entries[key]
+            self._metadata.pop(key, None)
+            entry = None
+
+        return entry
+
+    def invalidate(self, name=None):
+        '''
+        Drop cached values.
+        If a parameter name is given, only entries for that name are dropped (regardless of the encrypted flag);
+          otherwise, the entire cache is cleared.
+        '''
+
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                self._metadata.clear()
+                return
+
+            for key in [key for key in self._entries if key[0] == name]:
+                del self._entries[key]
+                self._metadata.pop(key, None)
+
+    def stats(self):
+        '''
+        Get the cache's hit/miss counters.
+        '''
+
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions
+            }
+
+    def reset_stats(self):
+        '''
+        Reset the cache's hit/miss counters.
+        '''
+
+        with self._lock:
+            self.hits = 0
+            self.stale_hits = 0
+            self.misses = 0
+            self.refreshes = 0
+            self.evictions = 0
+
+    def _evict(self):
+        '''
+        Evict least recently used entries until we're within our bounds.
+        (must be called with the lock held)
+        '''
+
+        while len(self._entries) > max(self.max_entries, 0):
+            key, _ = self._entries.popitem(last=False)
+            self._metadata.pop(key, None)
+            self.evictions += 1
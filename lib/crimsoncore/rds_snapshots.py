@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# RDS snapshot bulk operations module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from crimsoncore.ec2_inventory import build_filters
+
+# maximum number of values accepted by a single rds describe filter
+DESCRIBE_FILTER_MAX_VALUES = 100
+
+# snapshot statuses that will never become available
+FAILED_SNAPSHOT_STATUSES = ('failed', 'incompatible-restore', 'incompatible-parameters')
+
+# how long (in seconds) before the invocation's deadline to stop waiting on long-running operations
+LAMBDA_TIMEOUT_MARGIN = 10
+
+class RdsSnapshots:
+    '''
+    RDS instance listing and bulk snapshot operations for a LambdaCore, using its RDS client and configuration.
+    Reached through LambdaCore.rds_snapshots.
+    get_client builds a (pooled) RDS client for another region, given its region_name.
+    '''
+
+    def __init__(self, core, get_client):
+        self.core = core
+        self.get_client = get_client
+
+    def iter_instances(self, filters=None, **kwargs):
+        '''
+        Page through RDS DB instances, with filters (a dict of filter name -> value(s)) applied server-side.
+        '''
+
+        return iter_db_instances(self.core.rds, filters=filters, **kwargs)
+
+    def iter_snapshots(self, filters=None, **kwargs):
+        '''
+        Page through RDS DB snapshots, with filters (a dict of filter name -> value(s)) applied server-side.
+        Extra keyword arguments (e.g. DBInstanceIdentifier, SnapshotType) are passed on to DescribeDBSnapshots.
+        '''
+
+        return iter_db_snapshots(self.core.rds, filters=filters, **kwargs)
+
+    def create_snapshots(self, snapshots, tags=None, wait=False, context=None):
+        '''
+        Create several RDS DB snapshots concurrently.
+        snapshots is a dict of snapshot id -> DB instance id; tags is an optional dict of tag key -> value.
+        If wait is True, all of the snapshots are then polled together until they're available
+          (for up to RDS_POLL_TIMEOUT seconds, or until shortly before the given Lambda context's invocation times out).
+        In safe mode, nothing is created.
+
+        Returns a dict of snapshot id -> {'status', 'error'}.
+        '''
+
+        client = self.core.rds
+        tag_list = [{'Key': key, 'Value': value} for key, value in (tags or {}).items()]
+
+        def create(snapshot_id, instance_id):
+            return lambda: client.create_db_snapshot(DBSnapshotIdentifier=snapshot_id, DBInstanceIdentifier=instance_id, Tags=tag_list)
+
+        results = self._request('create', {snapshot_id: create(snapshot_id, instance_id) for snapshot_id, instance_id in snapshots.items()})
+
+        return self._wait('create', client, results, context=context) if wait else results
+
+    def copy_snapshots(self, snapshots, destination_region=None, kms_key_id=None, copy_tags=True, wait=False, context=None):
+        '''
+        Copy several RDS DB snapshots concurrently, optionally into another region.
+        snapshots is a dict of target snapshot id -> source snapshot identifier (which must be an ARN when copying across regions).
+        Cross-region copies are requested through a pooled client in the destination region.
+        If wait is True, all of the copies are then polled together until they're available
+          (for up to RDS_POLL_TIMEOUT seconds, or until shortly before the given Lambda context's invocation times out).
+        In safe mode, nothing is copied.
+
+        Returns a dict of target snapshot id -> {'status', 'error'}.
+        '''
+
+        source_region = self.core.config.get_aws_region()
+        destination_region = destination_region or source_region
+
+        client = self.core.rds
+        options = {'CopyTags': copy_tags}
+        if kms_key_id:
+            options['KmsKeyId'] = kms_key_id
+
+        if destination_region != source_region:
+            client = self.get_client(region_name=destination_region)
+            # botocore builds the presigned URL for the source region from this
+            options['SourceRegion'] = source_region
+
+        def copy(target_id, source_id):
+            return lambda: client.copy_db_snapshot(SourceDBSnapshotIdentifier=source_id, TargetDBSnapshotIdentifier=target_id, **options)
+
+        results = self._request('copy', {target_id: copy(target_id, source_id) for target_id, source_id in snapshots.items()})
+
+        return self._wait('copy', client, results, context=context) if wait else results
+
+    def delete_snapshots(self, snapshot_ids, wait=False, context=None):
+        '''
+        Delete several RDS DB snapshots concurrently.
+        If wait is True, all of the snapshots are then polled together until they're gone
+          (for up to RDS_POLL_TIMEOUT seconds, or until shortly before the given Lambda context's invocation times out).
+        In safe mode, nothing is deleted.
+
+        Returns a dict of snapshot id -> {'status', 'error'}.
+        '''
+
+        client = self.core.rds
+
+        def delete(snapshot_id):
+            return lambda: client.delete_db_snapshot(DBSnapshotIdentifier=snapshot_id)
+
+        results = self._request('delete', {snapshot_id: delete(snapshot_id) for snapshot_id in snapshot_ids})
+
+        return self._wait('delete', client, results, deleted=True, context=context) if wait else results
+
+    def _request(self, action, calls):
+        '''
+        Run RDS snapshot API calls concurrently, honoring safe mode.
+        calls is a dict of snapshot id -> function making the API call.
+        '''
+
+        if self.core.config.get_safe_mode():
+            self.core.logger.info('Safe mode enabled - would %s RDS snapshots: %s', action, ', '.join(sorted(calls)))
+            return {snapshot_id: {'status': 'skipped', 'error': None} for snapshot_id in calls}
+
+        with self.core.metrics.timer(f'rds.snapshots.{action}'):
+            errors = run_concurrently(list(calls.items()), concurrency=self.core.config.get_int('RDS_WORKERS', 4, minimum=1))
+
+        results = {}
+        for snapshot_id, error in errors.items():
+            if error is not None:
+                self.core.logger.warning('Failed to %s RDS snapshot %s: %s', action, snapshot_id, error)
+                results[snapshot_id] = {'status': 'error', 'error': str(error)}
+            else:
+                results[snapshot_id] = {'status': 'requested', 'error': None}
+
+        return results
+
+    def _wait(self, action, client, results, deleted=False, context=None):
+        '''
+        Poll the successfully-requested snapshots until they settle, updating their results with their final status.
+        Snapshots still pending when polling stops are left with the status "timeout".
+        '''
+
+        requested = [snapshot_id for snapshot_id, result in results.items() if result['status'] == 'requested']
+        if not requested:
+            return results
+
+        timeout = self.core.config.get_float('RDS_POLL_TIMEOUT', 600, minimum=0)
+        if context is not None:
+            # stop in time to hand back what's still pending, rather than being killed mid-poll
+            timeout = min(timeout, context.get_remaining_time_in_millis() / 1000 - LAMBDA_TIMEOUT_MARGIN)
+
+        with self.core.metrics.timer(f'rds.snapshots.{action}.wait'):
+            statuses = wait_for_snapshots(
+                client,
+                requested,
+                deleted=deleted,
+                interval=self.core.config.get_float('RDS_POLL_INTERVAL', 30, minimum=0),
+                timeout=timeout,
+                logger=self.core.logger
+            )
+
+        for snapshot_id, status in statuses.items():
+            results[snapshot_id]['status'] = status
+
+        return results
+
+def iter_db_instances(client, filters=None, **kwargs):
+    '''
+    Page through RDS DB instances, with the filters (a dict of filter name -> value(s), or a Filters list) applied server-side.
+    Yields the raw DB instance dicts.
+    '''
+
+    if filters:
+        kwargs['Filters'] = build_filters(filters)
+
+    for page in client.get_paginator('describe_db_instances').paginate(**kwargs):
+        yield from page.get('DBInstances', [])
+
+def iter_db_snapshots(client, filters=None, **kwargs):
+    '''
+    Page through RDS DB snapshots, with the filters (a dict of filter name -> value(s), or a Filters list) applied server-side.
+    Extra keyword arguments (e.g. DBInstanceIdentifier, SnapshotType) are passed on to DescribeDBSnapshots.
+    Yields the raw DB snapshot dicts.
+    '''
+
+    if filters:
+        kwargs['Filters'] = build_filters(filters)
+
+    for page in client.get_paginator('describe_db_snapshots').paginate(**kwargs):
+        yield from page.get('DBSnapshots', [])
+
+def run_concurrently(calls, concurrency=4):
+    '''
+    Run (key, function) calls with up to concurrency of them at once.
+    Returns a dict of key -> exception raised by the call, or None if it succeeded.
+    '''
+
+    if not calls:
+        return {}
+
+    def run(call):
+        try:
+            call()
+        except Exception as ex: # pylint: disable=W0703
+            return ex
+
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(min(concurrency, len(calls)), 1), thread_name_prefix='crimsoncore-rds') as executor:
+        return dict(zip([key for key, _ in calls], executor.map(run, [call for _, call in calls])))
+
+def wait_for_snapshots(client, snapshot_ids, deleted=False, interval=30, timeout=3600, clock=None, sleep=None, logger=None):
+    '''
+    Poll many DB snapshots at once until they're all available (or all gone, if deleted is True).
+    Each round describes every still-pending snapshot using db-snapshot-id filters of up to 100 ids per call,
+      instead of running one waiter per snapshot.
+
+    Returns a dict of snapshot id -> final status: "available", "deleted", "failed" (or another failed status),
+      or "timeout" if the snapshot was still pending once timeout seconds had passed.
+    '''
+
+    clock = clock if clock is not None else time.monotonic
+    sleep = sleep if sleep is not None else time.sleep
+    logger = logger if logger is not None else logging.getLogger(__name__)
+
+    pending = set(snapshot_ids)
+    results = {}
+    deadline = clock() + timeout
+    while pending:
+        settled = _settle_snapshots(sorted(pending), _describe_snapshot_statuses(client, pending), deleted, logger)
+        results.update(settled)
+        pending.difference_update(settled)
+
+        if not pending:
+            break
+
+        if clock() + interval > deadline:
+            for snapshot_id in pending:
+                logger.warning('Timed out waiting on RDS snapshot %s', snapshot_id)
+                results[snapshot_id] = 'timeout'
+            break
+
+        logger.debug('Waiting on %d RDS snapshots', len(pending))
+        sleep(interval)
+
+    return results
+
+def _describe_snapshot_statuses(client, snapshot_ids):
+    '''
+    Describe DB snapshots using db-snapshot-id filters of up to 100 ids per call.
+    Returns a dict of snapshot id -> status, for the snapshots that still exist.
+    '''
+
+    snapshot_ids = sorted(snapshot_ids)
+
+    statuses = {}
+    for i in range(0, len(snapshot_ids), DESCRIBE_FILTER_MAX_VALUES):
+        for snapshot in iter_db_snapshots(client, filters={'db-snapshot-id': snapshot_ids[i:i + DESCRIBE_FILTER_MAX_VALUES]}):
+            statuses[snapshot['DBSnapshotIdentifier']] = snapshot['Status']
+
+    return statuses
+
+def _settle_snapshots(snapshot_ids, statuses, deleted, logger):
+    '''
+    Pick out the snapshots that have reached a final status.
+    Returns a dict of snapshot id -> final status.
+    '''
+
+    settled = {}
+    for snapshot_id in snapshot_ids:
+        status = statuses.get(snapshot_id)
+        if deleted and status is None:
+            settled[snapshot_id] = 'deleted'
+        elif not deleted and status == 'available':
+            settled[snapshot_id] = status
+        elif status in FAILED_SNAPSHOT_STATUSES:
+            logger.warning('RDS snapshot %s entered status %s', snapshot_id, status)
+            settled[snapshot_id] = status
+
+    return settled
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# S3 bulk listing and deletion module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+
+# maximum number of keys accepted by a single s3:DeleteObjects call
+DELETE_OBJECTS_MAX_KEYS = 1000
+
+# marks the end of a shard's listing on the results queue
+_SHARD_DONE = object()
+
+class S3Bulk:
+    '''
+    Bulk S3 listing and deletion for a LambdaCore, using its S3 client and configuration.
+    Reached through LambdaCore.s3_bulk.
+    '''
+
+    def __init__(self, core):
+        self.core = core
+
+    def iter_objects(self, bucket, prefix='', include_global_prefix=True, include_application_name=True, include_environment=False, delimiter=None, shards=None, workers=None, **kwargs):
+        '''
+        List the objects under a prefix in an S3 bucket, paging through several shards of the listing concurrently.
+        Shards are either given explicitly (a list of prefixes) or discovered from the common prefixes found with delimiter.
+        Yields the object dicts returned by ListObjectsV2 as they arrive; objects are only ordered within a shard.
+        '''
+
+        return iter_objects(
+            self.core.s3,
+            self.core.config.build_bucket_name(bucket, include_global_prefix, include_application_name, include_environment),
+            prefix=prefix,
+            delimiter=delimiter,
+            shards=shards,
+            concurrency=workers or self.core.config.get_int('S3_BULK_WORKERS', 4, minimum=1),
+            **kwargs
+        )
+
+    def delete_objects(self, bucket, objects, include_global_prefix=True, include_application_name=True, include_environment=False, workers=None):
+        '''
+        Delete objects from an S3 bucket in concurrent DeleteObjects batches of up to 1000 keys.
+        objects is an iterable of keys or object dicts (such as those yielded by iter_objects).
+        In safe mode, nothing is deleted - the objects that would have been are only counted.
+
+        Returns a dict of {'deleted': count, 'errors': list of per-key error dicts}.
+        '''
+
+        bucket_name = self.core.config.build_bucket_name(bucket, include_global_prefix, include_application_name, include_environment)
+        safe_mode = self.core.config.get_safe_mode()
+
+        with self.core.metrics.timer('s3.delete'):
+            result = delete_objects(
+                self.core.s3,
+                bucket_name,
+                objects,
+                concurrency=workers or self.core.config.get_int('S3_BULK_WORKERS', 4, minimum=1),
+                dry_run=safe_mode,
+                logger=self.core.logger
+            )
+
+        if safe_mode:
+            self.core.logger.info('Safe mode enabled - would have deleted %d objects from s3://%s', result['deleted'], bucket_name)
+        else:
+            self.core.logger.info('Deleted %d objects from s3://%s (%d failed)', result['deleted'], bucket_name, len(result['errors']))
+            self.core.metrics.count('s3.deleted', result['deleted'])
+
+        return result
+
+    def delete_prefix(self, bucket, prefix, include_global_prefix=True, include_application_name=True, include_environment=False, delimiter=None, shards=None, workers=None):
+        '''
+        Delete every object under a prefix in an S3 bucket, streaming the (sharded) listing straight into batched deletes.
+        In safe mode, nothing is deleted - the objects that would have been are only counted.
+        '''
+
+        return self.delete_objects(
+            bucket,
+            self.iter_objects(
+                bucket,
+                prefix,
+                include_global_prefix=include_global_prefix,
+                include_application_name=include_application_name,
+                include_environment=include_environment,
+                delimiter=delimiter,
+                shards=shards,
+                workers=workers
+            ),
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            workers=workers
+        )
+
+def iter_objects(client, bucket, prefix='', delimiter=None, shards=None, concurrency=4, **kwargs):
+    '''
+    List the objects under a prefix, splitting the listing into shards that are paged through concurrently.
+    Yields the object dicts returned by ListObjectsV2 (Key, Size, ETag, LastModified...) as they arrive;
+      objects are only ordered within a shard.
+
+    Shards are either given explicitly (a list of prefixes), or discovered by first listing the prefix with a delimiter
+      (each common prefix becomes a shard). With neither, the prefix is listed as a single shard.
+    Extra keyword arguments (e.g. RequestPayer) are passed on to ListObjectsV2.
+    '''
+
+    paginator = client.get_paginator('list_objects_v2')
+
+    if shards is None and delimiter:
+        shards = []
+        yield from _discover_shards(paginator, shards, Bucket=bucket, Prefix=prefix, Delimiter=delimiter, **kwargs)
+    elif shards is None:
+        shards = [prefix]
+
+    if len(shards) > 1 and concurrency > 1:
+        yield from _iter_shards_concurrently(paginator, bucket, shards, concurrency, kwargs)
+        return
+
+    for shard in shards:
+        for page in paginator.paginate(Bucket=bucket, Prefix=shard, **kwargs):
+            yield from page.get('Contents', [])
+
+def _discover_shards(paginator, shards, **request):
+    '''
+    List a prefix with a delimiter, adding each common prefix found to shards.
+    Yields the objects listed directly under the prefix.
+    '''
+
+    for page in paginator.paginate(**request):
+        shards.extend(common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', []))
+        yield from page.get('Contents', [])
+
+def _iter_shards_concurrently(paginator, bucket, shards, concurrency, kwargs):
+    '''
+    Page through several shards of a listing concurrently, yielding their objects as they arrive.
+    '''
+
+    # pages are handed over through a bounded queue, so that listing can't run too far ahead of the consumer
+    results = queue.Queue(maxsize=concurrency * 2)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def list_shard(shard):
+        try:
+            for page in paginator.paginate(Bucket=bucket, Prefix=shard, **kwargs):
+                if not put(page.get('Contents', [])):
+                    return
+        except Exception as ex: # pylint: disable=W0703
+            put(ex)
+        finally:
+            put(_SHARD_DONE)
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(shards)), thread_name_prefix='crimsoncore-s3-list') as executor:
+        try:
+            for shard in shards:
+                executor.submit(list_shard, shard)
+
+            remaining = len(shards)
+            while remaining:
+                item = results.get()
+                if item is _SHARD_DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield from item
+        finally:
+            # lets the listing threads wind down (after their current request) if the consumer stops early
+            stop.set()
+
+def delete_objects(client, bucket, objects, concurrency=4, dry_run=False, logger=None, **kwargs):
+    '''
+    Delete objects in DeleteObjects batches of up to 1000 keys, with up to concurrency batches in flight at once.
+    objects is an iterable of keys, or of object dicts with a Key (and optionally a VersionId) - such as those
+      yielded by iter_objects(); it is consumed lazily.
+    If dry_run is True, nothing is deleted; the objects are only counted.
+    Extra keyword arguments (e.g. MFA, BypassGovernanceRetention) are passed on to DeleteObjects.
+
+    Returns a dict of {'deleted': count, 'errors': list of per-key error dicts (Key, Code, Message)}.
+    '''
+
+    batches = _build_delete_batches(objects)
+
+    if dry_run:
+        return {'deleted': sum(len(batch) for batch in batches), 'errors': []}
+
+    def delete_batch(batch):
+        response = client.delete_objects(Bucket=bucket, Delete={'Objects': batch, 'Quiet': True}, **kwargs)
+
+        # quiet mode only reports failures
+        return len(batch), response.get('Errors', [])
+
+    result = {'deleted': 0, 'errors': []}
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='crimsoncore-s3-delete') as executor:
+        for batch in batches:
+            # bounds how many batches are built ahead of the deletes
+            if len(pending) >= max(concurrency, 1):
+                _record_deletes(result, *pending.popleft().result(), bucket=bucket, logger=logger)
+
+            pending.append(executor.submit(delete_batch, batch))
+
+        while pending:
+            _record_deletes(result, *pending.popleft().result(), bucket=bucket, logger=logger)
+
+    return result
+
+def _record_deletes(result, count, errors, bucket, logger=None):
+    '''
+    Add the outcome of one DeleteObjects batch to the running totals, logging the keys that failed to delete.
+    '''
+
+    result['deleted'] += count - len(errors)
+    result['errors'].extend(errors)
+
+    if logger is not None:
+        for error in errors:
+            logger.warning('Failed to delete s3://%s/%s: %s: %s', bucket, error.get('Key'), error.get('Code'), error.get('Message'))
+
+def _build_delete_batches(objects):
+    '''
+    Group keys (or object dicts) into DeleteObjects-sized lists of ObjectIdentifiers.
+    '''
+
+    batch = []
+    for obj in objects:
+        if isinstance(obj, str):
+            batch.append({'Key': obj})
+        elif obj.get('VersionId'):
+            batch.append({'Key': obj['Key'], 'VersionId': obj['VersionId']})
+        else:
+            batch.append({'Key': obj['Key']})
+
+        if len(batch) >= DELETE_OBJECTS_MAX_KEYS:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
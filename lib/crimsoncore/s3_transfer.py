@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# S3 transfer module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# s3 multipart upload limits
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+
+# upload arguments that S3 also needs on the later calls of a multipart upload (e.g. the SSE-C key, on every part)
+UPLOAD_PART_ARGS = ('SSECustomerAlgorithm', 'SSECustomerKey', 'SSECustomerKeyMD5', 'RequestPayer', 'ExpectedBucketOwner', 'ChecksumAlgorithm')
+COMPLETE_MULTIPART_UPLOAD_ARGS = ('SSECustomerAlgorithm', 'SSECustomerKey', 'SSECustomerKeyMD5', 'RequestPayer', 'ExpectedBucketOwner')
+ABORT_MULTIPART_UPLOAD_ARGS = ('RequestPayer', 'ExpectedBucketOwner')
+
+class S3Transfer:
+    '''
+    Concurrent S3 transfers for a LambdaCore, using its S3 client and configuration.
+    Reached through LambdaCore.s3_transfer.
+    '''
+
+    def __init__(self, core):
+        self.core = core
+
+    def iter_object(self, bucket, key, include_global_prefix=True, include_application_name=True, include_environment=False, part_size=None, concurrency=None, **kwargs):
+        '''
+        Stream an S3 object using concurrent ranged GETs, without holding the whole object in memory.
+        Yields memoryview chunks of up to S3_TRANSFER_PART_SIZE bytes, in order.
+        Extra keyword arguments are passed on to HeadObject and GetObject.
+        '''
+
+        return iter_object(
+            self.core.s3,
+            self.core.config.build_bucket_name(bucket, include_global_prefix, include_application_name, include_environment),
+            key,
+            **self._options(part_size, concurrency),
+            **kwargs
+        )
+
+    def download_object(self, bucket, key, fileobj, include_global_prefix=True, include_application_name=True, include_environment=False, part_size=None, concurrency=None, **kwargs):
+        '''
+        Download an S3 object into a writable file-like object using concurrent ranged GETs.
+        Returns the number of bytes written.
+        '''
+
+        with self.core.metrics.timer('s3.download'):
+            return download_object(
+                self.core.s3,
+                self.core.config.build_bucket_name(bucket, include_global_prefix, include_application_name, include_environment),
+                key,
+                fileobj,
+                **self._options(part_size, concurrency),
+                **kwargs
+            )
+
+    def upload_object(self, bucket, key, fileobj, include_global_prefix=True, include_application_name=True, include_environment=False, part_size=None, concurrency=None, **kwargs):
+        '''
+        Upload the contents of a readable file-like object to S3.
+        Anything larger than S3_TRANSFER_PART_SIZE is sent as a concurrent multipart upload, so its size needn't be known up front.
+        Extra keyword arguments (e.g. ContentType) are passed on to PutObject / CreateMultipartUpload.
+        Returns the ETag of the uploaded object.
+        '''
+
+        with self.core.metrics.timer('s3.upload'):
+            return upload_object(
+                self.core.s3,
+                self.core.config.build_bucket_name(bucket, include_global_prefix, include_application_name, include_environment),
+                key,
+                fileobj,
+                **self._options(part_size, concurrency),
+                **kwargs
+            )
+
+    def _options(self, part_size, concurrency):
+        '''
+        Fill in the part size and concurrency of a transfer from the configuration, where not given.
+        '''
+
+        return {
+            'part_size': part_size or self.core.config.get_int('S3_TRANSFER_PART_SIZE', 8 * 1024 * 1024, minimum=1),
+            'concurrency': concurrency or self.core.config.get_int('S3_TRANSFER_CONCURRENCY', 4, minimum=1)
+        }
+
+def iter_object(client, bucket, key, part_size, concurrency=4, size=None, **kwargs):
+    '''
+    Stream an S3 object as a series of ranged GETs, up to concurrency of them in flight at once.
+    Yields memoryview chunks of up to part_size bytes, in order; only about concurrency chunks are held in memory at a time.
+    Extra keyword arguments (e.g. VersionId, SSECustomerKey) are passed on to HeadObject and GetObject.
+    '''
+
+    if size is None:
+        head = client.head_object(Bucket=bucket, Key=key, **kwargs)
+        size = head['ContentLength']
+
+        # make sure every range comes from the same version of the object
+        if 'VersionId' not in kwargs and head.get('ETag'):
+            kwargs = dict(kwargs, IfMatch=head['ETag'])
+
+    def fetch(start, end):
+        response = client.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end - 1}', **kwargs)
+
+        buffer = bytearray(end - start)
+        body = response['Body']
+        try:
+            read = _read_into(body, memoryview(buffer))
+        finally:
+            body.close()
+
+        if read < len(buffer):
+            raise IOError(f'Incomplete read of s3://{bucket}/{key} bytes {start}-{end - 1}; got {read} of {len(buffer)} bytes')
+
+        return memoryview(buffer)
+
+    ranges = iter(range(0, size, part_size))
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='crimsoncore-s3-download')
+    pending = deque()
+    try:
+        for start in ranges:
+            pending.append(executor.submit(fetch, start, min(start + part_size, size)))
+            if len(pending) >= concurrency:
+                break
+
+        while pending:
+            chunk = pending.popleft().result()
+
+            start = next(ranges, None)
+            if start is not None:
+                pending.append(executor.submit(fetch, start, min(start + part_size, size)))
+
+            yield chunk
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def download_object(client, bucket, key, fileobj, part_size, concurrency=4, **kwargs):
+    '''
+    Download an S3 object into a writable file-like object using concurrent ranged GETs.
+    Returns the number of bytes written.
+    '''
+
+    written = 0
+    for chunk in iter_object(client, bucket, key, part_size, concurrency=concurrency, **kwargs):
+        fileobj.write(chunk)
+        written += len(chunk)
+
+    return written
+
+def upload_object(client, bucket, key, fileobj, part_size, concurrency=4, **kwargs):
+    '''
+    Upload the contents of a readable file-like object to S3, without needing to know its size up front.
+    Anything smaller than part_size is sent with a single PutObject; anything larger is sent as a multipart upload
+      with up to concurrency parts in flight (and in memory) at once.
+    Failed multipart uploads are aborted, so that their parts don't linger (and get billed).
+    Extra keyword arguments (e.g. ContentType, ServerSideEncryption) are passed on to PutObject / CreateMultipartUpload,
+      and those that apply (e.g. SSECustomerKey, RequestPayer) to UploadPart, CompleteMultipartUpload and AbortMultipartUpload too.
+
+    Returns the ETag of the uploaded object.
+    '''
+
+    part_size = max(part_size, MULTIPART_MIN_PART_SIZE)
+
+    part = _read_part(fileobj, part_size)
+    if len(part) < part_size:
+        return client.put_object(Bucket=bucket, Key=key, Body=part, **kwargs)['ETag']
+
+    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **kwargs)['UploadId']
+    try:
+        parts = _upload_parts(client, bucket, key, upload_id, fileobj, part, part_size, concurrency, _select_args(kwargs, UPLOAD_PART_ARGS))
+
+        return client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+            **_select_args(kwargs, COMPLETE_MULTIPART_UPLOAD_ARGS)
+        )['ETag']
+    except BaseException:
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, **_select_args(kwargs, ABORT_MULTIPART_UPLOAD_ARGS))
+        raise
+
+def _upload_parts(client, bucket, key, upload_id, fileobj, part, part_size, concurrency, part_args):
+    '''
+    Upload the parts of a multipart upload as they're read from a file-like object (starting with the already-read part),
+      with up to concurrency parts in flight (and in memory) at once.
+    Returns the list of uploaded parts, in order, for CompleteMultipartUpload.
+    '''
+
+    def upload_part(part_number, body):
+        response = client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body, **part_args)
+        uploaded = {'PartNumber': part_number, 'ETag': response['ETag']}
+
+        # S3 rejects completing an upload created with a checksum algorithm unless every part lists its checksum
+        if 'ChecksumAlgorithm' in part_args:
+            checksum = f'Checksum{part_args["ChecksumAlgorithm"].upper()}'
+            uploaded[checksum] = response[checksum]
+
+        return uploaded
+
+    parts = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='crimsoncore-s3-upload') as executor:
+        part_number = 1
+        while part:
+            if part_number > MULTIPART_MAX_PARTS:
+                raise ValueError(f'Upload to s3://{bucket}/{key} needs more than {MULTIPART_MAX_PARTS} parts; use a larger part size')
+
+            # bounds how many parts are read ahead of the uploads - and stops reading as soon as a part fails
+            if len(pending) >= max(concurrency, 1):
+                parts.append(pending.popleft().result())
+
+            pending.append(executor.submit(upload_part, part_number, part))
+
+            part = _read_part(fileobj, part_size)
+            part_number += 1
+
+        parts.extend(future.result() for future in pending)
+
+    return parts
+
+def _select_args(kwargs, names):
+    '''
+    Pick out the given keyword arguments, where present.
+    '''
+
+    return {name: kwargs[name] for name in names if name in kwargs}
+
+def _read_part(fileobj, part_size):
+    '''
+    Read up to part_size bytes from a file-like object into a fresh buffer.
+    '''
+
+    buffer = bytearray(part_size)
+    view = memoryview(buffer)
+    read = _read_into(fileobj, view)
+    view.release()
+
+    # trims in place - the buffer can't be resized while a view of it exists
+    del buffer[read:]
+
+    return buffer
+
+def _read_into(stream, view):
+    '''
+    Fill a memoryview from a stream, stopping early only at end of stream.
+    Returns the number of bytes read.
+    '''
+
+    readinto = getattr(stream, 'readinto', None)
+
+    read = 0
+    while read < len(view):
+        if readinto is not None:
+            count = readinto(view[read:])
+        else:
+            data = stream.read(len(view) - read)
+            count = len(data)
+            view[read:read + count] = data
+
+        if not count:
+            break
+
+        read += count
+
+    return read
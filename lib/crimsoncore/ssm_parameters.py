@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# SSM parameter module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+# maximum number of names accepted by a single ssm:GetParameters call
+SSM_GET_PARAMETERS_MAX_NAMES = 10
+
+# maximum page size accepted by ssm:GetParametersByPath
+SSM_GET_PARAMETERS_BY_PATH_MAX_RESULTS = 10
+
+# configuration bundles already loaded into the parameter cache by this process
+LOADED_CONFIG_BUNDLES = set()
+
+# parameter cache lookup state -> metric name
+CACHE_STATE_METRICS = {'hit': 'hits', 'stale': 'stale_hits', 'miss': 'misses'}
+
+# maximum page size accepted by ssm:DescribeParameters
+SSM_DESCRIBE_PARAMETERS_MAX_RESULTS = 50
+
+def parameter_metadata(parameter):
+    '''
+    Get the metadata cached alongside an SSM parameter's value: a tuple of (version, last modified date).
+    '''
+
+    return (parameter.get('Version'), parameter.get('LastModifiedDate'))
+
+class SsmParametersMixin:
+    '''
+    SSM parameter lookups (cached in the shared parameter cache), change tracking and configuration bundles for LambdaCore.
+    Relies on LambdaCore's ssm client, config, logger, metrics, parameter_cache and _parameter_change_callbacks.
+    '''
+
+    def build_parameter_name(self, name, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, legacy_name=False):
+        '''
+        Build the fully-resolved name for an SSM parameter.
+        '''
+
+        builder = self.config.build_legacy_ssm_param_name if legacy_name else self.config.build_ssm_param_name
+
+        return builder(
+            name,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name
+        )
+
+    def get_ssm_parameter(self, name, encrypted=False, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, legacy_name=False, use_cache=True):
+        '''
+        Get an AWS Systems Manager system parameter.
+        Encryption supported.
+        Values are cached for SSM_CACHE_TTL seconds (if set) unless use_cache is False.
+        If SSM_CACHE_STALE_TTL is set, expired values are served for that much longer while being refreshed in the background.
+        '''
+
+        parameter_name = self.build_parameter_name(
+            name,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name,
+            legacy_name=legacy_name
+        )
+
+        def load():
+            ssm_parameter = self.ssm.get_parameter(
+                Name=parameter_name,
+                WithDecryption=encrypted
+            )
+            return ssm_parameter['Parameter']['Value'], parameter_metadata(ssm_parameter['Parameter'])
+
+        if not use_cache:
+            return load()[0]
+
+        value, state = self.parameter_cache.get_or_load(
+            (parameter_name, encrypted),
+            load,
+            self.config.get_int('SSM_CACHE_TTL', 0, minimum=0),
+            self.config.get_int('SSM_CACHE_STALE_TTL', 0, minimum=0),
+            with_metadata=True
+        )
+        self.metrics.count(f'ssm.cache.{CACHE_STATE_METRICS[state]}')
+
+        return value
+
+    def get_ssm_parameters(self, names, encrypted=False, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, legacy_name=False, use_cache=True, max_workers=4):
+        '''
+        Get multiple AWS Systems Manager system parameters at once.
+        Encryption supported.
+        Names are resolved just like get_ssm_parameter and fetched in GetParameters calls of up to 10 names each,
+          with the calls running concurrently.
+
+        Returns a tuple of (dict of name -> value, list of names reported as invalid by SSM).
+        '''
+
+        parameter_names = self._resolve_ssm_parameter_names(
+            names,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name,
+            legacy_name=legacy_name
+        )
+
+        if use_cache:
+            values, missing = self._get_cached_ssm_parameters(parameter_names, encrypted)
+        else:
+            values, missing = {}, list(parameter_names)
+
+        responses = self._fetch_ssm_parameters(missing, encrypted, max_workers)
+
+        return values, self._merge_ssm_parameter_responses(responses, parameter_names, encrypted, values, use_cache)
+
+    def _resolve_ssm_parameter_names(self, names, **name_options):
+        '''
+        Build the fully-resolved names for several SSM parameters.
+        Returns a dict of fully-resolved name -> name as given.
+        '''
+
+        return {self.build_parameter_name(name, **name_options): name for name in names}
+
+    def _get_cached_ssm_parameters(self, parameter_names, encrypted):
+        '''
+        Look SSM parameters up in the parameter cache.
+        Returns a tuple of (dict of name -> cached value, list of fully-resolved names that weren't cached).
+        '''
+
+        values = {}
+        missing = []
+        for parameter_name, name in parameter_names.items():
+            value = self.parameter_cache.get((parameter_name, encrypted))
+            if value is not None:
+                values[name] = value
+            else:
+                missing.append(parameter_name)
+
+        self.metrics.count('ssm.cache.hits', len(values))
+        self.metrics.count('ssm.cache.misses', len(missing))
+
+        return values, missing
+
+    def _merge_ssm_parameter_responses(self, responses, parameter_names, encrypted, values, use_cache):
+        '''
+        Merge the parameters from GetParameters responses into values (a dict of name -> value), caching them if use_cache is True.
+        Returns the list of names reported as invalid by SSM.
+        '''
+
+        ttl = self.config.get_int('SSM_CACHE_TTL', 0, minimum=0)
+        stale_ttl = self.config.get_int('SSM_CACHE_STALE_TTL', 0, minimum=0)
+        invalid = []
+        for response in responses:
+            for parameter in response['Parameters']:
+                values[parameter_names.get(parameter['Name'], parameter['Name'])] = parameter['Value']
+                if use_cache:
+                    self.parameter_cache.set((parameter['Name'], encrypted), parameter['Value'], ttl, stale_ttl, parameter_metadata(parameter))
+
+            invalid.extend(parameter_names.get(parameter_name, parameter_name) for parameter_name in response.get('InvalidParameters', []))
+
+        return invalid
+
+    def _fetch_ssm_parameters(self, parameter_names, encrypted, max_workers=4):
+        '''
+        Fetch fully-resolved SSM parameter names in GetParameters calls of up to 10 names each, running the calls concurrently.
+        Returns the raw GetParameters responses.
+        '''
+
+        chunks = [parameter_names[i:i + SSM_GET_PARAMETERS_MAX_NAMES] for i in range(0, len(parameter_names), SSM_GET_PARAMETERS_MAX_NAMES)]
+
+        if len(chunks) > 1 and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+                return list(executor.map(lambda chunk: self.ssm.get_parameters(Names=chunk, WithDecryption=encrypted), chunks))
+
+        return [self.ssm.get_parameters(Names=chunk, WithDecryption=encrypted) for chunk in chunks]
+
+    def invalidate_ssm_parameter(self, name=None, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, legacy_name=False):
+        '''
+        Drop a cached AWS Systems Manager system parameter.
+        If no name is specified, all cached parameters are dropped.
+        '''
+
+        if name is None:
+            self.parameter_cache.invalidate()
+            return
+
+        self.parameter_cache.invalidate(self.build_parameter_name(
+            name,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name,
+            legacy_name=legacy_name
+        ))
+
+    def on_ssm_parameter_change(self, callback):
+        '''
+        Register a callback(name, old_value, new_value) to be fired by refresh_ssm_parameters() for every cached parameter
+          whose value changed (new_value is None if the parameter was deleted).
+        '''
+
+        self._parameter_change_callbacks.append(callback)
+
+    def refresh_ssm_parameters(self, subpath=None, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, recursive=True, max_workers=4):
+        '''
+        Bring the cached AWS Systems Manager system parameters under a path up to date, without refetching all of them.
+        One DescribeParameters sweep of the path gets every parameter's version; only cached parameters whose version
+          changed are refetched (in batched GetParameters calls), and unchanged ones are simply kept for another SSM_CACHE_TTL.
+        Cached parameters that no longer exist are dropped.
+        Callbacks registered through on_ssm_parameter_change() fire for every value that changed.
+
+        Returns a dict of full parameter name -> new value (None if deleted) for the values that changed.
+        '''
+
+        path = self.config.build_ssm_param_name(
+            subpath,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name
+        )
+        prefix = path if path.endswith('/') else f'{path}/'
+
+        cached = [
+            (key, value, metadata) for key, value, metadata in self.parameter_cache.items(prefix)
+            if recursive or '/' not in key[0][len(prefix):]
+        ]
+        if not cached:
+            return {}
+
+        stale, old_values, changes = self._diff_cached_ssm_parameters(cached, self._describe_ssm_parameters(path, recursive))
+        changes.update(self._refetch_ssm_parameters(stale, old_values, max_workers))
+
+        self.metrics.count('ssm.refresh.refetched', sum(len(names) for names in stale.values()))
+        self.metrics.count('ssm.refresh.changed', len(changes))
+
+        self._notify_ssm_parameter_changes(changes, old_values)
+
+        return changes
+
+    def _notify_ssm_parameter_changes(self, changes, old_values):
+        '''
+        Fire the callbacks registered through on_ssm_parameter_change() for every changed value.
+        A failing callback is logged, and doesn't stop the others.
+        '''
+
+        for name, new_value in changes.items():
+            for callback in self._parameter_change_callbacks:
+                try:
+                    callback(name, old_values.get(name), new_value)
+                except Exception: # pylint: disable=W0703
+                    self.logger.warning('SSM parameter change callback failed for %s', name, exc_info=True)
+
+    def _describe_ssm_parameters(self, path, recursive):
+        '''
+        Sweep a path with DescribeParameters, without transferring any values.
+        Returns a dict of full parameter name -> parameter description (which includes its Version).
+        '''
+
+        described = {}
+        paginator = self.ssm.get_paginator('describe_parameters')
+        with self.metrics.timer('ssm.refresh.describe'):
+            for page in paginator.paginate(
+                ParameterFilters=[{'Key': 'Path', 'Option': 'Recursive' if recursive else 'OneLevel', 'Values': [path.rstrip('/') or '/']}],
+                PaginationConfig={'PageSize': SSM_DESCRIBE_PARAMETERS_MAX_RESULTS}
+            ):
+                for parameter in page['Parameters']:
+                    described[parameter['Name']] = parameter
+
+        return described
+
+    def _diff_cached_ssm_parameters(self, cached, described):
+        '''
+        Compare cached parameters (a list of (key, value, metadata)) against their current descriptions.
+        Unchanged parameters are kept for another SSM_CACHE_TTL, and deleted ones are dropped from the cache.
+
+        Returns a tuple of (dict of encrypted flag -> names whose version changed, dict of name -> old value,
+          dict of name -> None for the parameters that were deleted).
+        '''
+
+        ttl = self.config.get_int('SSM_CACHE_TTL', 0, minimum=0)
+        stale_ttl = self.config.get_int('SSM_CACHE_STALE_TTL', 0, minimum=0)
+        stale = {False: [], True: []}
+        old_values = {}
+        deleted = {}
+        for key, value, metadata in cached:
+            name, encrypted = key
+            parameter = described.get(name)
+            if parameter is None:
+                self.parameter_cache.invalidate(name)
+                deleted[name] = None
+                old_values[name] = value
+            elif metadata is None or metadata[0] != parameter.get('Version'):
+                stale[encrypted].append(name)
+                old_values[name] = value
+            else:
+                # still current - keep it for another ttl
+                self.parameter_cache.set(key, value, ttl, stale_ttl)
+
+        return stale, old_values, deleted
+
+    def _refetch_ssm_parameters(self, stale, old_values, max_workers):
+        '''
+        Refetch (and re-cache) the parameters whose version changed, given as a dict of encrypted flag -> names.
+        Returns a dict of name -> new value for the parameters whose value actually changed.
+        '''
+
+        ttl = self.config.get_int('SSM_CACHE_TTL', 0, minimum=0)
+        stale_ttl = self.config.get_int('SSM_CACHE_STALE_TTL', 0, minimum=0)
+        changes = {}
+        for encrypted, names in stale.items():
+            for response in self._fetch_ssm_parameters(names, encrypted, max_workers):
+                for parameter in response['Parameters']:
+                    self.parameter_cache.set((parameter['Name'], encrypted), parameter['Value'], ttl, stale_ttl, parameter_metadata(parameter))
+                    if parameter['Value'] != old_values.get(parameter['Name']):
+                        changes[parameter['Name']] = parameter['Value']
+
+        return changes
+
+    def export_config_bundle(self, path, subpath=None, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, include_encrypted=False, ttl=None):
+        '''
+        Write every SSM parameter under the configured path to a bundle file
+          that can ship in the deployment package (or live in /tmp) and be loaded at cold start with load_config_bundle().
+        SecureString parameters are left out unless include_encrypted is True, as bundles are not encrypted.
+        If ttl is given, the bundled parameters are only trusted for that many seconds.
+
+        Returns the number of parameters written.
+        '''
+
+        from crimsoncore import config_bundle # pylint: disable=C0415
+
+        parameters = {}
+        for parameter in self.iter_ssm_parameters_by_path(
+            subpath,
+            encrypted=include_encrypted,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name,
+            recursive=True
+        ):
+            encrypted = parameter.get('Type') == 'SecureString'
+            if encrypted and not include_encrypted:
+                continue
+
+            parameters[parameter['Name']] = {'value': parameter['Value'], 'version': parameter.get('Version'), 'encrypted': encrypted}
+
+        config_bundle.write_bundle(path, parameters, ttl=ttl)
+        self.logger.info('Wrote configuration bundle %s with %d parameters', path, len(parameters))
+
+        return len(parameters)
+
+    def load_config_bundle(self, path=None):
+        '''
+        Load a configuration bundle written by export_config_bundle() (CONFIG_BUNDLE_PATH if no path is given),
+          seeding the SSM parameter cache with its parameters in one step.
+        This happens automatically at construction when CONFIG_BUNDLE_PATH is set.
+        Parameters missing from the bundle (or anything at all, if the bundle is missing, unreadable or expired)
+          are read from SSM as usual; bundled values are refetched once the bundle's ttl (or SSM_CACHE_TTL) runs out.
+        A bundle without a ttl of its own is skipped (with a warning) if SSM caching is disabled (SSM_CACHE_TTL=0).
+
+        Returns the number of parameters loaded.
+        '''
+
+        from crimsoncore import config_bundle # pylint: disable=C0415
+
+        path = path or self.config.val('CONFIG_BUNDLE_PATH', default_override='')
+        if not path:
+            return 0
+
+        try:
+            with self.metrics.timer('config_bundle.load'):
+                bundle = config_bundle.read_bundle(path)
+        except FileNotFoundError:
+            self.logger.info('No configuration bundle found at %s; reading configuration from SSM', path)
+            return 0
+        except ValueError as ex:
+            self.logger.warning('Ignoring unreadable configuration bundle %s: %s', path, ex)
+            return 0
+
+        if bundle['expired']:
+            self.logger.info('Configuration bundle %s has expired; reading configuration from SSM', path)
+            return 0
+
+        # bundles with a ttl of their own are trusted until they expire
+        ttl = self.config.get_int('SSM_CACHE_TTL', 0, minimum=0)
+        if bundle.get('expires_at') is not None:
+            ttl = bundle['expires_at'] - time.time()
+        elif ttl <= 0:
+            self.logger.warning('Skipping configuration bundle %s, as it has no ttl and SSM caching is disabled (SSM_CACHE_TTL=0); reading configuration from SSM', path)
+            return 0
+
+        stale_ttl = self.config.get_int('SSM_CACHE_STALE_TTL', 0, minimum=0)
+        for name, parameter in bundle['parameters'].items():
+            self.parameter_cache.set((name, parameter['encrypted']), parameter['value'], ttl, stale_ttl, (parameter.get('version'), None))
+
+        # only a successfully loaded bundle is skipped from now on - a missing or broken one is tried again by the next instance
+        LOADED_CONFIG_BUNDLES.add(path)
+
+        self.metrics.count('config_bundle.parameters', len(bundle['parameters']))
+        self.logger.info('Loaded %d parameters from configuration bundle %s', len(bundle['parameters']), path)
+
+        return len(bundle['parameters'])
+
+    def iter_ssm_parameters_by_path(self, subpath=None, encrypted=False, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, recursive=False, prefetch=False, use_cache=False):
+        '''
+        Iterate over AWS Systems Manager system parameters under a specific path, one page at a time.
+        Encryption supported.
+        Yields the raw parameter dicts returned by GetParametersByPath (Name, Value, Type, Version...).
+        If prefetch is True, the next page is requested in the background while the caller processes the current one.
+        Parameters are only stored in the parameter cache if use_cache is True - walking a large tree
+          would otherwise evict the hot parameters get_ssm_parameter has cached.
+        '''
+
+        request = {
+            'Path': self.config.build_ssm_param_name(
+                subpath,
+                include_global_prefix=include_global_prefix,
+                include_application_name=include_application_name,
+                include_environment=include_environment,
+                include_stack_name=include_stack_name
+            ),
+            'Recursive': recursive,
+            'WithDecryption': encrypted,
+            'MaxResults': SSM_GET_PARAMETERS_BY_PATH_MAX_RESULTS
+        }
+
+        ttl = self.config.get_int('SSM_CACHE_TTL', 0, minimum=0)
+        stale_ttl = self.config.get_int('SSM_CACHE_STALE_TTL', 0, minimum=0)
+        for response in self._iter_ssm_parameter_pages(request, prefetch):
+            for parameter in response['Parameters']:
+                if use_cache:
+                    self.parameter_cache.set((parameter['Name'], encrypted), parameter['Value'], ttl, stale_ttl, parameter_metadata(parameter))
+                yield parameter
+
+    def _iter_ssm_parameter_pages(self, request, prefetch=False):
+        '''
+        Page through a GetParametersByPath request, yielding each raw response.
+        If prefetch is True, the next page is requested in the background while the caller processes the current one.
+        '''
+
+        def fetch_page(next_token):
+            if next_token is None:
+                return self.ssm.get_parameters_by_path(**request)
+
+            return self.ssm.get_parameters_by_path(NextToken=next_token, **request)
+
+        if not prefetch:
+            next_token = None
+            while True:
+                response = fetch_page(next_token)
+                yield response
+
+                next_token = response.get('NextToken')
+                if not next_token:
+                    return
+
+        # not a with block - a generator abandoned mid-walk must not wait on the page still being fetched
+        executor = ThreadPoolExecutor(max_workers=1) # pylint: disable=R1732
+        try:
+            pending = executor.submit(fetch_page, None)
+            while pending is not None:
+                response = pending.result()
+
+                next_token = response.get('NextToken')
+                pending = executor.submit(fetch_page, next_token) if next_token else None
+
+                yield response
+        finally:
+            executor.shutdown(wait=False)
+
+    def get_ssm_parameters_by_path(self, subpath=None, encrypted=False, include_global_prefix=True, include_application_name=True, include_environment=False, include_stack_name=False, recursive=False, prefetch=False, use_cache=False):
+        '''
+        Get multiple AWS Systems Manager system parameters under a specific path.
+        Encryption supported.
+        Parameters are only stored in the parameter cache if use_cache is True.
+        '''
+
+        bare_params = {}
+        for parameter in self.iter_ssm_parameters_by_path(
+            subpath,
+            encrypted=encrypted,
+            include_global_prefix=include_global_prefix,
+            include_application_name=include_application_name,
+            include_environment=include_environment,
+            include_stack_name=include_stack_name,
+            recursive=recursive,
+            prefetch=prefetch,
+            use_cache=use_cache
+        ):
+            bare_params[parameter['Name']] = parameter['Value']
+
+        return bare_params
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+'''
+#
+# cr.imson.co
+#
+# AWS API throttling module
+#
+# @author Damian Bushong <katana@odios.us>
+#
+'''
+
+# pylint: disable=C0301,W0511,R0902,R0913
+
+import threading
+import time
+
+def backoff_delay(attempt, base=0.1, cap=20, rand=None):
+    '''
+    Get how long to wait before retrying, using exponential backoff with full jitter.
+    attempt counts from 0 (the delay before the first retry).
+    '''
+
+    if rand is None:
+        # random takes a while to import, and is only needed once something actually has to be retried
+        import random # pylint: disable=C0415
+        rand = random.random
+
+    return rand() * min(cap, base * (2 ** attempt))
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket rate limiter.
+    A rate of zero (or less) means no limit at all.
+    '''
+
+    def __init__(self, rate=0, burst=0, clock=None, sleep=None):
+        self._lock = threading.Lock()
+        self._clock = clock if clock is not None else time.monotonic
+        self._sleep = sleep if sleep is not None else time.sleep
+
+        self.rate = 0
+        self.burst = 0
+        self._tokens = 0
+        self._last = self._clock()
+
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst=0):
+        '''
+        Change the rate (tokens per second) and burst size (maximum tokens banked) of the bucket.
+        If no burst size is given, it defaults to one second's worth of tokens.
+        '''
+
+        burst = burst if burst > 0 else max(rate, 1)
+
+        with self._lock:
+            if (rate, burst) == (self.rate, self.burst):
+                return
+
+            if self.rate > 0:
+                self._refill()
+                self._tokens = min(self._tokens, burst)
+            else:
+                self._tokens = burst
+
+            self.rate = rate
+            self.burst = burst
+            self._last = self._clock()
+
+    def try_acquire(self, tokens=1):
+        '''
+        Take tokens from the bucket if they're available right now, without waiting.
+        '''
+
+        with self._lock:
+            if self.rate <= 0:
+                return True
+
+            self._refill()
+            if self._tokens < tokens:
+                return False
+
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens=1):
+        '''
+        Take tokens from the bucket, waiting until they're available.
+        Returns how long we waited, in seconds.
+        '''
+
+        with self._lock:
+            if self.rate <= 0:
+                return 0
+
+            self._refill()
+
+            # reserve the tokens now (possibly going into debt) so that waiters are served in order
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            self._sleep(wait)
+
+        return wait
+
+    def instrument(self, client):
+        '''
+        Make every HTTP request sent by the given botocore client (retries included) take a token first.
+        Safe to call repeatedly for the same client.
+        '''
+
+        client.meta.events.register('before-send.*.*', self._before_send, unique_id='crimsoncore-rate-limit')
+
+    def _before_send(self, **kwargs): # pylint: disable=W0613
+        '''
+        botocore before-send event handler.
+        '''
+
+        self.acquire()
+
+    def _refill(self):
+        '''
+        Add the tokens accrued since we last looked.
+        (must be called with the lock held)
+        '''
+
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+# shared by every client built through LambdaCore within the process
+RATE_LIMITER = TokenBucket()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import io
+import threading
+from botocore.response import StreamingBody
+
+def streaming_body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+class FakeClock:
+    '''
+    Clock (and sleep function) that only moves when told to.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+class FakePaginator:
+    '''
+    Paginator serving canned pages - either a list of pages, or a function of the paginate() arguments returning them.
+    '''
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def paginate(self, **kwargs):
+        self.requests.append(kwargs)
+
+        return iter(self.pages(**kwargs) if callable(self.pages) else self.pages)
+
+class FakeClient:
+    '''
+    Client with canned paginators, keyed by operation name.
+    '''
+
+    def __init__(self, paginators=None):
+        self.paginators = paginators or {}
+
+    def get_paginator(self, operation_name):
+        return self.paginators[operation_name]
+
+class FakeS3Client(FakeClient):
+    '''
+    Just enough of an S3 client to serve ranged GETs, listings and deletes from several threads at once.
+    '''
+
+    def __init__(self, data=b'', keys=(), page_size=3):
+        super().__init__({'list_objects_v2': FakePaginator(self._list)})
+
+        self.data = data
+        self.keys = keys
+        self.page_size = page_size
+        self.ranges = []
+        self.deleted = []
+        self._lock = threading.Lock()
+
+    def head_object(self, **kwargs): # pylint: disable=W0613
+        return {'ContentLength': len(self.data), 'ETag': '"etag"'}
+
+    def get_object(self, Range, **kwargs): # pylint: disable=C0103,W0613
+        start, end = (int(value) for value in Range[len('bytes='):].split('-'))
+        with self._lock:
+            self.ranges.append((start, end))
+
+        return {'Body': streaming_body(self.data[start:end + 1])}
+
+    def delete_objects(self, Bucket, Delete): # pylint: disable=C0103,W0613
+        with self._lock:
+            self.deleted.append([obj['Key'] for obj in Delete['Objects']])
+
+        return {}
+
+    def _list(self, Bucket, Prefix='', **kwargs): # pylint: disable=C0103,W0613
+        keys = [key for key in self.keys if key.startswith(Prefix)]
+        for i in range(0, len(keys), self.page_size):
+            yield {'Contents': [{'Key': key} for key in keys[i:i + self.page_size]]}
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import unittest
+from unittest.mock import patch
+from urllib.parse import parse_qs
+from crimsoncore import AsyncLambdaCore, LambdaCore
+from crimsoncore.client_pool import ClientPool
+
+FAKE_CREDENTIALS = {'AWS_ACCESS_KEY_ID': 'AKIDEXAMPLE', 'AWS_SECRET_ACCESS_KEY': 'secret'}
+
+class StubServer:
+    '''
+    Local HTTP/1.1 server standing in for AWS - answers each request with whatever handler(request) returns.
+    handler gets a dict of method, path, headers, body and action (the JSON X-Amz-Target or query Action),
+      and returns (status, content type, body), or a coroutine that does.
+    '''
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.connections = 0
+        self.running = 0
+        self.peak = 0
+        self.url = None
+        self._server = None
+        self._connections = {}
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.url = f'http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}'
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._server.close()
+        # idle keep-alive connections are still being served - close them (rather than cancelling their handlers,
+        #   which asyncio's stream callbacks report as errors) and wait for the handlers to finish
+        for writer in self._connections.values():
+            writer.transport.abort()
+        await asyncio.gather(*self._connections)
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                request = {'method': method, 'path': path, 'headers': headers, 'body': body}
+                if 'x-amz-target' in headers:
+                    request['action'] = headers['x-amz-target'].split('.')[-1]
+                    request['params'] = json.loads(body or b'{}')
+                else:
+                    request['params'] = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+                    request['action'] = request['params'].get('Action')
+                self.requests.append(request)
+
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+                try:
+                    response = self.handler(request)
+                    if asyncio.iscoroutine(response):
+                        response = await response
+                finally:
+                    self.running -= 1
+
+                status, content_type, response_body = response
+                writer.write(
+                    f'HTTP/1.1 {status} Stub\r\nContent-Type: {content_type}\r\nContent-Length: {len(response_body)}\r\n\r\n'.encode('latin-1')
+                    + response_body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+def json_response(body, status=200):
+    return status, 'application/x-amz-json-1.1', json.dumps(body).encode('utf-8')
+
+def ssm_handler(request):
+    if request['action'] == 'GetParameter':
+        name = request['params']['Name']
+        if name.endswith('missing'):
+            return json_response({'__type': 'ParameterNotFound', 'message': name}, 400)
+
+        return json_response({'Parameter': {'Name': name, 'Value': f'value of {name}', 'Version': 1}})
+
+    if request['action'] == 'GetParameters':
+        return json_response({
+            'Parameters': [{'Name': name, 'Value': f'value of {name}'} for name in request['params']['Names'] if not name.endswith('missing')],
+            'InvalidParameters': [name for name in request['params']['Names'] if name.endswith('missing')]
+        })
+
+    return json_response({'__type': 'InvalidAction'}, 400)
+
+def sns_handler(request):
+    if request['action'] == 'Publish':
+        result = '<MessageId>single</MessageId>'
+    else:
+        entries = [key[:-len('.Id')] for key in request['params'] if key.endswith('.Id')]
+        result = '<Successful>' + ''.join(
+            f'<member><Id>{request["params"][entry + ".Id"]}</Id><MessageId>batch-{request["params"][entry + ".Id"]}</MessageId></member>'
+            for entry in entries if request['params'][entry + '.Id'] != '1'
+        ) + '</Successful><Failed><member><Id>1</Id><Code>InternalError</Code><Message>oops</Message><SenderFault>false</SenderFault></member></Failed>'
+
+    action = request['action']
+    return 200, 'text/xml', (
+        f'<{action}Response xmlns="http://sns.amazonaws.com/doc/2010-03-31/"><{action}Result>{result}</{action}Result>'
+        f'<ResponseMetadata><RequestId>request</RequestId></ResponseMetadata></{action}Response>'
+    ).encode('utf-8')
+
+class AsyncLambdaCoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.environ = patch.dict(os.environ, FAKE_CREDENTIALS)
+        self.environ.start()
+
+        self.core = AsyncLambdaCore('test', {
+            'AWS_REGION': 'us-east-1',
+            'GLOBAL_PREFIX': 'test',
+            'APPLICATION_NAME': 'myappname',
+            'ASYNC_MAX_CONCURRENCY': '2',
+            'SSM_CACHE_TTL': '300',
+            'NOTIFICATION_ARN': 'arn:aws:sns:us-east-1:123456789012:notifications',
+            'NOTIFICATIONS_ENABLED': 'true'
+        })
+        # a private pool, so the clients (and credentials) come from this test's environment
+        self.core.core.client_pool = ClientPool()
+        self.core.core.parameter_cache.invalidate()
+
+    def tearDown(self):
+        self.environ.stop()
+
+    def run_against(self, service, handler, test):
+        '''
+        Run test(server) with the service's client pointed at a stub server.
+        '''
+
+        loop_errors = []
+
+        async def main():
+            asyncio.get_running_loop().set_exception_handler(lambda _, context: loop_errors.append(context))
+            async with StubServer(handler) as server:
+                setattr(self.core.core, 'awslambda' if service == 'lambda' else service, self.core.core.client_pool.client(service, region_name='us-east-1', endpoint_url=server.url))
+                async with self.core:
+                    return await test(server)
+
+        try:
+            return asyncio.run(main())
+        finally:
+            # anything left for the event loop to report (e.g. a task that was never awaited) fails the test
+            self.assertEqual(loop_errors, [])
+
+    def test_shares_core(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-gov-west-1'})
+        async_core = AsyncLambdaCore(core=core)
+
+        self.assertIs(async_core.config, core.config)
+
+        async def test():
+            async with async_core:
+                return await async_core.client('lambda')
+
+        client = asyncio.run(test())
+
+        self.assertIs(client, core.awslambda)
+        self.assertEqual(client.meta.endpoint_url, 'https://lambda-fips.us-gov-west-1.amazonaws.com')
+
+    def test_default_concurrency(self):
+        self.assertEqual(AsyncLambdaCore('test', {'AWS_REGION': 'us-east-1'}).max_concurrency, 4)
+
+    def test_requires_name_or_core(self):
+        self.assertRaises(ValueError, AsyncLambdaCore)
+
+    def test_unknown_service(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.core.client('nonsense'))
+
+    def test_get_ssm_parameter(self):
+        async def test(server):
+            first = await self.core.get_ssm_parameter('param1')
+            second = await self.core.get_ssm_parameter('param1')
+            return first, second, server
+
+        first, second, server = self.run_against('ssm', ssm_handler, test)
+
+        self.assertEqual(first, 'value of /test/myappname/ssm/param1')
+        self.assertEqual(second, first)
+        # the second read came from the shared cache
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]['params'], {'Name': '/test/myappname/ssm/param1', 'WithDecryption': False})
+        self.assertTrue(server.requests[0]['headers']['authorization'].startswith('AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/'))
+        self.assertEqual(self.core.core.get_ssm_parameter('param1'), first)
+
+    def test_error(self):
+        async def test(_):
+            await self.core.get_ssm_parameter('missing')
+
+        with self.assertRaises(self.core.core.ssm.exceptions.ParameterNotFound):
+            self.run_against('ssm', ssm_handler, test)
+
+    def test_get_ssm_parameters(self):
+        names = [f'param{i}' for i in range(12)] + ['missing']
+
+        async def test(server):
+            return await self.core.get_ssm_parameters(names), server
+
+        (values, invalid), server = self.run_against('ssm', ssm_handler, test)
+
+        self.assertEqual(values, {name: f'value of /test/myappname/ssm/{name}' for name in names[:-1]})
+        self.assertEqual(invalid, ['missing'])
+        self.assertEqual(sorted(len(request['params']['Names']) for request in server.requests), [3, 10])
+
+    def test_retries_throttling(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            if len(attempts) == 1:
+                return json_response({'__type': 'ThrottlingException', 'message': 'Rate exceeded'}, 400)
+            return ssm_handler(request)
+
+        async def test(_):
+            return await self.core.call('ssm', 'get_parameter', Name='/param1')
+
+        response = self.run_against('ssm', handler, test)
+
+        self.assertEqual(response['Parameter']['Value'], 'value of /param1')
+        self.assertEqual(response['ResponseMetadata']['RetryAttempts'], 1)
+        self.assertEqual(len(attempts), 2)
+
+    def test_bounded_concurrency(self):
+        async def handler(request):
+            await asyncio.sleep(0.02)
+            return ssm_handler(request)
+
+        async def test(server):
+            results = await self.core.gather(*[self.core.call('ssm', 'get_parameter', Name=f'/param{i}') for i in range(8)])
+            return [result['Parameter']['Value'] for result in results], server
+
+        values, server = self.run_against('ssm', handler, test)
+
+        self.assertEqual(values, [f'value of /param{i}' for i in range(8)])
+        self.assertEqual(server.peak, 2)
+        # keep-alive connections are reused rather than opened per call
+        self.assertLessEqual(server.connections, 2)
+
+    def test_send_notifications(self):
+        async def test(server):
+            return await self.core.send_notifications([('info', f'message {i}') for i in range(3)]), server
+
+        results, server = self.run_against('sns', sns_handler, test)
+
+        self.assertEqual([result['message_id'] for result in results], ['batch-0', 'single', 'batch-2'])
+        self.assertEqual([result['retried'] for result in results], [False, True, False])
+        self.assertEqual([request['action'] for request in server.requests], ['PublishBatch', 'Publish'])
+
+    def test_run(self):
+        async def test():
+            async with self.core:
+                return await self.core.run(self.core.core.build_parameter_name, 'param1', include_application_name=False)
+
+        self.assertEqual(asyncio.run(test()), '/test/ssm/param1')
+
+    def test_reused_across_event_loops(self):
+        async def test(_):
+            return await self.core.get_ssm_parameter('param1', use_cache=False)
+
+        self.assertEqual(self.run_against('ssm', ssm_handler, test), 'value of /test/myappname/ssm/param1')
+        self.assertEqual(self.run_against('ssm', ssm_handler, test), 'value of /test/myappname/ssm/param1')
+
+if __name__ == '__main__':
+    unittest.main()
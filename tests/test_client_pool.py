@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from crimsoncore.client_pool import ClientPool
+
+class ClientPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = ClientPool()
+
+    def test_client_is_shared(self):
+        first = self.pool.client('ssm', region_name='us-east-1')
+        second = self.pool.client('ssm', region_name='us-east-1')
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.pool.stats()), 1)
+
+    def test_clients_keyed_by_region_endpoint_and_config(self):
+        base = self.pool.client('s3', region_name='us-east-1')
+
+        self.assertIsNot(base, self.pool.client('s3', region_name='us-west-2'))
+        self.assertIsNot(base, self.pool.client('s3', region_name='us-east-1', endpoint_url='https://s3-fips.us-east-1.amazonaws.com'))
+        self.assertIsNot(base, self.pool.client('s3', region_name='us-east-1', config={'signature_version': 's3v4'}))
+        self.assertIs(
+            self.pool.client('s3', region_name='us-east-1', config={'signature_version': 's3v4', 'retries': {'mode': 'standard'}}),
+            self.pool.client('s3', region_name='us-east-1', config={'retries': {'mode': 'standard'}, 'signature_version': 's3v4'})
+        )
+
+    def test_resources_per_thread(self):
+        first = self.pool.resource('ec2', region_name='us-east-1')
+        self.assertIs(first, self.pool.resource('ec2', region_name='us-east-1'))
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.pool.resource('ec2', region_name='us-east-1')))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(first, other[0])
+        self.assertIs(first.meta.client, other[0].meta.client)
+        self.assertEqual(len(self.pool.stats()), 1)
+
+    def test_build_times(self):
+        self.pool.client('sns', region_name='us-east-1')
+
+        stats = self.pool.stats()
+        self.assertEqual(stats[0]['service'], 'sns')
+        self.assertGreater(stats[0]['build_time'], 0)
+
+    def test_clear(self):
+        first = self.pool.client('ssm', region_name='us-east-1')
+        self.pool.clear()
+
+        self.assertIsNot(first, self.pool.client('ssm', region_name='us-east-1'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from botocore.stub import Stubber
+from crimsoncore import LambdaCore
+from crimsoncore import config_bundle
+from crimsoncore.ssm_parameters import LOADED_CONFIG_BUNDLES
+
+ENV = {
+    'AWS_REGION': 'us-east-1',
+    'GLOBAL_PREFIX': 'test',
+    'APPLICATION_NAME': 'myappname',
+    'SSM_CACHE_TTL': '300'
+}
+
+class ConfigBundleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'config.bundle')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        parameters = {'/test/myappname/ssm/param1': {'value': 'value1', 'version': 3, 'encrypted': False}}
+
+        config_bundle.write_bundle(self.path, parameters, ttl=60, clock=lambda: 1000)
+        bundle = config_bundle.read_bundle(self.path, clock=lambda: 1059)
+
+        self.assertEqual(bundle['parameters'], parameters)
+        self.assertEqual(bundle['expires_at'], 1060)
+        self.assertFalse(bundle['expired'])
+        self.assertTrue(config_bundle.read_bundle(self.path, clock=lambda: 1060)['expired'])
+
+    def test_not_a_bundle(self):
+        for content in (b'', b'{"parameters": {}}', b'CRIMSONCORE-CONFIG-BUNDLE 99\n{}'):
+            with self.subTest(content=content):
+                with open(self.path, 'wb') as bundle_file:
+                    bundle_file.write(content)
+
+                self.assertRaises(ValueError, config_bundle.read_bundle, self.path)
+
+class LambdaCoreConfigBundleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'config.bundle')
+
+        self.core = LambdaCore('test', ENV)
+        self.core.parameter_cache.invalidate()
+
+    def tearDown(self):
+        self.core.parameter_cache.invalidate()
+        LOADED_CONFIG_BUNDLES.discard(self.path)
+        self.directory.cleanup()
+
+    def test_export_and_load(self):
+        with Stubber(self.core.ssm) as stubber:
+            stubber.add_response(
+                'get_parameters_by_path',
+                {'Parameters': [
+                    {'Name': '/test/myappname/ssm/param1', 'Value': 'value1', 'Type': 'String', 'Version': 1},
+                    {'Name': '/test/myappname/ssm/secret', 'Value': 'ciphertext', 'Type': 'SecureString', 'Version': 1}
+                ]},
+                {'Path': '/test/myappname/', 'Recursive': True, 'WithDecryption': False, 'MaxResults': 10}
+            )
+
+            self.assertEqual(self.core.export_config_bundle(self.path), 1)
+
+        self.core.parameter_cache.invalidate()
+
+        core = LambdaCore('test', dict(ENV, CONFIG_BUNDLE_PATH=self.path))
+        self.assertIn(self.path, LOADED_CONFIG_BUNDLES)
+
+        with Stubber(core.ssm) as stubber:
+            # bundled values are served from the cache; everything else falls back to SSM
+            self.assertEqual(core.get_ssm_parameter('param1'), 'value1')
+
+            stubber.add_response('get_parameter', {'Parameter': {'Name': '/test/myappname/ssm/secret', 'Value': 'secret'}})
+            self.assertEqual(core.get_ssm_parameter('secret', encrypted=True), 'secret')
+            stubber.assert_no_pending_responses()
+
+    def test_load_bundle_ttl_without_caching(self):
+        config_bundle.write_bundle(self.path, {'/test/myappname/ssm/param1': {'value': 'value1', 'version': 1, 'encrypted': False}}, ttl=60)
+        env = {key: value for key, value in ENV.items() if key != 'SSM_CACHE_TTL'}
+
+        # CONFIG_BUNDLE_PATH alone is enough for a bundle that carries its own ttl
+        core = LambdaCore('test', dict(env, CONFIG_BUNDLE_PATH=self.path))
+        self.assertIn(self.path, LOADED_CONFIG_BUNDLES)
+
+        with Stubber(core.ssm):
+            self.assertEqual(core.get_ssm_parameter('param1'), 'value1')
+
+    def test_load_bundle_without_ttl_or_caching(self):
+        config_bundle.write_bundle(self.path, {'/test/myappname/ssm/param1': {'value': 'value1', 'version': 1, 'encrypted': False}})
+        core = LambdaCore('test', {key: value for key, value in ENV.items() if key != 'SSM_CACHE_TTL'})
+
+        with self.assertLogs('test', level='WARNING'):
+            self.assertEqual(core.load_config_bundle(self.path), 0)
+        self.assertEqual(len(core.parameter_cache), 0)
+
+    def test_load_missing_bundle(self):
+        self.assertEqual(self.core.load_config_bundle(self.path), 0)
+        # retried once the bundle shows up
+        self.assertNotIn(self.path, LOADED_CONFIG_BUNDLES)
+
+    def test_load_expired_bundle(self):
+        config_bundle.write_bundle(self.path, {'/test/myappname/ssm/param1': {'value': 'value1', 'version': 1, 'encrypted': False}}, ttl=60, clock=lambda: 0)
+
+        self.assertEqual(self.core.load_config_bundle(self.path), 0)
+        self.assertEqual(len(self.core.parameter_cache), 0)
+
+    def test_load_unreadable_bundle(self):
+        with open(self.path, 'wb') as bundle_file:
+            bundle_file.write(b'nonsense')
+
+        with self.assertLogs('test', level='WARNING'):
+            self.assertEqual(self.core.load_config_bundle(self.path), 0)
+        self.assertNotIn(self.path, LOADED_CONFIG_BUNDLES)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import datetime
+import unittest
+from botocore.stub import Stubber
+from crimsoncore import LambdaCore
+from crimsoncore import ec2_inventory
+from tests.fakes import FakeClient, FakePaginator
+
+class EC2InventoryTestCase(unittest.TestCase):
+    def test_build_filters(self):
+        self.assertEqual(
+            ec2_inventory.build_filters({'tag:Name': 'web', 'instance-state-name': ['running', 'stopped']}),
+            [{'Name': 'tag:Name', 'Values': ['web']}, {'Name': 'instance-state-name', 'Values': ['running', 'stopped']}]
+        )
+        self.assertEqual(ec2_inventory.build_filters([{'Name': 'a', 'Values': ['b']}]), [{'Name': 'a', 'Values': ['b']}])
+        self.assertEqual(ec2_inventory.build_filters(None), [])
+        self.assertEqual(
+            ec2_inventory.build_filters({'encrypted': False, 'is-public': [True], 'volume-size': 8}),
+            [{'Name': 'encrypted', 'Values': ['false']}, {'Name': 'is-public', 'Values': ['true']}, {'Name': 'volume-size', 'Values': ['8']}]
+        )
+
+    def test_build_record(self):
+        resource = {'InstanceId': 'i-1', 'State': {'Code': 16, 'Name': 'running'}, 'Tags': [{'Key': 'Name', 'Value': 'web'}]}
+
+        self.assertEqual(
+            ec2_inventory.build_record(resource, ('InstanceId', 'State.Name', 'Tags', 'Missing.Value')),
+            {'InstanceId': 'i-1', 'State.Name': 'running', 'Tags': {'Name': 'web'}, 'Missing.Value': None}
+        )
+
+    def test_describe_inventory(self):
+        client = FakeClient({
+            'describe_instances': FakePaginator([{'Reservations': [{'Instances': [{'InstanceId': 'i-1'}, {'InstanceId': 'i-2'}]}]}, {'Reservations': [{'Instances': [{'InstanceId': 'i-3'}]}]}]),
+            'describe_volumes': FakePaginator([{'Volumes': [{'VolumeId': 'vol-1'}]}]),
+            'describe_snapshots': FakePaginator([{'Snapshots': [{'SnapshotId': 'snap-1'}]}]),
+            'describe_images': FakePaginator([{'Images': []}])
+        })
+
+        inventory = ec2_inventory.describe_inventory(client, attributes={'instances': ('InstanceId',)}, filters={'volumes': {'status': 'available'}})
+
+        self.assertEqual(inventory['instances'], [{'InstanceId': 'i-1'}, {'InstanceId': 'i-2'}, {'InstanceId': 'i-3'}])
+        self.assertEqual([volume['VolumeId'] for volume in inventory['volumes']], ['vol-1'])
+        self.assertEqual(inventory['images'], [])
+        self.assertEqual(client.paginators['describe_volumes'].requests[0]['Filters'], [{'Name': 'status', 'Values': ['available']}])
+        self.assertEqual(client.paginators['describe_snapshots'].requests[0]['OwnerIds'], ['self'])
+
+    def test_unknown_resource_type(self):
+        self.assertRaises(ValueError, ec2_inventory.describe_inventory, FakeClient(), ['nonsense'])
+
+class LambdaCoreEC2InventoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = LambdaCore('test', {'AWS_REGION': 'us-east-1'})
+
+        self.stubber = Stubber(self.core.ec2.meta.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_iter_resources(self):
+        started = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+        self.stubber.add_response(
+            'describe_snapshots',
+            {
+                'Snapshots': [{'SnapshotId': 'snap-1', 'VolumeId': 'vol-1', 'VolumeSize': 8, 'State': 'completed', 'StartTime': started, 'Tags': [{'Key': 'Name', 'Value': 'backup'}]}],
+                'NextToken': 'next'
+            },
+            {'OwnerIds': ['self'], 'Filters': [{'Name': 'tag:Name', 'Values': ['backup']}], 'MaxResults': 1000}
+        )
+        self.stubber.add_response(
+            'describe_snapshots',
+            {'Snapshots': [{'SnapshotId': 'snap-2'}]},
+            {'OwnerIds': ['self'], 'Filters': [{'Name': 'tag:Name', 'Values': ['backup']}], 'MaxResults': 1000, 'NextToken': 'next'}
+        )
+
+        records = list(self.core.ec2_inventory.iter_resources('snapshots', filters={'tag:Name': 'backup'}))
+
+        self.assertEqual(records[0], {
+            'SnapshotId': 'snap-1',
+            'VolumeId': 'vol-1',
+            'VolumeSize': 8,
+            'State': 'completed',
+            'StartTime': started,
+            'Description': None,
+            'Tags': {'Name': 'backup'}
+        })
+        self.assertEqual(records[1]['SnapshotId'], 'snap-2')
+        self.stubber.assert_no_pending_responses()
+
+    def test_iter_resources_by_id(self):
+        self.stubber.add_response(
+            'describe_instances',
+            {'Reservations': [{'Instances': [{'InstanceId': 'i-1', 'State': {'Code': 16, 'Name': 'running'}}]}]},
+            {'InstanceIds': ['i-1']}
+        )
+
+        records = list(self.core.ec2_inventory.iter_resources('instances', attributes=('InstanceId', 'State.Name'), InstanceIds=['i-1']))
+
+        self.assertEqual(records, [{'InstanceId': 'i-1', 'State.Name': 'running'}])
+        self.stubber.assert_no_pending_responses()
+
+    def test_get_inventory(self):
+        self.stubber.add_response('describe_volumes', {'Volumes': [{'VolumeId': 'vol-1', 'Size': 8}]})
+
+        self.assertEqual(self.core.ec2_inventory.get_inventory(['volumes'], attributes={'volumes': ('VolumeId', 'Size')}), {'volumes': [{'VolumeId': 'vol-1', 'Size': 8}]})
+        self.stubber.assert_no_pending_responses()
+
+if __name__ == '__main__':
+    unittest.main()
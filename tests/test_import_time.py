@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+IMPORT_SCRIPT = '''
+import json
+import sys
+
+import crimsoncore
+%s
+
+print(json.dumps(sorted({name.split('.')[0] for name in sys.modules} & {'asyncio', 'boto3', 'botocore', 's3transfer'})))
+'''
+
+class ImportTimeTestCase(unittest.TestCase):
+    def _loaded_after(self, statement=''):
+        '''
+        Import crimsoncore (then run statement) in a fresh interpreter, returning which of the heavy packages got loaded.
+        '''
+
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_SCRIPT % statement],
+            check=True,
+            stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        )
+
+        return json.loads(result.stdout)
+
+    def test_import_does_not_load_heavy_modules(self):
+        self.assertEqual(self._loaded_after(), [])
+
+    def test_lambda_core_construction_does_not_load_heavy_modules(self):
+        self.assertEqual(self._loaded_after('crimsoncore.LambdaCore("test", {"AWS_REGION": "us-east-1"})'), [])
+
+    def test_async_lambda_core_loads_asyncio_on_use(self):
+        self.assertIn('asyncio', self._loaded_after('crimsoncore.AsyncLambdaCore'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+from botocore.stub import Stubber
+from crimsoncore.client_pool import ClientPool
+from crimsoncore.invocation_metrics import InvocationMetrics
+
+class InvocationMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = InvocationMetrics()
+
+    def test_timer(self):
+        for _ in range(3):
+            with self.metrics.timer('work'):
+                pass
+
+        timer = self.metrics.summary()['timers']['work']
+        self.assertEqual(timer['count'], 3)
+        self.assertGreaterEqual(timer['total_ms'], timer['max_ms'])
+
+    def test_count(self):
+        self.metrics.count('hits')
+        self.metrics.count('hits', 2)
+
+        self.assertEqual(self.metrics.summary()['counters'], {'hits': 3})
+
+    def test_reset(self):
+        self.metrics.count('hits')
+        self.metrics.record('work', 0.5)
+        self.metrics.reset()
+
+        self.assertEqual(self.metrics.summary(), {'timers': {}, 'counters': {}})
+
+    def test_to_emf(self):
+        self.metrics.record('work', 0.5)
+        self.metrics.count('hits', 2)
+
+        document = json.loads(self.metrics.to_emf('CrimsonCore', {'Lambda': 'test'}, timestamp=1))
+
+        self.assertEqual(document['Lambda'], 'test')
+        self.assertEqual(document['work.time'], 500)
+        self.assertEqual(document['work.count'], 1)
+        self.assertEqual(document['hits'], 2)
+        self.assertEqual(document['_aws']['Timestamp'], 1000)
+
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(directive['Namespace'], 'CrimsonCore')
+        self.assertEqual(directive['Dimensions'], [['Lambda']])
+        self.assertIn({'Name': 'work.time', 'Unit': 'Milliseconds'}, directive['Metrics'])
+        self.assertIn({'Name': 'hits', 'Unit': 'Count'}, directive['Metrics'])
+
+    def test_instrument(self):
+        client = ClientPool().client('ssm', region_name='us-east-1')
+        self.metrics.instrument(client)
+        self.metrics.instrument(client)
+
+        with Stubber(client) as stubber:
+            stubber.add_response('get_parameter', {'Parameter': {'Value': 'value'}})
+            stubber.add_client_error('get_parameter', service_error_code='ParameterNotFound')
+
+            client.get_parameter(Name='/param')
+            with self.assertRaises(client.exceptions.ParameterNotFound):
+                client.get_parameter(Name='/param')
+
+        summary = self.metrics.summary()
+        self.assertEqual(summary['timers']['ssm.GetParameter']['count'], 2)
+        self.assertEqual(summary['counters'], {'ssm.GetParameter.errors': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 
 import unittest
-from crimsoncore import LambdaConfig
+from crimsoncore import FrozenLambdaConfig, LambdaConfig
+from crimsoncore.lambda_config import NAME_MEMO_MAX_ENTRIES
 
 import logging
 
@@ -493,6 +494,15 @@ class LambdaConfigTestCase(unittest.TestCase):
                     test.get('expected')
                 )
 
+    def test_build_name_memo_bounded(self):
+        config = LambdaConfig('test', {'GLOBAL_PREFIX': 'test'})
+
+        for i in range(NAME_MEMO_MAX_ENTRIES + 10):
+            self.assertEqual(config.build_ssm_param_name(f'param{i}', include_global_prefix=True), f'/test/ssm/param{i}')
+
+        self.assertLessEqual(len(config._name_memo), NAME_MEMO_MAX_ENTRIES)
+        self.assertEqual(config.build_bucket_name('bucket'), 'test-bucket')
+
     def test_notifications_enabled_on(self):
         values = ('on', 'true', 'yes', 'ON')
         for value in values:
@@ -509,6 +519,122 @@ class LambdaConfigTestCase(unittest.TestCase):
 
                 self.assertIs(config.get_notifications_enabled(), False)
 
+    def test_notifications_enabled_default(self):
+        config = LambdaConfig('test', {})
+
+        self.assertIs(config.get_notifications_enabled(), True)
+
+    def test_retry_mode(self):
+        values = ('legacy', 'standard', 'adaptive', 'ADAPTIVE')
+        for value in values:
+            with self.subTest(value=value):
+                config = LambdaConfig('test', {'AWS_RETRY_MODE': value})
+
+                self.assertEqual(config.get_client_options('s3')['retries'], {'mode': value.lower()})
+
+    def test_bad_retry_mode(self):
+        config = LambdaConfig('test', {'AWS_RETRY_MODE': 'nonsense'})
+
+        self.assertRaises(ValueError, config.get_client_options, 's3')
+
+    def test_get_int(self):
+        config = LambdaConfig('test', {'S3_BULK_WORKERS': '16'}, lambda_overrides={'test': {'API_RATE_BURST': '5'}})
+
+        self.assertEqual(config.get_int('S3_BULK_WORKERS', 4, minimum=1), 16)
+        self.assertEqual(config.get_int('API_RATE_BURST', 0), 5)
+        self.assertEqual(config.get_int('RDS_WORKERS', 4, minimum=1), 4)
+        self.assertEqual(config.freeze().get_int('S3_BULK_WORKERS', 4, minimum=1), 16)
+
+    def test_get_float(self):
+        config = LambdaConfig('test', {'RDS_POLL_INTERVAL': '5', 'API_RATE_LIMIT': '2.5'})
+
+        self.assertEqual(config.get_float('RDS_POLL_INTERVAL', 30, minimum=0), 5.0)
+        self.assertEqual(config.get_float('API_RATE_LIMIT', 0), 2.5)
+        self.assertEqual(config.get_float('RDS_POLL_TIMEOUT', 600, minimum=0), 600.0)
+
+    def test_is_set(self):
+        config = LambdaConfig('test', {'API_RATE_LIMIT': '2.5'}, lambda_overrides={'test': {'API_RATE_BURST': '5'}})
+
+        self.assertTrue(config.is_set('API_RATE_LIMIT'))
+        self.assertTrue(config.is_set('API_RATE_BURST'))
+        self.assertTrue(config.is_set('SSM_CACHE_MAX_ENTRIES', 'API_RATE_LIMIT'))
+        self.assertFalse(config.is_set('SSM_CACHE_MAX_ENTRIES'))
+        self.assertTrue(config.freeze().is_set('API_RATE_LIMIT'))
+        self.assertFalse(config.freeze().is_set('SSM_CACHE_MAX_ENTRIES'))
+
+    def test_bad_numbers(self):
+        config = LambdaConfig('test', {'S3_BULK_WORKERS': 'lots', 'RDS_WORKERS': '0', 'API_RATE_BURST': '2.5', 'API_RATE_LIMIT': '-1'})
+
+        with self.assertRaisesRegex(ValueError, 'Invalid S3_BULK_WORKERS value specified; expected an integer'):
+            config.get_int('S3_BULK_WORKERS', 4)
+        with self.assertRaisesRegex(ValueError, 'Invalid RDS_WORKERS value specified; expected a value >= 1'):
+            config.get_int('RDS_WORKERS', 4, minimum=1)
+        with self.assertRaisesRegex(ValueError, 'Invalid API_RATE_BURST value specified; expected an integer'):
+            config.get_int('API_RATE_BURST', 0)
+        with self.assertRaisesRegex(ValueError, 'Invalid API_RATE_LIMIT value specified; expected a value >= 0'):
+            config.get_float('API_RATE_LIMIT', 0, minimum=0)
+
+    def test_client_options_default(self):
+        config = LambdaConfig('test', {})
+
+        self.assertEqual(config.get_client_options('s3'), {})
+
+    def test_client_options(self):
+        config = LambdaConfig(
+            'test',
+            {
+                'AWS_MAX_POOL_CONNECTIONS': '25',
+                'AWS_TCP_KEEPALIVE': 'on',
+                'AWS_CONNECT_TIMEOUT': '2',
+                'AWS_READ_TIMEOUT': '10',
+                'AWS_RETRY_MODE': 'standard',
+                'AWS_MAX_ATTEMPTS': '4',
+                'S3_MAX_POOL_CONNECTIONS': '50',
+                'S3_READ_TIMEOUT': '30.5'
+            },
+            lambda_overrides={'test': {'EC2_RETRY_MODE': 'adaptive', 'EC2_TCP_KEEPALIVE': 'off'}}
+        )
+
+        self.assertEqual(config.get_client_options('ssm'), {
+            'max_pool_connections': 25,
+            'tcp_keepalive': True,
+            'connect_timeout': 2.0,
+            'read_timeout': 10.0,
+            'retries': {'mode': 'standard', 'total_max_attempts': 4}
+        })
+        self.assertEqual(config.get_client_options('s3')['max_pool_connections'], 50)
+        self.assertEqual(config.get_client_options('s3')['read_timeout'], 30.5)
+        self.assertEqual(config.get_client_options('ec2')['retries'], {'mode': 'adaptive', 'total_max_attempts': 4})
+        self.assertNotIn('tcp_keepalive', config.get_client_options('ec2'))
+        self.assertEqual(config.freeze().get_client_options('s3'), config.get_client_options('s3'))
+
+    def test_bad_client_options(self):
+        values = (
+            {'S3_RETRY_MODE': 'nonsense'},
+            {'S3_TCP_KEEPALIVE': 'nonsense'},
+            {'S3_MAX_POOL_CONNECTIONS': 'nonsense'}
+        )
+        for value in values:
+            with self.subTest(value=value):
+                config = LambdaConfig('test', value)
+
+                self.assertRaises(ValueError, config.get_client_options, 's3')
+
+    def test_log_sampling(self):
+        config = LambdaConfig('test', {'LOG_SAMPLE_RATES': 'botocore=0.01, test.sweep = 0.5,'})
+
+        self.assertEqual(config.get_log_sample_rates(), {'botocore': 0.01, 'test.sweep': 0.5})
+
+    def test_no_log_sampling(self):
+        config = LambdaConfig('test', {})
+
+        self.assertEqual(config.get_log_sample_rates(), {})
+
+    def test_bad_log_sample_rates(self):
+        for value in ('botocore', 'botocore=', '=0.5', 'botocore=lots'):
+            with self.subTest(value=value):
+                self.assertRaises(ValueError, LambdaConfig('test', {'LOG_SAMPLE_RATES': value}).get_log_sample_rates)
+
     def test_notification_arn(self):
         values = ('mynotificationarn', 'MYNOTIFICATIONARN')
         for value in values:
@@ -517,5 +643,60 @@ class LambdaConfigTestCase(unittest.TestCase):
 
                 self.assertEqual(config.get_notification_arn(), value)
 
+class FrozenLambdaConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = LambdaConfig(
+            'test',
+            {
+                'AWS_REGION': 'US-EAST-1',
+                'GLOBAL_PREFIX': 'test',
+                'APPLICATION_NAME': 'myappname',
+                'ENVIRONMENT': 'dev',
+                'STACK_NAME': 'stack-a',
+                'DEBUG_MODE': 'on',
+                'SAFE_MODE': 'off'
+            },
+            overrides={'ENVIRONMENT': 'prod'},
+            lambda_overrides={'test': {'STACK_NAME': 'stack-b'}, 'other': {'STACK_NAME': 'stack-c'}}
+        )
+        self.frozen = self.config.freeze()
+
+    def test_freeze(self):
+        self.assertIsInstance(self.frozen, FrozenLambdaConfig)
+        self.assertIs(self.frozen.freeze(), self.frozen)
+
+    def test_getters_match(self):
+        for getter in ('get_aws_region', 'get_global_prefix', 'get_application_name', 'get_environment', 'get_stack_name', 'get_debug_mode', 'get_safe_mode', 'get_fips_mode', 'get_log_level', 'get_log_sample_rates'):
+            with self.subTest(getter=getter):
+                self.assertEqual(getattr(self.frozen, getter)(), getattr(self.config, getter)())
+
+    def test_layer_precedence(self):
+        self.assertEqual(self.frozen.get_environment(), 'prod')
+        self.assertEqual(self.frozen.get_stack_name(), 'stack-b')
+
+    def test_unresolvable_getter(self):
+        self.assertRaises(ValueError, self.frozen.get_notification_arn)
+
+    def test_val(self):
+        self.assertEqual(self.frozen.val('AWS_REGION'), 'US-EAST-1')
+        self.assertEqual(self.frozen.val('AWS_REGION', to_lower=True), 'us-east-1')
+        self.assertIs(self.frozen.val('DEBUG_MODE', bool_coerce=True), True)
+        self.assertEqual(self.frozen.val('NONSENSE', default_override='fallback'), 'fallback')
+        self.assertRaises(ValueError, self.frozen.val, 'NONSENSE')
+
+    def test_build_names(self):
+        self.assertEqual(
+            self.frozen.build_ssm_param_name('param1', include_global_prefix=True, include_application_name=True, include_environment=True, include_stack_name=True),
+            '/test/myappname/prod/stack-b/ssm/param1'
+        )
+        self.assertEqual(self.frozen.build_legacy_ssm_param_name('param1', include_global_prefix=True), 'test-ssm-param1')
+        self.assertEqual(self.frozen.build_bucket_name('bucket'), 'test-myappname-bucket')
+
+    def test_immutable(self):
+        self.assertFalse(hasattr(self.frozen, '__dict__'))
+
+        with self.assertRaises(AttributeError):
+            self.frozen.stack_name = 'nonsense'
+
 if __name__ == '__main__':
     unittest.main()
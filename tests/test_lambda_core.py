@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+import json
+import threading
+import unittest
+import unittest.mock
+from botocore.stub import ANY, Stubber
+from crimsoncore import LambdaCore
+
+class LambdaCoreServicesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = LambdaCore('test', {'AWS_REGION': 'us-east-1'})
+
+    def test_lazy_init(self):
+        self.assertNotIn('_sns', self.core.__dict__)
+
+        self.assertEqual(self.core.sns.meta.service_model.service_name, 'sns')
+        self.assertIs(self.core.sns, self.core.__dict__['_sns'])
+
+    def test_lazy_init_fips(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-gov-west-1'})
+
+        self.assertEqual(core.awslambda.meta.endpoint_url, 'https://lambda-fips.us-gov-west-1.amazonaws.com')
+
+    def test_retry_config(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-east-1', 'AWS_RETRY_MODE': 'adaptive', 'AWS_MAX_ATTEMPTS': '7'})
+
+        self.assertEqual(core.rds.meta.config.retries, {'mode': 'adaptive', 'total_max_attempts': 7})
+
+    def test_client_options(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-east-1', 'AWS_MAX_POOL_CONNECTIONS': '20', 'S3_MAX_POOL_CONNECTIONS': '64'})
+
+        self.assertEqual(core.ssm.meta.config.max_pool_connections, 20)
+        self.assertEqual(core.s3.meta.config.max_pool_connections, 64)
+        self.assertEqual(core.s3.meta.config.signature_version, 's3v4')
+        self.assertEqual(core.ec2.meta.client.meta.config.max_pool_connections, 20)
+
+    def test_ec2_resource_per_thread(self):
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.core.ec2))
+        thread.start()
+        thread.join()
+
+        self.assertIs(self.core.ec2, self.core.ec2)
+        self.assertIsNot(self.core.ec2, other[0])
+        self.assertIs(self.core.ec2.meta.client, other[0].meta.client)
+
+    def test_warm(self):
+        self.core.warm(['ssm', 's3'])
+
+        self.assertIsNotNone(self.core.__dict__.get('_ssm'))
+        self.assertIsNotNone(self.core.__dict__.get('_s3'))
+        self.assertNotIn('_rds', self.core.__dict__)
+
+    def test_warm_unknown_service(self):
+        self.assertRaises(ValueError, self.core.warm, ['nonsense'])
+
+    def test_parameter_cache_shared(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-east-1', 'SSM_CACHE_MAX_ENTRIES': '1000'})
+        self.addCleanup(core.parameter_cache.resize, 256)
+
+        # a LambdaCore that doesn't size the shared parameter cache leaves it as it was
+        LambdaCore('other', {'AWS_REGION': 'us-east-1'})
+
+        self.assertEqual(core.parameter_cache.max_entries, 1000)
+
+    def test_rate_limiter_shared(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-east-1', 'API_RATE_LIMIT': '5'})
+        self.addCleanup(core.rate_limiter.configure, 0)
+
+        # a LambdaCore that doesn't configure the shared rate limiter leaves it as it was
+        LambdaCore('other', {'AWS_REGION': 'us-east-1'})
+
+        self.assertEqual(core.rate_limiter.rate, 5)
+
+class LambdaCoreSSMTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = LambdaCore('test', {
+            'AWS_REGION': 'us-east-1',
+            'GLOBAL_PREFIX': 'test',
+            'APPLICATION_NAME': 'myappname',
+            'SSM_CACHE_TTL': '300'
+        })
+        self.core.init_ssm()
+        self.core.parameter_cache.invalidate()
+        self.core.parameter_cache.reset_stats()
+
+        self.stubber = Stubber(self.core.ssm)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_get_ssm_parameter_cached(self):
+        self.stubber.add_response(
+            'get_parameter',
+            {'Parameter': {'Name': '/test/myappname/ssm/param1', 'Value': 'value1'}},
+            {'Name': '/test/myappname/ssm/param1', 'WithDecryption': False}
+        )
+
+        self.assertEqual(self.core.get_ssm_parameter('param1'), 'value1')
+        self.assertEqual(self.core.get_ssm_parameter('param1'), 'value1')
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(self.core.parameter_cache.stats()['hits'], 1)
+
+    def test_get_ssm_parameter_not_cached_by_default(self):
+        core = LambdaCore('test', {'AWS_REGION': 'us-east-1', 'GLOBAL_PREFIX': 'test', 'APPLICATION_NAME': 'myappname'})
+        core.ssm = self.core.ssm
+
+        for _ in range(2):
+            self.stubber.add_response(
+                'get_parameter',
+                {'Parameter': {'Name': '/test/myappname/ssm/param1', 'Value': 'value1'}},
+                {'Name': '/test/myappname/ssm/param1', 'WithDecryption': False}
+            )
+
+        self.assertEqual(core.get_ssm_parameter('param1'), 'value1')
+        self.assertEqual(core.get_ssm_parameter('param1'), 'value1')
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(len(core.parameter_cache), 0)
+
+    def test_emit_metrics(self):
+        self.core.metrics.reset()
+        self.stubber.add_response('get_parameter', {'Parameter': {'Value': 'value1'}})
+
+        self.core.get_ssm_parameter('param1')
+        self.core.get_ssm_parameter('param1')
+
+        with unittest.mock.patch('builtins.print') as mock_print:
+            document = json.loads(self.core.emit_metrics())
+
+        mock_print.assert_called_once()
+        self.assertEqual(document['Lambda'], 'test')
+        self.assertEqual(document['ssm.GetParameter.count'], 1)
+        self.assertEqual(document['ssm.cache.hits'], 1)
+        self.assertEqual(document['ssm.cache.misses'], 1)
+        self.assertEqual(self.core.metrics.summary()['counters'], {})
+
+    def test_get_ssm_parameter_uncached(self):
+        for value in ('value1', 'value2'):
+            self.stubber.add_response(
+                'get_parameter',
+                {'Parameter': {'Name': '/test/myappname/ssm/param1', 'Value': value}},
+                {'Name': '/test/myappname/ssm/param1', 'WithDecryption': False}
+            )
+
+        self.assertEqual(self.core.get_ssm_parameter('param1', use_cache=False), 'value1')
+        self.assertEqual(self.core.get_ssm_parameter('param1', use_cache=False), 'value2')
+
+    def test_invalidate_ssm_parameter(self):
+        for value in ('value1', 'value2'):
+            self.stubber.add_response(
+                'get_parameter',
+                {'Parameter': {'Name': '/test/myappname/ssm/param1', 'Value': value}},
+                {'Name': '/test/myappname/ssm/param1', 'WithDecryption': False}
+            )
+
+        self.assertEqual(self.core.get_ssm_parameter('param1'), 'value1')
+        self.core.invalidate_ssm_parameter('param1')
+        self.assertEqual(self.core.get_ssm_parameter('param1'), 'value2')
+
+    def test_get_ssm_parameters_batched(self):
+        names = [f'param{i}' for i in range(12)]
+        full_names = [f'/test/myappname/ssm/{name}' for name in names]
+
+        self.stubber.add_response(
+            'get_parameters',
+            {'Parameters': [{'Name': name, 'Value': name.upper()} for name in full_names[:10]]},
+            {'Names': full_names[:10], 'WithDecryption': False}
+        )
+        self.stubber.add_response(
+            'get_parameters',
+            {'Parameters': [{'Name': full_names[10], 'Value': 'VALUE10'}], 'InvalidParameters': [full_names[11]]},
+            {'Names': full_names[10:], 'WithDecryption': False}
+        )
+
+        values, invalid = self.core.get_ssm_parameters(names, max_workers=1)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(len(values), 11)
+        self.assertEqual(values['param0'], '/TEST/MYAPPNAME/SSM/PARAM0')
+        self.assertEqual(values['param10'], 'VALUE10')
+        self.assertEqual(invalid, ['param11'])
+
+        # everything that was found should now be served from the cache
+        self.assertEqual(self.core.get_ssm_parameters(names[:11])[0], values)
+
+    def _add_path_pages(self, recursive=False):
+        request = {'Path': '/test/myappname/', 'Recursive': recursive, 'WithDecryption': False, 'MaxResults': 10}
+
+        self.stubber.add_response(
+            'get_parameters_by_path',
+            {'Parameters': [{'Name': '/test/myappname/ssm/param1', 'Value': 'value1'}], 'NextToken': 'page2'},
+            request
+        )
+        self.stubber.add_response(
+            'get_parameters_by_path',
+            {'Parameters': [{'Name': '/test/myappname/ssm/param2', 'Value': 'value2'}]},
+            dict(request, NextToken='page2')
+        )
+
+    def test_get_ssm_parameters_by_path(self):
+        for prefetch in (False, True):
+            with self.subTest(prefetch=prefetch):
+                self._add_path_pages(recursive=True)
+
+                self.assertEqual(
+                    self.core.get_ssm_parameters_by_path(recursive=True, prefetch=prefetch),
+                    {
+                        '/test/myappname/ssm/param1': 'value1',
+                        '/test/myappname/ssm/param2': 'value2'
+                    }
+                )
+                self.stubber.assert_no_pending_responses()
+
+    def test_get_ssm_parameters_by_path_keeps_hot_parameters_cached(self):
+        self.stubber.add_response('get_parameter', {'Parameter': {'Name': '/test/myappname/ssm/hot', 'Value': 'hot'}})
+        self.core.get_ssm_parameter('hot')
+
+        # a tree larger than the whole cache
+        tree_size = self.core.parameter_cache.max_entries + 50
+        request = {'Path': '/test/myappname/', 'Recursive': True, 'WithDecryption': False, 'MaxResults': 10}
+        for start in range(0, tree_size, 10):
+            response = {'Parameters': [{'Name': f'/test/myappname/ssm/param{i}', 'Value': f'value{i}'} for i in range(start, min(start + 10, tree_size))]}
+            if start + 10 < tree_size:
+                response['NextToken'] = str(start + 10)
+            self.stubber.add_response('get_parameters_by_path', response, dict(request, NextToken=str(start)) if start else request)
+
+        self.assertEqual(len(self.core.get_ssm_parameters_by_path(recursive=True)), tree_size)
+        self.stubber.assert_no_pending_responses()
+
+        self.assertEqual(len(self.core.parameter_cache), 1)
+        self.assertEqual(self.core.get_ssm_parameter('hot'), 'hot')
+
+    def test_get_ssm_parameters_by_path_use_cache(self):
+        self._add_path_pages()
+
+        self.core.get_ssm_parameters_by_path(use_cache=True)
+
+        self.assertEqual(self.core.parameter_cache.get(('/test/myappname/ssm/param2', False)), 'value2')
+
+    def test_iter_ssm_parameters_by_path_is_lazy(self):
+        self._add_path_pages()
+
+        parameters = self.core.iter_ssm_parameters_by_path()
+        self.assertEqual(next(parameters)['Value'], 'value1')
+
+        # the second page must not have been requested yet
+        self.assertRaises(AssertionError, self.stubber.assert_no_pending_responses)
+
+        self.assertEqual(next(parameters)['Value'], 'value2')
+        self.stubber.assert_no_pending_responses()
+
+    def test_refresh_ssm_parameters(self):
+        self.stubber.add_response(
+            'get_parameters',
+            {'Parameters': [
+                {'Name': f'/test/myappname/ssm/param{i}', 'Value': f'value{i}', 'Version': 1} for i in range(3)
+            ]}
+        )
+        self.core.get_ssm_parameters(['param0', 'param1', 'param2'])
+
+        self.stubber.add_response(
+            'describe_parameters',
+            {'Parameters': [
+                {'Name': '/test/myappname/ssm/param0', 'Version': 1},
+                {'Name': '/test/myappname/ssm/param1', 'Version': 2}
+            ]},
+            {'ParameterFilters': [{'Key': 'Path', 'Option': 'Recursive', 'Values': ['/test/myappname']}], 'MaxResults': 50}
+        )
+        self.stubber.add_response(
+            'get_parameters',
+            {'Parameters': [{'Name': '/test/myappname/ssm/param1', 'Value': 'changed', 'Version': 2}]},
+            {'Names': ['/test/myappname/ssm/param1'], 'WithDecryption': False}
+        )
+
+        changes = []
+        self.core.on_ssm_parameter_change(lambda name, old_value, new_value: changes.append((name, old_value, new_value)))
+
+        self.assertEqual(self.core.refresh_ssm_parameters(), {
+            '/test/myappname/ssm/param1': 'changed',
+            '/test/myappname/ssm/param2': None
+        })
+        self.stubber.assert_no_pending_responses()
+
+        self.assertEqual(sorted(changes), [
+            ('/test/myappname/ssm/param1', 'value1', 'changed'),
+            ('/test/myappname/ssm/param2', 'value2', None)
+        ])
+        self.assertEqual(self.core.get_ssm_parameter('param0'), 'value0')
+        self.assertEqual(self.core.get_ssm_parameter('param1'), 'changed')
+        self.assertEqual(self.core.parameter_cache.metadata(('/test/myappname/ssm/param1', False)), (2, None))
+
+    def test_refresh_ssm_parameters_nothing_cached(self):
+        self.assertEqual(self.core.refresh_ssm_parameters(), {})
+        self.stubber.assert_no_pending_responses()
+
+class LambdaCoreNotificationTestCase(unittest.TestCase):
+    def _core(self, **env):
+        core = LambdaCore('test', dict({
+            'AWS_REGION': 'us-east-1',
+            'NOTIFICATION_ARN': 'arn:aws:sns:us-east-1:123456789012:notifications'
+        }, **env))
+
+        stubber = Stubber(core.sns)
+        stubber.activate()
+        self.addCleanup(stubber.deactivate)
+
+        return core, stubber
+
+    def test_build_notification_message(self):
+        core, _ = self._core()
+
+        self.assertEqual(
+            json.loads(json.loads(core.build_notification_message('info', 'hello'))['default']),
+            {'type': 'info', 'lambda': 'test', 'message': 'hello'}
+        )
+
+    def test_send_notification(self):
+        core, stubber = self._core()
+        stubber.add_response('publish', {'MessageId': '1'}, {
+            'TargetArn': 'arn:aws:sns:us-east-1:123456789012:notifications',
+            'Message': core.build_notification_message('info', 'hello'),
+            'MessageStructure': 'json'
+        })
+
+        core.send_notification('info', 'hello')
+
+        stubber.assert_no_pending_responses()
+
+    def test_send_notification_disabled(self):
+        core, _ = self._core(NOTIFICATIONS_ENABLED='off')
+
+        core.send_notification('info', 'hello')
+
+    def test_send_notification_async(self):
+        core, stubber = self._core(NOTIFICATIONS_ASYNC='on', NOTIFICATIONS_WORKERS='1')
+        for _ in range(3):
+            stubber.add_response('publish', {'MessageId': '1'}, {'TargetArn': ANY, 'Message': ANY, 'MessageStructure': 'json'})
+
+        for i in range(3):
+            core.send_notification('info', f'hello {i}')
+
+        self.assertTrue(core.flush_notifications(timeout=5))
+        stubber.assert_no_pending_responses()
+
+    def test_send_notifications(self):
+        core, stubber = self._core()
+        notifications = [('info', f'hello {i}') for i in range(12)]
+        messages = [core.build_notification_message(*notification) for notification in notifications]
+
+        stubber.add_response(
+            'publish_batch',
+            {
+                'Successful': [{'Id': str(i), 'MessageId': f'm{i}'} for i in range(10) if i not in (3, 4)],
+                'Failed': [
+                    {'Id': '3', 'Code': 'InternalError', 'SenderFault': False},
+                    {'Id': '4', 'Code': 'InvalidParameter', 'Message': 'bad', 'SenderFault': True}
+                ]
+            },
+            {
+                'TopicArn': 'arn:aws:sns:us-east-1:123456789012:notifications',
+                'PublishBatchRequestEntries': [{'Id': str(i), 'Message': messages[i], 'MessageStructure': 'json'} for i in range(10)]
+            }
+        )
+        stubber.add_response('publish', {'MessageId': 'm3-retry'}, {'TargetArn': ANY, 'Message': messages[3], 'MessageStructure': 'json'})
+        stubber.add_response(
+            'publish_batch',
+            {'Successful': [{'Id': '0', 'MessageId': 'm10'}, {'Id': '1', 'MessageId': 'm11'}], 'Failed': []},
+            {'TopicArn': ANY, 'PublishBatchRequestEntries': ANY}
+        )
+
+        with self.assertLogs('test', level='WARNING'):
+            results = core.send_notifications(notifications)
+
+        stubber.assert_no_pending_responses()
+        self.assertEqual(len(results), 12)
+        self.assertEqual(results[0], {'message_id': 'm0', 'error': None, 'retried': False})
+        self.assertEqual(results[3], {'message_id': 'm3-retry', 'error': None, 'retried': True})
+        self.assertEqual(results[4], {'message_id': None, 'error': 'InvalidParameter: bad', 'retried': False})
+        self.assertEqual(results[11]['message_id'], 'm11')
+
+    def test_send_notification_async_batched(self):
+        core, stubber = self._core(NOTIFICATIONS_ASYNC='on', NOTIFICATIONS_BATCH='on', NOTIFICATIONS_WORKERS='1')
+        stubber.add_response('publish_batch', {'Successful': [{'Id': '0', 'MessageId': 'm0'}], 'Failed': []}, {'TopicArn': ANY, 'PublishBatchRequestEntries': ANY})
+
+        core.send_notification('info', 'hello')
+
+        self.assertTrue(core.flush_notifications(timeout=5))
+        stubber.assert_no_pending_responses()
+
+    def test_send_notification_async_batched_failed(self):
+        core, stubber = self._core(NOTIFICATIONS_ASYNC='on', NOTIFICATIONS_BATCH='on', NOTIFICATIONS_WORKERS='1')
+        stubber.add_response(
+            'publish_batch',
+            {'Successful': [], 'Failed': [{'Id': '0', 'Code': 'InvalidParameter', 'Message': 'bad', 'SenderFault': True}]},
+            {'TopicArn': ANY, 'PublishBatchRequestEntries': ANY}
+        )
+
+        with self.assertLogs('test', level='WARNING'):
+            core.send_notification('info', 'hello')
+            self.assertFalse(core.flush_notifications(timeout=5))
+
+        stubber.assert_no_pending_responses()
+        self.assertEqual(len(core.notification_dispatcher.last_errors), 1)
+        self.assertIn('InvalidParameter: bad', str(core.notification_dispatcher.last_errors[0]))
+
+    def test_send_notifications_missing_result(self):
+        core, stubber = self._core()
+        stubber.add_response(
+            'publish_batch',
+            {'Successful': [{'Id': '0', 'MessageId': 'm0'}], 'Failed': []},
+            {'TopicArn': ANY, 'PublishBatchRequestEntries': ANY}
+        )
+
+        with self.assertLogs('test', level='WARNING'):
+            results = core.send_notifications([('info', 'hello'), ('info', 'world')])
+
+        stubber.assert_no_pending_responses()
+        self.assertEqual(results[0], {'message_id': 'm0', 'error': None, 'retried': False})
+        self.assertIsNone(results[1]['message_id'])
+        self.assertIn('did not report on entry 1', results[1]['error'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import io
+import json
+import threading
+import unittest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+from crimsoncore import LambdaCore
+from crimsoncore import lambda_fanout
+
+class ThrottledError(Exception):
+    def __init__(self):
+        super().__init__('Rate exceeded')
+        self.response = {'Error': {'Code': 'TooManyRequestsException'}}
+
+class FakeLambdaClient:
+    def __init__(self, throttles=0):
+        self.throttles = throttles
+        self.payloads = []
+        self._lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType, Payload): # pylint: disable=C0103,W0613
+        with self._lock:
+            if self.throttles > 0:
+                self.throttles -= 1
+                raise ThrottledError()
+
+            self.payloads.append(json.loads(Payload))
+
+        return {'StatusCode': 202}
+
+class LambdaFanoutTestCase(unittest.TestCase):
+    def test_build_chunks(self):
+        self.assertEqual(lambda_fanout.build_chunks(range(5), 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(lambda_fanout.build_chunks([], 2), [])
+
+    def test_invoke_retries_throttles(self):
+        client = FakeLambdaClient(throttles=2)
+        slept = []
+
+        result = lambda_fanout.invoke(client, 'worker', {'a': 1}, sleep=slept.append)
+
+        self.assertEqual(result['status_code'], 202)
+        self.assertEqual(result['attempts'], 3)
+        self.assertEqual(len(slept), 2)
+
+    def test_invoke_gives_up(self):
+        client = FakeLambdaClient(throttles=10)
+
+        result = lambda_fanout.invoke(client, 'worker', {}, max_attempts=3, sleep=lambda _: None)
+
+        self.assertEqual(result['attempts'], 3)
+        self.assertIn('Rate exceeded', result['error'])
+
+    def test_invoke_all(self):
+        client = FakeLambdaClient(throttles=3)
+
+        results = lambda_fanout.invoke_all(client, 'worker', [{'n': n} for n in range(20)], concurrency=4, sleep=lambda _: None)
+
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(result['error'] is None for result in results))
+        self.assertEqual(sorted(payload['n'] for payload in client.payloads), list(range(20)))
+
+    def test_invoke_does_not_retry_service_errors(self):
+        class ServiceError(Exception):
+            response = {'Error': {'Code': 'ServiceException'}}
+
+        class FailingClient:
+            calls = 0
+
+            def invoke(self, **kwargs): # pylint: disable=W0613
+                self.calls += 1
+                raise ServiceError('internal error')
+
+        client = FailingClient()
+        result = lambda_fanout.invoke(client, 'worker', {}, sleep=lambda _: None)
+
+        self.assertEqual(result['attempts'], 1)
+        self.assertEqual(client.calls, 1)
+
+    def test_bad_invocation_type(self):
+        self.assertRaises(ValueError, lambda_fanout.invoke, FakeLambdaClient(), 'worker', {}, invocation_type='nonsense')
+
+class LambdaCoreFanoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = LambdaCore('test', {'AWS_REGION': 'us-east-1', 'FANOUT_CONCURRENCY': '1'})
+
+        self.client = self.core._get_lambda_client(config={'retries': {'total_max_attempts': 1}})
+        self.stubber = Stubber(self.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_fan_out_request_response(self):
+        for chunk in ([1, 2], [3]):
+            body = json.dumps({'processed': len(chunk)}).encode('utf-8')
+            self.stubber.add_response(
+                'invoke',
+                {'StatusCode': 200, 'Payload': StreamingBody(io.BytesIO(body), len(body))},
+                {'FunctionName': 'worker', 'InvocationType': 'RequestResponse', 'Payload': json.dumps({'job': 'sweep', 'items': chunk}).encode('utf-8')}
+            )
+
+        results = self.core.lambda_fanout.fan_out('worker', [1, 2, 3], chunk_size=2, invocation_type='RequestResponse', payload={'job': 'sweep'})
+
+        self.assertEqual([result['payload'] for result in results], [{'processed': 2}, {'processed': 1}])
+        self.stubber.assert_no_pending_responses()
+
+    def test_invoke(self):
+        self.stubber.add_response('invoke', {'StatusCode': 202}, {'FunctionName': 'worker', 'InvocationType': 'Event', 'Payload': json.dumps({'job': 'sweep'}).encode('utf-8')})
+
+        result = self.core.lambda_fanout.invoke('worker', {'job': 'sweep'})
+
+        self.assertEqual(result, {'status_code': 202, 'payload': None, 'function_error': None, 'error': None, 'attempts': 1})
+        self.stubber.assert_no_pending_responses()
+
+    def test_fan_out_client_without_botocore_retries(self):
+        self.assertEqual(self.client.meta.config.retries['total_max_attempts'], 1)
+        self.assertIsNot(self.client, self.core.awslambda)
+
+    def test_fan_out_function_error(self):
+        self.stubber.add_response('invoke', {'StatusCode': 200, 'FunctionError': 'Unhandled'}, {'FunctionName': 'worker', 'InvocationType': 'Event', 'Payload': ANY})
+
+        with self.assertLogs('test', level='WARNING'):
+            results = self.core.lambda_fanout.fan_out('worker', ['a'])
+
+        self.assertEqual(results[0]['function_error'], 'Unhandled')
+        self.stubber.assert_no_pending_responses()
+
+if __name__ == '__main__':
+    unittest.main()
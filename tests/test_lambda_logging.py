@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from crimsoncore import LambdaCore
+from crimsoncore import lambda_logging
+from crimsoncore.lambda_logging import BufferedLogHandler, JsonFormatter, LogSampler, configure_logger
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+class JsonFormatterTestCase(unittest.TestCase):
+    def test_format(self):
+        formatter = JsonFormatter(lambda_name='test', log_group='group')
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+
+        line = json.loads(formatter.format(record))
+
+        self.assertEqual(line['lambda_name'], 'test')
+        self.assertEqual(line['log_group'], 'group')
+        self.assertEqual(line['level'], 'INFO')
+        self.assertEqual(line['message'], 'hello world')
+
+    def test_bind(self):
+        formatter = JsonFormatter()
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'hello', None, None)
+
+        self.assertNotIn('request_id', json.loads(formatter.format(record)))
+
+        formatter.bind(request_id='abc')
+        self.assertEqual(json.loads(formatter.format(record))['request_id'], 'abc')
+
+    def test_exception(self):
+        formatter = JsonFormatter()
+        try:
+            raise RuntimeError('nope')
+        except RuntimeError:
+            record = logging.LogRecord('test', logging.ERROR, __file__, 1, 'failed', None, sys.exc_info())
+
+        self.assertIn('RuntimeError: nope', json.loads(formatter.format(record))['exception'])
+
+class BufferedLogHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stream = CountingStream()
+        self.logger = logging.getLogger('crimsoncore.tests.buffered')
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = configure_logger(self.logger, log_format='json', buffer_size=1000, flush_interval=60, stream=self.stream, lambda_name='test')
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def test_buffers_until_flushed(self):
+        args = ['a']
+        for i in range(10):
+            self.logger.debug('record %d %s', i, args)
+        args.append('b')
+
+        self.assertEqual(self.stream.getvalue(), '')
+
+        self.handler.flush()
+
+        lines = [json.loads(line) for line in self.stream.getvalue().splitlines()]
+        self.assertEqual([line['message'] for line in lines], [f"record {i} ['a']" for i in range(10)])
+        self.assertEqual(self.stream.writes, 1)
+
+    def test_flushes_when_full(self):
+        handler = BufferedLogHandler(stream=self.stream, buffer_size=5, flush_interval=60)
+        try:
+            for i in range(5):
+                handler.handle(logging.LogRecord('test', logging.INFO, __file__, 1, 'record %d', (i,), None))
+
+            # the background thread writes the full buffer out
+            for _ in range(100):
+                if self.stream.getvalue():
+                    break
+                time.sleep(0.01)
+
+            self.assertEqual(len(self.stream.getvalue().splitlines()), 5)
+        finally:
+            handler.close()
+
+    def test_no_timed_flush(self):
+        handler = BufferedLogHandler(stream=self.stream, buffer_size=5, flush_interval=0)
+        try:
+            with patch.object(handler, 'flush', wraps=handler.flush) as flush:
+                handler.handle(logging.LogRecord('test', logging.INFO, __file__, 1, 'record', None, None))
+                time.sleep(0.05)
+
+                # the background thread waits for the buffer to fill, rather than spinning on a zero timeout
+                flush.assert_not_called()
+                self.assertEqual(self.stream.getvalue(), '')
+        finally:
+            handler.close()
+
+        self.assertEqual(self.stream.getvalue().splitlines(), ['record'])
+
+    def test_bad_record(self):
+        with patch.object(self.handler, 'handleError') as handle_error:
+            self.logger.info('record %d', 'not a number')
+
+        handle_error.assert_called_once()
+        self.handler.flush()
+        self.assertEqual(self.stream.getvalue(), '')
+
+    def test_reconfigure_replaces_handler(self):
+        handler = configure_logger(self.logger, log_format='json', buffer_size=10, stream=self.stream)
+
+        self.assertEqual([existing for existing in self.logger.handlers if isinstance(existing, BufferedLogHandler)], [handler])
+        self.assertTrue(self.handler._closed)
+        self.handler = handler
+
+    def test_flushed_at_exit(self):
+        script = '''
+import logging
+from crimsoncore.lambda_logging import configure_logger
+logger = logging.getLogger('atexit')
+configure_logger(logger, buffer_size=1000, flush_interval=60)
+logger.warning('written at exit')
+'''
+        result = subprocess.run(
+            [sys.executable, '-c', script],
+            check=True,
+            stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        )
+
+        self.assertIn(b'written at exit', result.stdout)
+
+class LogSamplerTestCase(unittest.TestCase):
+    def record(self, msg, args=None, name='test', level=logging.DEBUG):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+    def test_sampling(self):
+        rolls = iter([0.05, 0.5, 0.05, 0.9])
+        sampler = LogSampler(sample_rates={'chatty': 0.1}, default_rate=0.75, rand=lambda: next(rolls))
+
+        self.assertTrue(sampler.filter(self.record('a', name='chatty')))
+        self.assertFalse(sampler.filter(self.record('a', name='chatty')))
+        self.assertTrue(sampler.filter(self.record('a', name='other')))
+        self.assertFalse(sampler.filter(self.record('a', name='other')))
+
+    def test_child_loggers_use_ancestor_rate(self):
+        sampler = LogSampler(sample_rates={'botocore': 0, 'botocore.hooks': 1}, default_rate=1, rand=lambda: 0.5)
+
+        self.assertFalse(sampler.filter(self.record('a', name='botocore')))
+        self.assertFalse(sampler.filter(self.record('a', name='botocore.endpoint')))
+        self.assertTrue(sampler.filter(self.record('a', name='botocore.hooks.handlers')))
+        self.assertTrue(sampler.filter(self.record('a', name='botocorex')))
+
+    def test_sampled_once_per_record(self):
+        rolls = iter([0.05, 0.9])
+        sampler = LogSampler(default_rate=0.1, rand=lambda: next(rolls))
+        kept = self.record('a')
+        dropped = self.record('b')
+
+        # as when a record reaches several handlers carrying the same sampler
+        self.assertTrue(sampler.filter(kept))
+        self.assertTrue(sampler.filter(kept))
+        self.assertFalse(sampler.filter(dropped))
+        self.assertFalse(sampler.filter(dropped))
+        self.assertEqual(sampler.summarize(), {('test', 'b'): 1})
+
+    def test_higher_levels_pass(self):
+        sampler = LogSampler(default_rate=0, rand=lambda: 0.99)
+
+        self.assertFalse(sampler.filter(self.record('a')))
+        self.assertTrue(sampler.filter(self.record('a', level=logging.INFO)))
+        self.assertTrue(sampler.filter(self.record('a', level=logging.ERROR)))
+
+    def test_rate_limit_per_template(self):
+        now = [0.0]
+        sampler = LogSampler(rate_limit=1, rate_burst=2, clock=lambda: now[0])
+
+        results = [sampler.filter(self.record('item %d', (i,))) for i in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+
+        # a different template has its own bucket
+        self.assertTrue(sampler.filter(self.record('other %d', (1,))))
+
+        now[0] = 1.0
+        record = self.record('item %d', (5,))
+        self.assertTrue(sampler.filter(record))
+        self.assertEqual(record.getMessage(), 'item 5 (suppressed 3 similar messages)')
+
+    def test_summarize(self):
+        sampler = LogSampler(default_rate=0, rand=lambda: 0.5)
+
+        for i in range(3):
+            sampler.filter(self.record('item %d', (i,)))
+
+        self.assertEqual(sampler.summarize(), {('test', 'item %d'): 3})
+        self.assertEqual(sampler.summarize(), {})
+
+class LambdaCoreLoggingTestCase(unittest.TestCase):
+    def tearDown(self):
+        logger = logging.getLogger('test-logging')
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        logger.propagate = True
+
+    def test_json_logging(self):
+        core = LambdaCore('test-logging', {
+            'LOG_FORMAT': 'json',
+            'LOG_BUFFER_SIZE': '100',
+            'AWS_LAMBDA_LOG_GROUP_NAME': '/aws/lambda/test-logging',
+            'AWS_LAMBDA_LOG_STREAM_NAME': 'stream'
+        })
+        stream = io.StringIO()
+        core.logger.handlers[0].stream = stream
+
+        core.bind_request_id('request-1')
+        core.logger.info('hello')
+        self.assertEqual(stream.getvalue(), '')
+
+        core.flush_logs()
+
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line['lambda_name'], 'test-logging')
+        self.assertEqual(line['log_group'], '/aws/lambda/test-logging')
+        self.assertEqual(line['log_stream'], 'stream')
+        self.assertEqual(line['request_id'], 'request-1')
+        self.assertEqual(line['message'], 'hello')
+
+    def buffered_core(self):
+        core = LambdaCore('test-logging', {'LOG_FORMAT': 'json', 'LOG_BUFFER_SIZE': '100'})
+        stream = io.StringIO()
+        core.logger.handlers[0].stream = stream
+
+        return core, stream
+
+    def test_invocation_flushes_on_error(self):
+        core, stream = self.buffered_core()
+
+        with self.assertRaises(RuntimeError):
+            with core.invocation(SimpleNamespace(aws_request_id='request-1')):
+                core.logger.info('hello')
+                raise RuntimeError('boom')
+
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line['message'], 'hello')
+        self.assertEqual(line['request_id'], 'request-1')
+
+    def test_handler_decorator(self):
+        core, stream = self.buffered_core()
+        core.metrics.reset()
+
+        @core.handler(emit_metrics=True)
+        def handler(event, context):
+            core.logger.info('handling %s', event)
+            return 'done'
+
+        with patch('builtins.print') as mock_print:
+            self.assertEqual(handler('event', SimpleNamespace(aws_request_id='request-2')), 'done')
+
+        mock_print.assert_called_once()
+        self.assertEqual(json.loads(stream.getvalue())['message'], 'handling event')
+        self.assertEqual(handler.__name__, 'handler')
+
+    def test_emit_metrics_flushes_logs(self):
+        core, stream = self.buffered_core()
+
+        core.logger.info('hello')
+        with patch('builtins.print'):
+            core.emit_metrics()
+
+        self.assertEqual(json.loads(stream.getvalue())['message'], 'hello')
+
+    def test_default_leaves_logger_alone(self):
+        core = LambdaCore('test-logging', {})
+
+        self.assertEqual(core.logger.handlers, [])
+        self.assertTrue(core.logger.propagate)
+
+    def test_log_sampling(self):
+        core = LambdaCore('test-logging', {'DEBUG_MODE': 'on', 'LOG_FORMAT': 'json', 'LOG_RATE_LIMIT': '1', 'LOG_RATE_BURST': '2'})
+        stream = io.StringIO()
+        core.logger.handlers[0].stream = stream
+
+        for i in range(10):
+            core.logger.debug('polling %d', i)
+        core.flush_logs()
+
+        self.assertEqual([json.loads(line)['message'] for line in stream.getvalue().splitlines()], [
+            'polling 0',
+            'polling 1',
+            'suppressed 8 similar messages from test-logging: polling %d'
+        ])
+
+        # reconfiguring replaces the sampler rather than stacking another one
+        core = LambdaCore('test-logging', {'LOG_FORMAT': 'json', 'LOG_SAMPLE_RATE': '1'})
+        self.assertIsNone(core.log_sampler)
+        self.assertEqual(core.logger.handlers[0].filters, [])
+
+    def test_log_sampling_shared(self):
+        stream = io.StringIO()
+        root_handler = logging.StreamHandler(stream)
+        logging.getLogger().addHandler(root_handler)
+        self.addCleanup(logging.getLogger().removeHandler, root_handler)
+
+        core = LambdaCore('test-logging', {'LOG_SAMPLE_RATE': '0.1'})
+        self.addCleanup(lambda_logging.configure_sampler, [], None)
+
+        # a LambdaCore that doesn't configure sampling leaves the sampler already attached in place
+        other = LambdaCore('test-logging-other', {})
+
+        self.assertIsNone(other.log_sampler)
+        self.assertEqual(root_handler.filters, [core.log_sampler])
+
+    def test_log_sampling_child_loggers(self):
+        stream = io.StringIO()
+        root_handler = logging.StreamHandler(stream)
+        logging.getLogger().addHandler(root_handler)
+        self.addCleanup(logging.getLogger().removeHandler, root_handler)
+
+        child = logging.getLogger('botocore.endpoint')
+        level = child.level
+        child.setLevel(logging.DEBUG)
+        self.addCleanup(child.setLevel, level)
+
+        core = LambdaCore('test-logging', {'LOG_SAMPLE_RATES': 'botocore=0'})
+        self.addCleanup(lambda_logging.configure_sampler, [], None)
+
+        child.debug('sending request')
+        child.info('request sent')
+        core.logger.warning('still here')
+
+        self.assertEqual(stream.getvalue().splitlines(), ['request sent', 'still here'])
+        self.assertEqual(core.log_sampler.summarize(), {('botocore.endpoint', 'sending request'): 1})
+
+    def test_bad_log_format(self):
+        self.assertRaises(ValueError, LambdaCore, 'test-logging', {'LOG_FORMAT': 'nonsense'})
+
+if __name__ == '__main__':
+    unittest.main()
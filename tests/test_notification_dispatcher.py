@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import queue
+import threading
+import unittest
+from crimsoncore.notification_dispatcher import MAX_DISPATCH_ERRORS, NotificationDispatcher, build_publish_batches, collect_publish_batch_results
+
+class NotificationDispatcherTestCase(unittest.TestCase):
+    def test_flush(self):
+        dispatched = []
+        dispatcher = NotificationDispatcher(dispatched.append, max_queue_size=5, max_workers=2)
+
+        for i in range(20):
+            dispatcher.submit(i)
+
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(sorted(dispatched), list(range(20)))
+        self.assertEqual(dispatcher.pending(), 0)
+
+    def test_flush_timeout(self):
+        release = threading.Event()
+        dispatcher = NotificationDispatcher(lambda item: release.wait(), max_queue_size=5, max_workers=1)
+
+        dispatcher.submit(1)
+
+        self.assertFalse(dispatcher.flush(timeout=0.05))
+        release.set()
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+    def test_back_pressure(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def handler(item):
+            started.set()
+            release.wait()
+
+        dispatcher = NotificationDispatcher(handler, max_queue_size=1, max_workers=1)
+
+        dispatcher.submit(1)
+        started.wait(timeout=5)
+        dispatcher.submit(2)
+
+        self.assertRaises(queue.Full, dispatcher.submit, 3, timeout=0.05)
+        self.assertEqual(dispatcher.pending(), 2)
+
+        release.set()
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+    def test_errors(self):
+        def handler(item):
+            raise RuntimeError(item)
+
+        dispatcher = NotificationDispatcher(handler, max_queue_size=5, max_workers=1)
+        with self.assertLogs('crimsoncore.notification_dispatcher', level='ERROR'):
+            dispatcher.submit('boom')
+            self.assertFalse(dispatcher.flush(timeout=5))
+
+        self.assertEqual([str(error) for error in dispatcher.last_errors], ['boom'])
+        self.assertEqual(len(dispatcher.errors), 0)
+
+        # errors are reported once, by the flush that follows them
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(dispatcher.last_errors, [])
+
+    def test_errors_capped(self):
+        def handler(item):
+            raise RuntimeError(item)
+
+        dispatcher = NotificationDispatcher(handler, max_queue_size=500, max_workers=1)
+        with self.assertLogs('crimsoncore.notification_dispatcher', level='ERROR'):
+            for i in range(MAX_DISPATCH_ERRORS + 10):
+                dispatcher.submit(i)
+            self.assertFalse(dispatcher.flush(timeout=5))
+
+        self.assertEqual(len(dispatcher.last_errors), MAX_DISPATCH_ERRORS)
+        self.assertEqual(str(dispatcher.last_errors[-1]), str(MAX_DISPATCH_ERRORS + 9))
+
+    def test_batches(self):
+        batches = []
+        dispatcher = NotificationDispatcher(batches.append, max_queue_size=50, max_workers=1, batch_size=10)
+
+        for i in range(25):
+            dispatcher.submit(i)
+
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertTrue(all(isinstance(batch, list) and len(batch) <= 10 for batch in batches))
+        self.assertEqual(sorted(item for batch in batches for item in batch), list(range(25)))
+
+class BuildPublishBatchesTestCase(unittest.TestCase):
+    def test_entry_limit(self):
+        batches = build_publish_batches([str(i) for i in range(25)])
+
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+
+    def test_size_limit(self):
+        batches = build_publish_batches(['x' * 100] * 5, max_bytes=250)
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+
+    def test_oversized_message(self):
+        batches = build_publish_batches(['x', 'x' * 300, 'x'], max_bytes=250)
+
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1])
+
+    def test_empty(self):
+        self.assertEqual(build_publish_batches([]), [])
+
+class CollectPublishBatchResultsTestCase(unittest.TestCase):
+    def test_results(self):
+        results, retries = collect_publish_batch_results(['a', 'b', 'c', 'd'], {
+            'Successful': [{'Id': '0', 'MessageId': 'm0'}],
+            'Failed': [
+                {'Id': '1', 'Code': 'InternalError', 'SenderFault': False},
+                {'Id': '2', 'Code': 'InvalidParameter', 'Message': 'bad', 'SenderFault': True}
+            ]
+        })
+
+        self.assertEqual(retries, [1])
+        self.assertEqual(results[0], {'message_id': 'm0', 'error': None, 'retried': False})
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2], {'message_id': None, 'error': 'InvalidParameter: bad', 'retried': False})
+        self.assertEqual(results[3]['error'], 'PublishBatch response did not report on entry 3')
+
+if __name__ == '__main__':
+    unittest.main()
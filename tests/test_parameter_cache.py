@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from crimsoncore.parameter_cache import ParameterCache
+from tests.fakes import FakeClock
+
+class ParameterCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ParameterCache(max_entries=3, clock=self.clock)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get(('/a', False)))
+
+        self.cache.set(('/a', False), 'value', 60)
+
+        self.assertEqual(self.cache.get(('/a', False)), 'value')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_encrypted_flag_is_part_of_key(self):
+        self.cache.set(('/a', False), 'plain', 60)
+
+        self.assertIsNone(self.cache.get(('/a', True)))
+
+    def test_ttl_expiry(self):
+        self.cache.set(('/a', False), 'value', 60)
+
+        self.clock.now = 59
+        self.assertEqual(self.cache.get(('/a', False)), 'value')
+
+        self.clock.now = 60
+        self.assertIsNone(self.cache.get(('/a', False)))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_zero_ttl_not_cached(self):
+        self.cache.set(('/a', False), 'value', 0)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        for name in ('/a', '/b', '/c'):
+            self.cache.set((name, False), name, 60)
+
+        # touch /a so that /b becomes the least recently used entry
+        self.cache.get(('/a', False))
+        self.cache.set(('/d', False), '/d', 60)
+
+        self.assertIsNone(self.cache.get(('/b', False)))
+        self.assertEqual(self.cache.get(('/a', False)), '/a')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_resize(self):
+        for name in ('/a', '/b', '/c'):
+            self.cache.set((name, False), name, 60)
+
+        self.cache.resize(1)
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(('/c', False)), '/c')
+
+    def test_invalidate_name(self):
+        self.cache.set(('/a', False), 'plain', 60)
+        self.cache.set(('/a', True), 'secret', 60)
+        self.cache.set(('/b', False), 'other', 60)
+
+        self.cache.invalidate('/a')
+
+        self.assertIsNone(self.cache.get(('/a', False)))
+        self.assertIsNone(self.cache.get(('/a', True)))
+        self.assertEqual(self.cache.get(('/b', False)), 'other')
+
+    def test_metadata(self):
+        self.cache.set(('/a', False), 'value', 60, metadata=(1, None))
+        self.cache.set(('/a', False), 'value', 60)
+
+        self.assertEqual(self.cache.metadata(('/a', False)), (1, None))
+
+        self.cache.set(('/a', False), 'newer', 60, metadata=(2, None))
+        self.assertEqual(self.cache.metadata(('/a', False)), (2, None))
+
+        self.cache.invalidate('/a')
+        self.assertIsNone(self.cache.metadata(('/a', False)))
+
+    def test_metadata_expires_with_entry(self):
+        self.cache.set(('/a', False), 'value', 60, metadata=(1, None))
+        self.clock.now = 60
+
+        self.assertIsNone(self.cache.metadata(('/a', False)))
+        self.assertEqual(self.cache._metadata, {})
+
+    def test_items(self):
+        self.cache.set(('/app/a', False), 'a', 60, metadata=(1, None))
+        self.cache.set(('/app/b', True), 'b', 30)
+        self.cache.set(('/other/c', False), 'c', 60)
+        self.clock.now = 30
+
+        self.assertEqual(self.cache.items('/app/'), [(('/app/a', False), 'a', (1, None))])
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+    def test_invalidate_all(self):
+        self.cache.set(('/a', False), 'plain', 60)
+        self.cache.set(('/b', False), 'other', 60)
+
+        self.cache.invalidate()
+
+        self.assertEqual(len(self.cache), 0)
+
+class ParameterCacheStaleWhileRevalidateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ParameterCache(max_entries=10, clock=self.clock)
+
+    def _wait_for_refresh(self):
+        # wait on any in-flight background refreshes
+        if self.cache._refresh_executor is not None:
+            self.cache._refresh_executor.shutdown(wait=True)
+            self.cache._refresh_executor = None
+
+    def test_load_on_miss(self):
+        value, state = self.cache.get_or_load(('/a', False), lambda: 'loaded', 60)
+
+        self.assertEqual((value, state), ('loaded', 'miss'))
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: 'reloaded', 60), ('loaded', 'hit'))
+
+    def test_stale_served_while_refreshing(self):
+        self.cache.set(('/a', False), 'old', 60, stale_ttl=30)
+        self.clock.now = 70
+
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: 'new', 60, 30), ('old', 'stale'))
+        self._wait_for_refresh()
+
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: 'newer', 60, 30), ('new', 'hit'))
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+
+    def test_hard_ttl_forces_synchronous_refresh(self):
+        self.cache.set(('/a', False), 'old', 60, stale_ttl=30)
+        self.clock.now = 90
+
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: 'new', 60, 30), ('new', 'miss'))
+
+    def test_get_ignores_stale_entries(self):
+        self.cache.set(('/a', False), 'old', 60, stale_ttl=30)
+        self.clock.now = 70
+
+        self.assertIsNone(self.cache.get(('/a', False)))
+
+    def test_load_with_metadata(self):
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: ('loaded', (3, None)), 60, with_metadata=True), ('loaded', 'miss'))
+
+        self.assertEqual(self.cache.metadata(('/a', False)), (3, None))
+
+    def test_single_flight(self):
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            release.wait(timeout=5)
+            return 'loaded'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_load(('/a', False), loader, 60))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+
+        while ('/a', False) not in self.cache._inflight:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([value for value, _ in results], ['loaded'] * 5)
+
+    def test_background_refresh_failure_keeps_stale_value(self):
+        def loader():
+            raise RuntimeError('nope')
+
+        self.cache.set(('/a', False), 'old', 60, stale_ttl=30)
+        self.clock.now = 70
+
+        with self.assertLogs('crimsoncore.parameter_cache', level='WARNING'):
+            self.assertEqual(self.cache.get_or_load(('/a', False), loader, 60, 30), ('old', 'stale'))
+            self._wait_for_refresh()
+
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: 'new', 60, 30), ('old', 'stale'))
+
+    def test_synchronous_failure_raises(self):
+        def loader():
+            raise RuntimeError('nope')
+
+        self.assertRaises(RuntimeError, self.cache.get_or_load, ('/a', False), loader, 60)
+        self.assertEqual(self.cache.get_or_load(('/a', False), lambda: 'loaded', 60), ('loaded', 'miss'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+import unittest
+import unittest.mock
+from botocore.stub import Stubber
+from crimsoncore import LambdaCore
+from crimsoncore import rds_snapshots
+from tests.fakes import FakeClient, FakeClock, FakePaginator
+
+def fake_rds_client(rounds):
+    '''
+    Build a fake RDS client whose describe_db_snapshots calls see each of the given rounds of snapshot statuses in turn.
+    '''
+
+    def describe(Filters, **kwargs): # pylint: disable=C0103,W0613
+        statuses = rounds.pop(0)
+
+        yield {'DBSnapshots': [
+            {'DBSnapshotIdentifier': snapshot_id, 'Status': statuses[snapshot_id]} for snapshot_id in Filters[0]['Values'] if snapshot_id in statuses
+        ]}
+
+    return FakeClient({'describe_db_snapshots': FakePaginator(describe)})
+
+def described_ids(client):
+    return [request['Filters'][0]['Values'] for request in client.get_paginator('describe_db_snapshots').requests]
+
+class WaitForSnapshotsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_polls_pending_snapshots_together(self):
+        client = fake_rds_client([
+            {'a': 'creating', 'b': 'creating', 'c': 'available'},
+            {'a': 'available', 'b': 'failed'}
+        ])
+
+        with self.assertLogs('crimsoncore.rds_snapshots', level='WARNING') as logs:
+            results = rds_snapshots.wait_for_snapshots(client, ['a', 'b', 'c'], interval=10, clock=self.clock, sleep=self.clock.sleep)
+
+        self.assertEqual(logs.output, ['WARNING:crimsoncore.rds_snapshots:RDS snapshot b entered status failed'])
+        self.assertEqual(results, {'a': 'available', 'b': 'failed', 'c': 'available'})
+        self.assertEqual(described_ids(client), [['a', 'b', 'c'], ['a', 'b']])
+        self.assertEqual(self.clock.slept, [10])
+
+    def test_deleted(self):
+        client = fake_rds_client([{'a': 'deleting', 'b': 'deleting'}, {'b': 'deleting'}, {}])
+
+        results = rds_snapshots.wait_for_snapshots(client, ['a', 'b'], deleted=True, interval=10, clock=self.clock, sleep=self.clock.sleep)
+
+        self.assertEqual(results, {'a': 'deleted', 'b': 'deleted'})
+
+    def test_timeout(self):
+        client = fake_rds_client([{'a': 'creating'}] * 10)
+
+        with self.assertLogs('crimsoncore.rds_snapshots', level='WARNING'):
+            results = rds_snapshots.wait_for_snapshots(client, ['a'], interval=10, timeout=25, clock=self.clock, sleep=self.clock.sleep)
+
+        self.assertEqual(results, {'a': 'timeout'})
+        self.assertEqual(self.clock.slept, [10, 10])
+
+    def test_run_concurrently(self):
+        def fail():
+            raise RuntimeError('nope')
+
+        errors = rds_snapshots.run_concurrently([('a', lambda: None), ('b', fail)])
+
+        self.assertIsNone(errors['a'])
+        self.assertIsInstance(errors['b'], RuntimeError)
+
+class LambdaCoreRDSTestCase(unittest.TestCase):
+    def _core(self, **env):
+        core = LambdaCore('test', dict({'AWS_REGION': 'us-east-1', 'RDS_WORKERS': '1', 'RDS_POLL_INTERVAL': '0'}, **env))
+
+        self.stubber = Stubber(core.rds)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+        return core
+
+    def test_iter_snapshots(self):
+        core = self._core()
+
+        self.stubber.add_response(
+            'describe_db_snapshots',
+            {'DBSnapshots': [{'DBSnapshotIdentifier': 'snap-1'}], 'Marker': 'next'},
+            {'DBInstanceIdentifier': 'db', 'Filters': [{'Name': 'snapshot-type', 'Values': ['manual']}]}
+        )
+        self.stubber.add_response(
+            'describe_db_snapshots',
+            {'DBSnapshots': [{'DBSnapshotIdentifier': 'snap-2'}]},
+            {'DBInstanceIdentifier': 'db', 'Filters': [{'Name': 'snapshot-type', 'Values': ['manual']}], 'Marker': 'next'}
+        )
+
+        snapshots = [snapshot['DBSnapshotIdentifier'] for snapshot in core.rds_snapshots.iter_snapshots({'snapshot-type': 'manual'}, DBInstanceIdentifier='db')]
+
+        self.assertEqual(snapshots, ['snap-1', 'snap-2'])
+        self.stubber.assert_no_pending_responses()
+
+    def test_create_snapshots(self):
+        core = self._core()
+
+        self.stubber.add_response(
+            'create_db_snapshot',
+            {'DBSnapshot': {'DBSnapshotIdentifier': 'snap-a'}},
+            {'DBSnapshotIdentifier': 'snap-a', 'DBInstanceIdentifier': 'db-a', 'Tags': [{'Key': 'rotation', 'Value': 'daily'}]}
+        )
+        self.stubber.add_client_error('create_db_snapshot', service_error_code='SnapshotQuotaExceeded', service_message='quota')
+        self.stubber.add_response(
+            'describe_db_snapshots',
+            {'DBSnapshots': [{'DBSnapshotIdentifier': 'snap-a', 'Status': 'available'}]},
+            {'Filters': [{'Name': 'db-snapshot-id', 'Values': ['snap-a']}]}
+        )
+
+        with self.assertLogs('test', level='WARNING'):
+            results = core.rds_snapshots.create_snapshots({'snap-a': 'db-a', 'snap-b': 'db-b'}, tags={'rotation': 'daily'}, wait=True)
+
+        self.assertEqual(results['snap-a'], {'status': 'available', 'error': None})
+        self.assertEqual(results['snap-b']['status'], 'error')
+        self.assertIn('quota', results['snap-b']['error'])
+        self.stubber.assert_no_pending_responses()
+
+    def test_create_snapshots_no_wait_by_default(self):
+        core = self._core()
+
+        self.stubber.add_response('create_db_snapshot', {'DBSnapshot': {'DBSnapshotIdentifier': 'snap-a'}})
+
+        self.assertEqual(core.rds_snapshots.create_snapshots({'snap-a': 'db-a'}), {'snap-a': {'status': 'requested', 'error': None}})
+        self.stubber.assert_no_pending_responses()
+
+    def test_wait_capped_by_remaining_time(self):
+        core = self._core(RDS_POLL_INTERVAL='60')
+        context = unittest.mock.Mock(**{'get_remaining_time_in_millis.return_value': 30000})
+
+        self.stubber.add_response('create_db_snapshot', {'DBSnapshot': {'DBSnapshotIdentifier': 'snap-a'}})
+        self.stubber.add_response('describe_db_snapshots', {'DBSnapshots': [{'DBSnapshotIdentifier': 'snap-a', 'Status': 'creating'}]})
+
+        # one round of polling fits in the 20 seconds left before the margin, so the snapshot is handed back as still pending
+        with self.assertLogs('test', level='WARNING'):
+            results = core.rds_snapshots.create_snapshots({'snap-a': 'db-a'}, wait=True, context=context)
+
+        self.assertEqual(results, {'snap-a': {'status': 'timeout', 'error': None}})
+        self.stubber.assert_no_pending_responses()
+
+    def test_copy_snapshots_cross_region(self):
+        core = self._core()
+        source = 'arn:aws:rds:us-east-1:123456789012:snapshot:snap-a'
+
+        destination = core._get_client('rds', region_name='us-west-2')
+        with Stubber(destination) as destination_stubber:
+            destination_stubber.add_response(
+                'copy_db_snapshot',
+                {'DBSnapshot': {'DBSnapshotIdentifier': 'snap-a-copy'}},
+                {'SourceDBSnapshotIdentifier': source, 'TargetDBSnapshotIdentifier': 'snap-a-copy', 'CopyTags': True, 'SourceRegion': 'us-east-1'}
+            )
+
+            results = core.rds_snapshots.copy_snapshots({'snap-a-copy': source}, destination_region='us-west-2', wait=False)
+
+            destination_stubber.assert_no_pending_responses()
+
+        self.assertEqual(results, {'snap-a-copy': {'status': 'requested', 'error': None}})
+
+    def test_delete_snapshots_safe_mode(self):
+        core = self._core(SAFE_MODE='on')
+
+        results = core.rds_snapshots.delete_snapshots(['snap-a', 'snap-b'], wait=True)
+
+        self.assertEqual({result['status'] for result in results.values()}, {'skipped'})
+        self.stubber.assert_no_pending_responses()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import unittest
+from botocore.stub import Stubber
+from crimsoncore import LambdaCore
+from crimsoncore import s3_bulk
+from tests.fakes import FakeS3Client
+
+class S3BulkTestCase(unittest.TestCase):
+    def test_iter_objects_shards(self):
+        keys = [f'{shard}/{i}' for shard in 'abcd' for i in range(10)]
+        client = FakeS3Client(keys=keys)
+
+        listed = [obj['Key'] for obj in s3_bulk.iter_objects(client, 'bucket', shards=['a/', 'b/', 'c/', 'd/'], concurrency=4)]
+
+        self.assertEqual(sorted(listed), sorted(keys))
+
+    def test_iter_objects_closed_early(self):
+        client = FakeS3Client(keys=[f'{shard}/{i}' for shard in 'abcd' for i in range(100)])
+
+        objects = s3_bulk.iter_objects(client, 'bucket', shards=['a/', 'b/', 'c/', 'd/'], concurrency=4)
+        self.assertEqual(len([obj for obj, _ in zip(objects, range(5))]), 5)
+        objects.close()
+
+    def test_delete_objects_batches(self):
+        client = FakeS3Client()
+        objects = [f'key{i}' for i in range(2500)]
+
+        result = s3_bulk.delete_objects(client, 'bucket', iter(objects), concurrency=3)
+
+        self.assertEqual(result, {'deleted': 2500, 'errors': []})
+        self.assertEqual(sorted(len(batch) for batch in client.deleted), [500, 1000, 1000])
+        self.assertEqual(sorted(key for batch in client.deleted for key in batch), sorted(objects))
+
+    def test_delete_objects_dry_run(self):
+        client = FakeS3Client()
+
+        result = s3_bulk.delete_objects(client, 'bucket', [{'Key': 'a'}, {'Key': 'b', 'VersionId': '1'}], dry_run=True)
+
+        self.assertEqual(result['deleted'], 2)
+        self.assertEqual(client.deleted, [])
+
+class LambdaCoreS3BulkTestCase(unittest.TestCase):
+    def _core(self, **env):
+        core = LambdaCore('test', dict({
+            'AWS_REGION': 'us-east-1',
+            'GLOBAL_PREFIX': 'test',
+            'APPLICATION_NAME': 'myappname',
+            'S3_BULK_WORKERS': '1'
+        }, **env))
+
+        self.stubber = Stubber(core.s3)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+        return core
+
+    def test_iter_objects_delimiter(self):
+        core = self._core()
+
+        self.stubber.add_response(
+            'list_objects_v2',
+            {'Contents': [{'Key': 'logs/top'}], 'CommonPrefixes': [{'Prefix': 'logs/a/'}, {'Prefix': 'logs/b/'}]},
+            {'Bucket': 'test-myappname-bucket', 'Prefix': 'logs/', 'Delimiter': '/'}
+        )
+        self.stubber.add_response(
+            'list_objects_v2',
+            {'Contents': [{'Key': 'logs/a/1'}], 'IsTruncated': True, 'NextContinuationToken': 'next'},
+            {'Bucket': 'test-myappname-bucket', 'Prefix': 'logs/a/'}
+        )
+        self.stubber.add_response(
+            'list_objects_v2',
+            {'Contents': [{'Key': 'logs/a/2'}]},
+            {'Bucket': 'test-myappname-bucket', 'Prefix': 'logs/a/', 'ContinuationToken': 'next'}
+        )
+        self.stubber.add_response(
+            'list_objects_v2',
+            {'Contents': [{'Key': 'logs/b/1'}]},
+            {'Bucket': 'test-myappname-bucket', 'Prefix': 'logs/b/'}
+        )
+
+        keys = [obj['Key'] for obj in core.s3_bulk.iter_objects('bucket', 'logs/', delimiter='/')]
+
+        self.assertEqual(keys, ['logs/top', 'logs/a/1', 'logs/a/2', 'logs/b/1'])
+        self.stubber.assert_no_pending_responses()
+
+    def test_delete_prefix(self):
+        core = self._core()
+
+        self.stubber.add_response(
+            'list_objects_v2',
+            {'Contents': [{'Key': 'old/1'}, {'Key': 'old/2'}]},
+            {'Bucket': 'test-myappname-bucket', 'Prefix': 'old/'}
+        )
+        self.stubber.add_response(
+            'delete_objects',
+            {'Errors': [{'Key': 'old/2', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]},
+            {'Bucket': 'test-myappname-bucket', 'Delete': {'Objects': [{'Key': 'old/1'}, {'Key': 'old/2'}], 'Quiet': True}}
+        )
+
+        with self.assertLogs('test', level='WARNING'):
+            result = core.s3_bulk.delete_prefix('bucket', 'old/')
+
+        self.assertEqual(result['deleted'], 1)
+        self.assertEqual([error['Key'] for error in result['errors']], ['old/2'])
+        self.stubber.assert_no_pending_responses()
+
+    def test_delete_objects_safe_mode(self):
+        core = self._core(SAFE_MODE='on')
+
+        result = core.s3_bulk.delete_objects('bucket', ['a', 'b', 'c'])
+
+        self.assertEqual(result, {'deleted': 3, 'errors': []})
+        self.stubber.assert_no_pending_responses()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+import io
+import unittest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+from crimsoncore import LambdaCore
+from crimsoncore import s3_transfer
+from tests.fakes import FakeS3Client, streaming_body
+
+class S3TransferTestCase(unittest.TestCase):
+    def test_iter_object_concurrent(self):
+        data = bytes(range(256)) * 40
+        client = FakeS3Client(data)
+
+        chunks = list(s3_transfer.iter_object(client, 'bucket', 'key', 1000, concurrency=4))
+
+        self.assertTrue(all(isinstance(chunk, memoryview) for chunk in chunks))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000] * 10 + [240])
+        self.assertEqual(b''.join(chunks), data)
+        self.assertEqual(sorted(client.ranges)[-1], (10000, 10239))
+
+    def test_download_object_empty(self):
+        output = io.BytesIO()
+
+        self.assertEqual(s3_transfer.download_object(FakeS3Client(b''), 'bucket', 'key', output, 1000), 0)
+        self.assertEqual(output.getvalue(), b'')
+
+    def test_read_part(self):
+        part = s3_transfer._read_part(io.BytesIO(b'abcdef'), 4)
+
+        self.assertEqual(part, b'abcd')
+        self.assertEqual(s3_transfer._read_part(io.BytesIO(b'ab'), 4), b'ab')
+
+class LambdaCoreS3TransferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.core = LambdaCore('test', {
+            'AWS_REGION': 'us-east-1',
+            'GLOBAL_PREFIX': 'test',
+            'APPLICATION_NAME': 'myappname',
+            'S3_TRANSFER_CONCURRENCY': '1'
+        })
+
+        self.stubber = Stubber(self.core.s3)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_download_object(self):
+        part_size = 4
+        data = b'0123456789'
+
+        self.stubber.add_response(
+            'head_object',
+            {'ContentLength': len(data), 'ETag': '"etag"'},
+            {'Bucket': 'test-myappname-bucket', 'Key': 'key'}
+        )
+        for start in range(0, len(data), part_size):
+            end = min(start + part_size, len(data)) - 1
+            self.stubber.add_response(
+                'get_object',
+                {'Body': streaming_body(data[start:end + 1])},
+                {'Bucket': 'test-myappname-bucket', 'Key': 'key', 'Range': f'bytes={start}-{end}', 'IfMatch': '"etag"'}
+            )
+
+        output = io.BytesIO()
+        self.assertEqual(self.core.s3_transfer.download_object('bucket', 'key', output, part_size=part_size), len(data))
+
+        self.assertEqual(output.getvalue(), data)
+        self.stubber.assert_no_pending_responses()
+
+    def test_download_object_incomplete(self):
+        self.stubber.add_response('head_object', {'ContentLength': 4, 'ETag': '"etag"'})
+        self.stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(b'01'), None)})
+
+        self.assertRaises(IOError, self.core.s3_transfer.download_object, 'bucket', 'key', io.BytesIO(), part_size=4)
+
+    def test_upload_object_small(self):
+        self.stubber.add_response(
+            'put_object',
+            {'ETag': '"small"'},
+            {'Bucket': 'test-myappname-bucket', 'Key': 'key', 'Body': ANY, 'ContentType': 'text/plain'}
+        )
+
+        self.assertEqual(self.core.s3_transfer.upload_object('bucket', 'key', io.BytesIO(b'hello'), ContentType='text/plain'), '"small"')
+        self.stubber.assert_no_pending_responses()
+
+    def test_upload_object_multipart(self):
+        part_size = s3_transfer.MULTIPART_MIN_PART_SIZE
+        data = b'x' * (part_size * 2 + 3)
+
+        self.stubber.add_response(
+            'create_multipart_upload',
+            {'UploadId': 'upload'},
+            {'Bucket': 'test-myappname-bucket', 'Key': 'key'}
+        )
+        for part_number in (1, 2, 3):
+            self.stubber.add_response(
+                'upload_part',
+                {'ETag': f'"part{part_number}"'},
+                {'Bucket': 'test-myappname-bucket', 'Key': 'key', 'UploadId': 'upload', 'PartNumber': part_number, 'Body': ANY}
+            )
+        self.stubber.add_response(
+            'complete_multipart_upload',
+            {'ETag': '"multipart"'},
+            {
+                'Bucket': 'test-myappname-bucket',
+                'Key': 'key',
+                'UploadId': 'upload',
+                'MultipartUpload': {'Parts': [{'PartNumber': part_number, 'ETag': f'"part{part_number}"'} for part_number in (1, 2, 3)]}
+            }
+        )
+
+        self.assertEqual(self.core.s3_transfer.upload_object('bucket', 'key', io.BytesIO(data), part_size=part_size), '"multipart"')
+        self.stubber.assert_no_pending_responses()
+
+    def test_upload_object_multipart_sse_c(self):
+        part_size = s3_transfer.MULTIPART_MIN_PART_SIZE
+        sse_args = {'SSECustomerAlgorithm': 'AES256', 'SSECustomerKey': 'k' * 32, 'RequestPayer': 'requester'}
+
+        self.stubber.add_response(
+            'create_multipart_upload',
+            {'UploadId': 'upload'},
+            dict(sse_args, Bucket='test-myappname-bucket', Key='key', ContentType='text/plain')
+        )
+        for part_number in (1, 2):
+            self.stubber.add_response(
+                'upload_part',
+                {'ETag': f'"part{part_number}"'},
+                dict(sse_args, Bucket='test-myappname-bucket', Key='key', UploadId='upload', PartNumber=part_number, Body=ANY)
+            )
+        self.stubber.add_response(
+            'complete_multipart_upload',
+            {'ETag': '"multipart"'},
+            dict(sse_args, Bucket='test-myappname-bucket', Key='key', UploadId='upload', MultipartUpload=ANY)
+        )
+
+        self.assertEqual(self.core.s3_transfer.upload_object('bucket', 'key', io.BytesIO(b'x' * (part_size * 2)), part_size=part_size, ContentType='text/plain', **sse_args), '"multipart"')
+        self.stubber.assert_no_pending_responses()
+
+    def test_upload_object_multipart_checksum(self):
+        part_size = s3_transfer.MULTIPART_MIN_PART_SIZE
+
+        self.stubber.add_response(
+            'create_multipart_upload',
+            {'UploadId': 'upload'},
+            {'Bucket': 'test-myappname-bucket', 'Key': 'key', 'ChecksumAlgorithm': 'SHA256'}
+        )
+        for part_number in (1, 2):
+            self.stubber.add_response(
+                'upload_part',
+                {'ETag': f'"part{part_number}"', 'ChecksumSHA256': f'checksum{part_number}'},
+                {'Bucket': 'test-myappname-bucket', 'Key': 'key', 'UploadId': 'upload', 'PartNumber': part_number, 'Body': ANY, 'ChecksumAlgorithm': 'SHA256'}
+            )
+        self.stubber.add_response(
+            'complete_multipart_upload',
+            {'ETag': '"multipart"'},
+            {
+                'Bucket': 'test-myappname-bucket',
+                'Key': 'key',
+                'UploadId': 'upload',
+                'MultipartUpload': {'Parts': [
+                    {'PartNumber': part_number, 'ETag': f'"part{part_number}"', 'ChecksumSHA256': f'checksum{part_number}'} for part_number in (1, 2)
+                ]}
+            }
+        )
+
+        self.assertEqual(self.core.s3_transfer.upload_object('bucket', 'key', io.BytesIO(b'x' * (part_size * 2)), part_size=part_size, ChecksumAlgorithm='SHA256'), '"multipart"')
+        self.stubber.assert_no_pending_responses()
+
+    def test_upload_object_multipart_aborted(self):
+        part_size = s3_transfer.MULTIPART_MIN_PART_SIZE
+
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'upload'})
+        self.stubber.add_client_error('upload_part', service_error_code='InternalError', http_status_code=500)
+        self.stubber.add_response(
+            'abort_multipart_upload',
+            {},
+            {'Bucket': 'test-myappname-bucket', 'Key': 'key', 'UploadId': 'upload'}
+        )
+
+        self.assertRaises(Exception, self.core.s3_transfer.upload_object, 'bucket', 'key', io.BytesIO(b'x' * (part_size * 2)), part_size=part_size)
+        self.stubber.assert_no_pending_responses()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import unittest
+from crimsoncore.throttling import TokenBucket, backoff_delay
+from tests.fakes import FakeClock
+
+class TokenBucketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_unlimited(self):
+        bucket = TokenBucket(clock=self.clock, sleep=self.clock.sleep)
+
+        for _ in range(100):
+            self.assertEqual(bucket.acquire(), 0)
+
+        self.assertEqual(self.clock.slept, [])
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=10, burst=5, clock=self.clock, sleep=self.clock.sleep)
+
+        for _ in range(5):
+            self.assertEqual(bucket.acquire(), 0)
+
+        self.assertAlmostEqual(bucket.acquire(), 0.1)
+        self.assertAlmostEqual(bucket.acquire(), 0.1)
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=10, burst=5, clock=self.clock, sleep=self.clock.sleep)
+
+        for _ in range(5):
+            bucket.acquire()
+
+        self.assertFalse(bucket.try_acquire())
+        self.clock.now += 0.2
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_refill_capped_at_burst(self):
+        bucket = TokenBucket(rate=10, burst=2, clock=self.clock, sleep=self.clock.sleep)
+        self.clock.now += 100
+
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_default_burst(self):
+        bucket = TokenBucket(rate=3, clock=self.clock, sleep=self.clock.sleep)
+
+        self.assertEqual(bucket.burst, 3)
+
+    def test_reconfigure_same_values_keeps_state(self):
+        bucket = TokenBucket(rate=10, burst=2, clock=self.clock, sleep=self.clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+
+        bucket.configure(10, 2)
+
+        self.assertFalse(bucket.try_acquire())
+
+class BackoffDelayTestCase(unittest.TestCase):
+    def test_exponential(self):
+        self.assertEqual([backoff_delay(attempt, base=0.1, cap=1, rand=lambda: 1) for attempt in range(6)], [0.1, 0.2, 0.4, 0.8, 1, 1])
+
+    def test_jitter(self):
+        self.assertEqual(backoff_delay(3, base=1, rand=lambda: 0.5), 4)
+
+        for _ in range(100):
+            self.assertTrue(0 <= backoff_delay(2, base=1) <= 4)
+
+if __name__ == '__main__':
+    unittest.main()